@@ -0,0 +1,148 @@
+# apps/forms_builder/activity.py
+from heapq import merge
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ActivityFeedEntry
+
+User = get_user_model()
+
+# Share of writes after which a feed is trimmed; feeds may briefly exceed the cap in between
+TRIM_PROBABILITY = 0.1
+
+
+def get_feed_max_entries():
+    return getattr(settings, 'ACTIVITY_FEED_MAX_ENTRIES', 200)
+
+
+def get_fanout_limit():
+    """Groups and roles with more members than this are pulled on read instead of fanned out"""
+    return getattr(settings, 'ACTIVITY_FEED_FANOUT_LIMIT', 500)
+
+
+def publish_activity(activity_type, title, description='', icon='document', link='',
+                     actor=None, user_ids=(), group_ids=(), roles=()):
+    """
+    Queue an activity for the feeds of the given users, groups and roles.
+    The fan-out runs in a Celery task once the current transaction commits.
+    """
+    from .tasks import fan_out_activity
+
+    activity = {
+        'activity_type': activity_type,
+        'title': title[:300],
+        'description': description[:300],
+        'icon': icon,
+        'link': link,
+        'actor_id': str(actor.id) if actor else None,
+        'created_at': timezone.now().isoformat(),
+    }
+    user_ids = sorted({str(user_id) for user_id in user_ids if user_id})
+    group_ids = sorted({int(group_id) for group_id in group_ids if group_id})
+    roles = sorted({role for role in roles if role})
+
+    transaction.on_commit(
+        lambda: fan_out_activity.delay(activity, user_ids, group_ids, roles)
+    )
+
+
+def publish_submission_activity(submission):
+    """Feed entry for a new submission, for its submitter and assignee"""
+    publish_activity(
+        'submission',
+        title=f"{submission.submitted_by.get_full_name()} submitted {submission.form.name}",
+        description=f"Status: {submission.status}",
+        icon='document',
+        link=f"/submissions/{submission.id}",
+        actor=submission.submitted_by,
+        user_ids=[submission.submitted_by_id, submission.assigned_to_id]
+    )
+
+
+def write_activity(activity, user_ids, group_ids, roles):
+    """
+    Write an activity to the recipients' feeds and trim them.
+    Members of small groups and roles get their own copy; large ones get a single
+    shared entry that get_feed pulls for their members.
+    """
+    fanout_limit = get_fanout_limit()
+    recipients = set(user_ids)
+    shared = []
+
+    if group_ids:
+        sizes = dict(
+            User.objects.filter(groups__id__in=group_ids, is_active=True)
+            .values_list('groups__id').annotate(count=Count('id')).order_by()
+        )
+        for group_id in group_ids:
+            if sizes.get(group_id, 0) > fanout_limit:
+                shared.append({'group_id': group_id})
+            else:
+                recipients.update(
+                    str(user_id) for user_id in
+                    User.objects.filter(groups__id=group_id, is_active=True).values_list('id', flat=True)
+                )
+
+    for role in roles:
+        members = list(User.objects.filter(role=role, is_active=True).values_list('id', flat=True)[:fanout_limit + 1])
+        if len(members) > fanout_limit:
+            shared.append({'role': role})
+        else:
+            recipients.update(str(user_id) for user_id in members)
+
+    ActivityFeedEntry.objects.bulk_create(
+        [ActivityFeedEntry(user_id=user_id, **activity) for user_id in sorted(recipients)] +
+        [ActivityFeedEntry(**target, **activity) for target in shared],
+        batch_size=500
+    )
+
+    for user_id in recipients:
+        if random.random() < TRIM_PROBABILITY:
+            trim_feed(user_id=user_id)
+    for target in shared:
+        trim_feed(**target)
+
+    return len(recipients) + len(shared)
+
+
+def trim_feed(**target):
+    """Delete everything past the newest ACTIVITY_FEED_MAX_ENTRIES entries of a feed"""
+    max_entries = get_feed_max_entries()
+    entries = ActivityFeedEntry.objects.filter(**target)
+    cutoff = entries.order_by('-created_at', '-id').values_list('created_at', 'id')[max_entries:max_entries + 1]
+    cutoff = list(cutoff)
+    if cutoff:
+        created_at, entry_id = cutoff[0]
+        entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=entry_id)).delete()
+
+
+def get_feed(user, limit=20, activity_type=None):
+    """
+    Newest feed entries of a user: the user's own feed plus the shared feeds of
+    large groups and roles the user belongs to, merged by time.
+    """
+    def fetch(**target):
+        entries = ActivityFeedEntry.objects.filter(**target).select_related('actor')
+        if activity_type:
+            entries = entries.filter(activity_type=activity_type)
+        return list(entries.order_by('-created_at', '-id')[:limit])
+
+    feeds = [fetch(user=user)]
+
+    # Shared entries only exist for groups and roles above the fan-out limit
+    group_ids = list(user.groups.values_list('id', flat=True))
+    if group_ids:
+        feeds.append(fetch(group_id__in=group_ids))
+    if getattr(user, 'role', None):
+        feeds.append(fetch(role=user.role))
+
+    if len(feeds) == 1:
+        return feeds[0]
+
+    merged = merge(*feeds, key=lambda entry: (entry.created_at, entry.id), reverse=True)
+    return [entry for _, entry in zip(range(limit), merged)]
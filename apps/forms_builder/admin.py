@@ -23,7 +23,7 @@ class FormFieldInline(nested_admin.NestedStackedInline):
     inlines = [FormValidationRuleInline, FormFieldPermissionInline]
     fieldsets = (
         ('Basic Information', {
-            'fields': ('field_type', 'label', 'name', 'order', 'required')
+            'fields': ('field_type', 'label', 'name', 'order', 'required', 'indexed')
         }),
         ('Field Configuration', {
             'fields': ('placeholder', 'help_text', 'default_value', 'width', 'css_class'),
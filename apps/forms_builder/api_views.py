@@ -4,23 +4,42 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db import transaction, IntegrityError
 from django.db.models import Q, Count
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import FormTemplate, FormField, FormSubmission, FormFile
+from .models import FormTemplate, FormField, FormSubmission, FormFile, UploadSession, ArchivedSubmission
 from .serializers import (
     FormTemplateSerializer, FormFieldSerializer, 
-    FormSubmissionSerializer, FormSubmitSerializer
+    FormSubmissionSerializer, FormSubmitSerializer, ArchivedSubmissionSerializer,
+    UploadSessionSerializer, UploadSessionCreateSerializer
 )
-from apps.workflow.utils import trigger_workflow
+from .activity import publish_submission_activity, get_feed
+from .idempotency import (get_idempotency_key, request_fingerprint, get_stored_response, store_response,
+                          idempotency_lock, wait_for_response, InvalidIdempotencyKey)
+from .uploads import (create_upload_session, write_chunk, finalize_upload, discard_upload,
+                      UploadError, UploadOffsetMismatch, UploadInProgress)
+from .blobs import attach_file
+from .projections import parse_field_filters, apply_field_filters, FieldFilterError
+from .search import parse_query, search_submissions, get_searchable_fields, get_highlights
+from .permissions import accessible_submissions_filter
+from .processing import queue_file_processing
+from apps.workflow.models import WorkflowInstance
+from apps.workflow.utils import trigger_workflow, get_inbox
 
 
 class FormListAPI(generics.ListCreateAPIView):
     """List and create forms"""
     serializer_class = FormTemplateSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PageNumberPagination  # Arbitrary ?sort= orderings cannot be keyset-paginated
     
     def get_queryset(self):
         queryset = FormTemplate.objects.filter(is_active=True)
@@ -69,7 +88,11 @@ class FormDetailAPI(generics.RetrieveUpdateDestroyAPIView):
 
 
 class FormSubmitAPI(APIView):
-    """Submit a form"""
+    """
+    Submit a form. Clients may send an Idempotency-Key header; retries with the
+    same key replay the original response instead of submitting again. Reusing a
+    key for a different body or form is answered with 422.
+    """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, form_id):
@@ -82,48 +105,309 @@ class FormSubmitAPI(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        try:
+            idempotency_key = get_idempotency_key(request)
+        except InvalidIdempotencyKey as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if idempotency_key is None:
+            return self.submit(request, form_template)
+        
+        fingerprint = request_fingerprint(request, form_template.id)
+        stored = get_stored_response(request.user, idempotency_key)
+        if stored is None:
+            with idempotency_lock(request.user, idempotency_key) as acquired:
+                if acquired:
+                    # The previous holder may have finished just before we got the lock
+                    stored = get_stored_response(request.user, idempotency_key)
+                    if stored is None:
+                        return self.submit(request, form_template, idempotency_key, fingerprint)
+            
+            if stored is None:
+                # A request with the same key is in flight; collapse onto its response
+                stored = wait_for_response(request.user, idempotency_key)
+                if stored is None:
+                    return Response({
+                        'success': False,
+                        'error': 'A request with this Idempotency-Key is still being processed'
+                    }, status=status.HTTP_409_CONFLICT)
+        
+        return self.replay(stored, fingerprint)
+    
+    def replay(self, stored, fingerprint):
+        response_status, response_body, stored_fingerprint = stored
+        if stored_fingerprint and stored_fingerprint != fingerprint:
+            return Response({
+                'success': False,
+                'error': 'This Idempotency-Key was already used for a different request'
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(response_body, status=response_status, headers={'Idempotent-Replayed': 'true'})
+    
+    def submit(self, request, form_template, idempotency_key=None, fingerprint=''):
         serializer = FormSubmitSerializer(
             data=request.data,
             context={'form': form_template, 'request': request}
         )
         
-        if serializer.is_valid():
-            submission = serializer.save()
-            
-            # Handle file uploads
-            for field_name, file in request.FILES.items():
-                FormFile.objects.create(
-                    submission=submission,
-                    field_name=field_name,
-                    file=file
-                )
-            
-            # Trigger workflow
-            workflow_instance = trigger_workflow(submission)
-            
+        if not serializer.is_valid():
             return Response({
-                'success': True,
-                'submission_id': str(submission.id),
-                'message': 'Form submitted successfully'
-            }, status=status.HTTP_201_CREATED)
-        
-        return Response({
-            'success': False,
-            'errors': serializer.errors
-        }, status=status.HTTP_400_BAD_REQUEST)
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            with transaction.atomic():
+                submission = serializer.save()
+                
+                # Handle file uploads
+                for field_name, file in request.FILES.items():
+                    attach_file(submission, field_name, file)
+                queue_file_processing(submission)
+                
+                response_body = {
+                    'success': True,
+                    'submission_id': str(submission.id),
+                    'message': 'Form submitted successfully'
+                }
+                if idempotency_key:
+                    store_response(request.user, idempotency_key, fingerprint, submission,
+                                   status.HTTP_201_CREATED, response_body)
+        except IntegrityError:
+            # A concurrent duplicate committed first; everything above was rolled back
+            stored = get_stored_response(request.user, idempotency_key) if idempotency_key else None
+            if stored is None:
+                raise
+            return self.replay(stored, fingerprint)
+        
+        # Trigger workflow
+        workflow_instance = trigger_workflow(submission)
+        publish_submission_activity(submission)
+        
+        return Response(response_body, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionCreateAPI(APIView):
+    """
+    Start a chunked upload. The client then PUTs chunks to the returned url with an
+    Upload-Offset header, finalizes it, and submits the upload id as the field value.
+    With the sha256 of content the user already holds, the upload comes back complete.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        form_template = get_object_or_404(FormTemplate, id=serializer.validated_data['form'], is_active=True)
+        if not request.user.has_perm('view_formtemplate', form_template):
+            return Response(
+                {'error': 'You do not have permission to submit this form'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            session = create_upload_session(
+                request.user,
+                form_template,
+                serializer.validated_data['field_name'],
+                serializer.validated_data['filename'],
+                serializer.validated_data['size'],
+                serializer.validated_data.get('content_type', ''),
+                sha256=serializer.validated_data.get('sha256')
+            )
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(
+            UploadSessionSerializer(session, context={'request': request}).data,
+            status=status.HTTP_201_CREATED,
+            headers={'Location': reverse('api_upload_session', args=[session.id])}
+        )
+
+
+class UploadSessionAPI(APIView):
+    """
+    HEAD or GET reports how far an upload got; PUT appends a chunk at Upload-Offset
+    (optionally with an Upload-Checksum SHA-256 hex digest); DELETE abandons it.
+    The request body is streamed to disk rather than parsed.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get_session(self, request, upload_id):
+        return get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    
+    def offset_headers(self, session):
+        return {
+            'Upload-Offset': str(session.received),
+            'Upload-Length': str(session.size),
+            'Cache-Control': 'no-store',
+        }
+    
+    def head(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        return Response(status=status.HTTP_200_OK, headers=self.offset_headers(session))
+    
+    def get(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        return Response(
+            UploadSessionSerializer(session, context={'request': request}).data,
+            headers=self.offset_headers(session)
+        )
+    
+    def put(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            write_chunk(session, offset, request.stream, length,
+                        checksum=request.headers.get('Upload-Checksum'))
+        except UploadOffsetMismatch as e:
+            return Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT,
+                            headers={'Upload-Offset': str(e.offset)})
+        except UploadInProgress as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST,
+                            headers=self.offset_headers(session))
+        
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=self.offset_headers(session))
+    
+    def delete(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        discard_upload(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadFinalizeAPI(APIView):
+    """Complete an upload once every byte arrived; optionally verify a client-side sha256"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request, upload_id):
+        session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+        
+        try:
+            session = finalize_upload(session, sha256=request.data.get('sha256'))
+        except UploadInProgress as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(UploadSessionSerializer(session, context={'request': request}).data)
+
+
+class FormSubmissionListAPI(generics.ListAPIView):
+    """
+    Submissions of a form, newest first. Filters on indexed fields read the
+    SubmissionFieldValue indexes: ?field.<name>=value, with __gt, __gte, __lt,
+    __lte or __in (comma-separated) after the name.
+    """
+    serializer_class = FormSubmissionSerializer
+    permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-submitted_at', '-id')
+    
+    def get_queryset(self):
+        form = get_object_or_404(FormTemplate, id=self.kwargs['form_id'])
+        user = self.request.user
+        queryset = FormSubmission.objects.filter(form=form).select_related('form', 'submitted_by', 'assigned_to')
+        if not (user.is_superuser or user == form.created_by or
+                user.has_perm('forms_builder.view_formsubmission')):
+            queryset = queryset.filter(Q(submitted_by=user) | Q(assigned_to=user))
+        
+        try:
+            filters = parse_field_filters(form, self.request.query_params)
+        except FieldFilterError as e:
+            raise ValidationError({'filters': str(e)})
+        return apply_field_filters(queryset, filters)
 
 
 class SubmissionDetailAPI(generics.RetrieveAPIView):
-    """Get submission details"""
+    """Get submission details; archived submissions are read from the archive"""
     serializer_class = FormSubmissionSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
+    lookup_url_kwarg = 'submission_id'
     
     def get_queryset(self):
         return FormSubmission.objects.filter(
             Q(submitted_by=self.request.user) |
             Q(assigned_to=self.request.user)
         ).distinct()
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archive = get_object_or_404(
+                ArchivedSubmission.objects.filter(Q(submitted_by=request.user) | Q(assigned_to=request.user)),
+                id=kwargs['submission_id']
+            )
+            return Response(ArchivedSubmissionSerializer(archive, context=self.get_serializer_context()).data)
+
+
+class SubmissionSearchAPI(APIView):
+    """
+    Full-text search over submission answers: ?q=words (all must occur), best
+    BM25 matches first with highlighted excerpts. Only submissions the caller may
+    access are searched; scope=inbox narrows to their open approvals, form=<id>
+    to one form.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        terms = parse_query(request.query_params.get('q', ''))
+        if not terms:
+            return Response({'terms': [], 'results': []})
+    
+        try:
+            limit = int(request.query_params.get('limit', settings.SEARCH_RESULTS_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number'})
+    
+        user = request.user
+        if request.query_params.get('scope') == 'inbox':
+            scope = Q(id__in=WorkflowInstance.objects.filter(
+                id__in=get_inbox(user).values('instance_id')
+            ).values('submission_id'))
+        else:
+            scope = accessible_submissions_filter(user)
+    
+        form_id = request.query_params.get('form')
+        if form_id:
+            form_id = get_object_or_404(FormTemplate, id=form_id).id
+    
+        ranked = search_submissions(' '.join(terms), scope=scope, form_id=form_id, limit=max(limit, 1))
+        submissions = FormSubmission.objects.select_related('form', 'submitted_by').in_bulk(
+            [submission_id for submission_id, _ in ranked]
+        )
+    
+        fields_by_form = {}
+        results = []
+        for submission_id, score in ranked:
+            submission = submissions.get(submission_id)
+            if submission is None:
+                continue  # Deleted since it was indexed
+            if submission.form_id not in fields_by_form:
+                fields_by_form[submission.form_id] = get_searchable_fields(submission.form_id)
+            results.append({
+                'id': submission.id,
+                'form': {'id': str(submission.form_id), 'name': submission.form.name},
+                'submitted_by': submission.submitted_by.get_full_name() or submission.submitted_by.username,
+                'submitted_at': submission.submitted_at,
+                'status': submission.status,
+                'score': round(score, 4),
+                'highlights': get_highlights(submission, fields_by_form[submission.form_id], terms),
+                'url': reverse('api_submission_detail', args=[submission.id]),
+            })
+    
+        return Response({'terms': terms, 'results': results})
 
 
 class DashboardStatsAPI(APIView):
@@ -187,21 +471,17 @@ class RecentActivityAPI(APIView):
     def get(self, request):
         user = request.user
         
-        # Get recent submissions
-        recent_submissions = FormSubmission.objects.filter(
-            Q(submitted_by=user) | Q(assigned_to=user)
-        ).select_related('form', 'submitted_by').order_by('-submitted_at')[:10]
-        
+        # Precomputed feed, written when submissions and workflow events happen
         activities = []
-        for submission in recent_submissions:
+        for entry in get_feed(user, limit=10):
             activities.append({
-                'id': str(submission.id),
-                'type': 'submission',
-                'title': f"{submission.submitted_by.get_full_name()} submitted {submission.form.name}",
-                'description': f"Status: {submission.status}",
-                'timestamp': submission.submitted_at,
-                'icon': 'document',
-                'link': f"/submissions/{submission.id}"
+                'id': str(entry.id),
+                'type': entry.activity_type,
+                'title': entry.title,
+                'description': entry.description,
+                'timestamp': entry.created_at,
+                'icon': entry.icon,
+                'link': entry.link
             })
         
         return Response(activities)
@@ -0,0 +1,195 @@
+# apps/forms_builder/archive.py
+from collections import defaultdict
+from datetime import timedelta
+import json
+import logging
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import ArchivedFile, ArchivedSubmission, FileBlob, FormFile, FormSubmission, JobWatermark
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT_VERSION = 1
+WATERMARK_NAME = 'archive_submissions'
+
+HISTORY_FIELDS = [
+    'id', 'step_id', 'step__name', 'action_id', 'action__name', 'action__action_type',
+    'actor_id', 'actor__username', 'timestamp', 'comment',
+    'snapshot', 'before_patch', 'data_patch', 'data_before', 'data_after',
+]
+WORK_ITEM_FIELDS = ['step_id', 'assignee_type', 'assignee_id', 'status', 'created_at', 'completed_at']
+VOTE_FIELDS = ['step_id', 'approver_id', 'decision', 'comment', 'created_at']
+INTERVAL_FIELDS = ['step_id', 'step__name', 'entered_at', 'exited_at', 'actor_id', 'outcome']
+
+
+def encode_document(document):
+    text = json.dumps(document, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return zlib.compress(text.encode('utf-8'), settings.ARCHIVE_COMPRESSION_LEVEL)
+
+
+def decode_document(payload):
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def get_document(archive):
+    """The decompressed document of an archived submission, decoded once per instance"""
+    if '_document' not in archive.__dict__:
+        archive.__dict__['_document'] = decode_document(archive.payload)
+    return archive.__dict__['_document']
+
+
+def archivable_submissions(cutoff):
+    """Submissions in a terminal state whose workflow (or, without one, submission) ended before cutoff"""
+    return FormSubmission.objects.filter(status__in=settings.ARCHIVE_STATUSES).filter(
+        Q(workflow_instance__is_active=False, workflow_instance__completed_at__lt=cutoff) |
+        Q(workflow_instance__isnull=True, submitted_at__lt=cutoff)
+    )
+
+
+def _workflow_documents(submissions):
+    """Workflow instance of each submission id with its history, work items, votes and intervals"""
+    from apps.workflow.models import WorkflowInstance, WorkflowHistory, WorkItem, ApprovalVote, StepInterval
+
+    instances = {
+        instance.id: instance for instance in
+        WorkflowInstance.objects.filter(submission__in=submissions).select_related('workflow', 'current_step')
+    }
+    related = defaultdict(lambda: defaultdict(list))
+    for key, model, fields, ordering in (
+            ('history', WorkflowHistory, HISTORY_FIELDS, 'timestamp'),
+            ('work_items', WorkItem, WORK_ITEM_FIELDS, 'created_at'),
+            ('votes', ApprovalVote, VOTE_FIELDS, 'created_at'),
+            ('intervals', StepInterval, INTERVAL_FIELDS, 'entered_at')):
+        rows = model.objects.filter(instance_id__in=list(instances)).order_by(ordering, 'id')
+        for row in rows.values('instance_id', *fields):
+            related[row.pop('instance_id')][key].append(row)
+
+    documents = {}
+    for instance in instances.values():
+        documents[instance.submission_id] = {
+            'id': instance.id,
+            'workflow_id': instance.workflow_id,
+            'workflow': instance.workflow.name,
+            'current_step': instance.current_step.name if instance.current_step else None,
+            'is_active': instance.is_active,
+            'started_at': instance.started_at,
+            'completed_at': instance.completed_at,
+            'history': related[instance.id]['history'],
+            'work_items': related[instance.id]['work_items'],
+            'votes': related[instance.id]['votes'],
+            'intervals': related[instance.id]['intervals'],
+        }
+    return documents
+
+
+def archive_batch(submission_ids, cutoff):
+    """
+    Move the still-archivable submissions among submission_ids into the archive, in
+    one transaction: archive rows are written, files change hands with their blob
+    references, then the submissions are deleted with everything that cascades.
+    Returns the number archived.
+    """
+    with transaction.atomic():
+        submissions = list(
+            archivable_submissions(cutoff).filter(id__in=submission_ids)
+            .select_for_update(of=('self',)).order_by('id')
+        )
+        if not submissions:
+            return 0
+        workflows = _workflow_documents(submissions)
+
+        archives = []
+        for submission in submissions:
+            workflow = workflows.get(submission.id)
+            archives.append(ArchivedSubmission(
+                id=submission.id,
+                form_id=submission.form_id,
+                submitted_by_id=submission.submitted_by_id,
+                submitted_at=submission.submitted_at,
+                status=submission.status,
+                assigned_to_id=submission.assigned_to_id,
+                completed_at=workflow['completed_at'] if workflow else None,
+                payload=encode_document({
+                    'version': ARCHIVE_FORMAT_VERSION,
+                    'data': submission.data,
+                    'current_step': submission.current_step,
+                    'workflow': workflow,
+                }),
+            ))
+        ArchivedSubmission.objects.bulk_create(archives)
+
+        form_files = FormFile.objects.filter(submission__in=submissions)
+        ArchivedFile.objects.bulk_create([
+            ArchivedFile(
+                archive_id=form_file.submission_id,
+                field_name=form_file.field_name,
+                file=form_file.file.name,
+                blob_id=form_file.blob_id,
+                original_name=form_file.original_name,
+                uploaded_at=form_file.uploaded_at,
+            )
+            for form_file in form_files
+        ])
+        # The archived files take a reference for each one the FormFiles give up on delete
+        for row in form_files.filter(blob__isnull=False).values('blob_id').annotate(files=Count('id')):
+            FileBlob.objects.filter(id=row['blob_id']).update(
+                ref_count=F('ref_count') + row['files'], updated_at=timezone.now()
+            )
+
+        FormSubmission.objects.filter(id__in=[submission.id for submission in submissions]).delete()
+    return len(submissions)
+
+
+def archive_submissions(days=None, batch_size=None, max_batches=None, dry_run=False, progress=None):
+    """
+    Archive submissions in terminal states that ended more than days ago, walking
+    primary keys from the stored watermark in batches of batch_size. A run stops after
+    max_batches and the next one resumes at the watermark; reaching the last id
+    resets it, so rows that became archivable behind it are found on the next pass.
+    With dry_run nothing moves and the watermark stays. Returns the stats.
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    max_batches = settings.ARCHIVE_MAX_BATCHES if max_batches is None else max_batches
+
+    cutoff = timezone.now() - timedelta(days=days)
+    watermark, _ = JobWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    position = watermark.position
+    stats = {'batches': 0, 'scanned': 0, 'archived': 0, 'started_at': position, 'finished_pass': False}
+
+    while not max_batches or stats['batches'] < max_batches:
+        submission_ids = list(
+            archivable_submissions(cutoff).filter(id__gt=position)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not submission_ids:
+            stats['finished_pass'] = True
+            position = 0
+            break
+
+        archived = len(submission_ids) if dry_run else archive_batch(submission_ids, cutoff)
+        position = submission_ids[-1]
+        if not dry_run:
+            JobWatermark.objects.filter(id=watermark.id).update(position=position, updated_at=timezone.now())
+
+        stats['batches'] += 1
+        stats['scanned'] += len(submission_ids)
+        stats['archived'] += archived
+        if progress:
+            progress(stats)
+
+    if stats['finished_pass'] and not dry_run:
+        JobWatermark.objects.filter(id=watermark.id).update(position=0, updated_at=timezone.now())
+    stats['watermark'] = position
+
+    logger.info(
+        f"{'Would archive' if dry_run else 'Archived'} {stats['archived']} submissions ended before {cutoff:%Y-%m-%d} "
+        f"in {stats['batches']} batches, from id {stats['started_at']} to {stats['watermark'] or 'the end'}"
+    )
+    return stats
@@ -0,0 +1,162 @@
+# apps/forms_builder/blobs.py
+from datetime import timedelta
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction, IntegrityError
+from django.db.models import F, ProtectedError
+from django.utils import timezone
+
+from .models import ArchivedFile, FileBlob, FormFile, UploadSession
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class LocalFile(File):
+    """
+    A local file to hand to storage. FileSystemStorage moves files that expose
+    temporary_file_path() into place instead of copying them.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def blob_name(sha256):
+    """Storage name of a blob, fanned out over two directory levels"""
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def hash_content(content):
+    """(sha256, size) of a Django File, read in blocks"""
+    hasher = hashlib.sha256()
+    size = 0
+    content.seek(0)
+    for data in content.chunks(HASH_BLOCK_SIZE):
+        hasher.update(data)
+        size += len(data)
+    content.seek(0)
+    return hasher.hexdigest(), size
+
+
+def acquire_blob(sha256):
+    """
+    Take a reference on an existing blob. Returns the blob, or None when there is
+    no such blob (or the garbage collector removed it meanwhile).
+    """
+    blob = FileBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        return None
+
+    # Blocks behind a collector holding the row, then finds it gone
+    acquired = FileBlob.objects.filter(id=blob.id).update(
+        ref_count=F('ref_count') + 1, updated_at=timezone.now()
+    )
+    if not acquired:
+        return None
+    blob.ref_count += 1
+    return blob
+
+
+def release_blob(blob):
+    """Drop a reference taken with acquire_blob or store_blob"""
+    FileBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def store_blob(content, sha256=None, size=None, content_type=''):
+    """
+    Blob for content, with a reference taken for the caller. Content that is
+    already stored is not written again. Files exposing temporary_file_path()
+    are moved into place by FileSystemStorage rather than copied.
+    """
+    if sha256 is None or size is None:
+        sha256, size = hash_content(content)
+
+    blob = acquire_blob(sha256)
+    if blob is not None:
+        return blob
+
+    storage = FileBlob._meta.get_field('file').storage
+    name = blob_name(sha256)
+    if not storage.exists(name):
+        name = storage.save(name, content)
+
+    try:
+        with transaction.atomic():
+            return FileBlob.objects.create(
+                sha256=sha256, size=size, content_type=content_type[:100], file=name, ref_count=1
+            )
+    except IntegrityError:
+        # Stored concurrently by another request
+        if name != blob_name(sha256):
+            storage.delete(name)
+        blob = acquire_blob(sha256)
+        if blob is None:
+            raise
+        return blob
+
+
+def attach_blob(blob, submission, field_name, original_name):
+    """FormFile for a blob the caller holds a reference on; the FormFile takes its own"""
+    FileBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+    return FormFile.objects.create(
+        submission=submission,
+        field_name=field_name,
+        file=blob.file.name,
+        blob=blob,
+        original_name=original_name[:255]
+    )
+
+
+def attach_file(submission, field_name, uploaded_file):
+    """Store an inline (multipart) upload as a blob and attach it to a submission"""
+    blob = store_blob(uploaded_file, content_type=getattr(uploaded_file, 'content_type', '') or '')
+    form_file = attach_blob(blob, submission, field_name, uploaded_file.name)
+    # Only the FormFile keeps the blob
+    release_blob(blob)
+    return form_file
+
+
+def collect_blob_garbage(grace_hours=None, batch_size=500):
+    """
+    Delete blobs no FormFile or upload has referenced for grace_hours, row and files
+    (with derivatives) under the row lock so a concurrent acquire_blob waits and then misses it.
+    Returns the number of blobs removed.
+    """
+    if grace_hours is None:
+        grace_hours = settings.FILE_BLOB_GC_GRACE_HOURS
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    removed = 0
+
+    candidates = list(
+        FileBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    for blob_id in candidates:
+        with transaction.atomic():
+            blob = FileBlob.objects.select_for_update().filter(
+                id=blob_id, ref_count__lte=0, updated_at__lt=cutoff
+            ).first()
+            if blob is None:
+                continue
+            try:
+                with transaction.atomic():
+                    blob.delete()
+            except ProtectedError:
+                # Counter drifted below its holders; repair it instead
+                holders = (FormFile.objects.filter(blob_id=blob_id).count() +
+                           UploadSession.objects.filter(blob_id=blob_id).count() +
+                           ArchivedFile.objects.filter(blob_id=blob_id).count())
+                logger.warning(f"Blob {blob.sha256} has {holders} holders but ref_count {blob.ref_count}")
+                FileBlob.objects.filter(id=blob_id).update(ref_count=holders)
+                continue
+            blob.file.storage.delete(blob.file.name)
+            for derivative in blob.derivatives.values():
+                blob.file.storage.delete(derivative['name'])
+        removed += 1
+
+    return removed
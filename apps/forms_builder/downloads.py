@@ -0,0 +1,127 @@
+# apps/forms_builder/downloads.py
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Shown in the browser; anything else (HTML, SVG, ...) is forced to download so
+# uploaded content never runs on our origin
+INLINE_CONTENT_TYPES = {
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp',
+    'application/pdf', 'text/plain', 'video/mp4', 'audio/mpeg',
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def guess_content_type(content_type, filename):
+    return content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single 'bytes=' range, None to send the whole file
+    (no header, or several ranges, which may legitimately be ignored), and
+    ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    try:
+        while remaining > 0:
+            data = file.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def serve_file(request, storage, name, filename, content_type='', etag=None, size=None,
+               last_modified=None, as_attachment=False):
+    """
+    Response for a stored file whose access was already checked. With
+    FILE_SERVE_BACKEND 'nginx' or 'apache' the front-end server sends the bytes
+    (X-Accel-Redirect / X-Sendfile, ranges included); 'django' streams them
+    from this process, honouring single Range requests, for development.
+    """
+    content_type = guess_content_type(content_type, filename)
+    if content_type not in INLINE_CONTENT_TYPES:
+        as_attachment = True
+
+    headers = {
+        'Content-Disposition': content_disposition_header(as_attachment, filename),
+        'X-Content-Type-Options': 'nosniff',
+        'Cache-Control': 'private, max-age=86400',
+        'Accept-Ranges': 'bytes',
+    }
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+        if request.headers.get('If-None-Match', '').strip() == headers['ETag']:
+            return HttpResponseNotModified(headers={'ETag': headers['ETag']})
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+    backend = settings.FILE_SERVE_BACKEND
+    if backend == 'nginx':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = settings.FILE_SERVE_INTERNAL_PREFIX + quote(name)
+        return response
+    if backend == 'apache':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Sendfile'] = storage.path(name)
+        return response
+
+    if size is None:
+        size = storage.size(name)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or (etag and if_range.strip() == headers.get('ETag')):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = StreamingHttpResponse(_read_range(file, 0, size - 1), content_type=content_type,
+                                         headers=headers)
+        response['Content-Length'] = str(size)
+        return response
+
+    start, end = byte_range
+    response = StreamingHttpResponse(_read_range(file, start, end), status=206, content_type=content_type,
+                                     headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
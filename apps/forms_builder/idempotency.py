@@ -0,0 +1,106 @@
+# apps/forms_builder/idempotency.py
+from contextlib import contextmanager
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import SubmissionIdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class InvalidIdempotencyKey(ValueError):
+    pass
+
+
+def get_idempotency_key(request):
+    """Client-supplied Idempotency-Key header, None when absent"""
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise InvalidIdempotencyKey(f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters')
+    return key
+
+
+def request_fingerprint(request, form_id):
+    """
+    SHA-256 of the form and the request body (field values, and names and sizes of
+    uploaded files), so a key reused for a different request is told apart
+    """
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict of a form or multipart body
+        data = {name: values for name, values in data.lists() if name not in request.FILES}
+    files = sorted(
+        (name, file.name, file.size) for name, files in request.FILES.lists() for file in files
+    )
+    payload = json.dumps({'form': str(form_id), 'data': data, 'files': files}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_key(user, key, kind='request'):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{kind}:{user.id}:{digest}'
+
+
+def get_stored_response(user, key):
+    """(status, body, fingerprint) of the request first made with this key, or None"""
+    stored = cache.get(_cache_key(user, key))
+    if stored is not None:
+        return stored
+
+    row = SubmissionIdempotencyKey.objects.filter(user=user, key=key).values_list(
+        'response_status', 'response_body', 'fingerprint'
+    ).first()
+    if row is None:
+        return None
+
+    stored = tuple(row)
+    cache.set(_cache_key(user, key), stored, settings.IDEMPOTENCY_CACHE_SECONDS)
+    return stored
+
+
+def store_response(user, key, fingerprint, submission, response_status, response_body):
+    """
+    Record the response in the caller's transaction; it reaches the cache on commit.
+    A concurrent duplicate that got here first makes this raise IntegrityError.
+    """
+    SubmissionIdempotencyKey.objects.create(
+        user=user,
+        key=key,
+        fingerprint=fingerprint,
+        submission=submission,
+        response_status=response_status,
+        response_body=response_body
+    )
+    transaction.on_commit(lambda: cache.set(
+        _cache_key(user, key), (response_status, response_body, fingerprint), settings.IDEMPOTENCY_CACHE_SECONDS
+    ))
+
+
+@contextmanager
+def idempotency_lock(user, key):
+    """Yields True for the one request allowed to process a key at a time"""
+    lock_key = _cache_key(user, key, kind='lock')
+    acquired = cache.add(lock_key, 1, settings.IDEMPOTENCY_LOCK_SECONDS)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def wait_for_response(user, key, timeout=None, interval=0.1):
+    """Poll for the response of an in-flight request with the same key"""
+    deadline = time.monotonic() + (settings.IDEMPOTENCY_WAIT_SECONDS if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        stored = get_stored_response(user, key)
+        if stored is not None:
+            return stored
+        time.sleep(interval)
+    return None
@@ -0,0 +1,98 @@
+# apps/forms_builder/imaging.py
+#
+# Runs inside process-pool workers: keep this module free of Django imports so
+# spawned processes start quickly and never touch the database.
+import os
+import tempfile
+
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+EXIF_FIELDS = {
+    ExifTags.Base.Make: 'camera_make',
+    ExifTags.Base.Model: 'camera_model',
+    ExifTags.Base.DateTimeOriginal: 'taken_at',
+    ExifTags.Base.DateTime: 'modified_at',
+}
+
+
+def extract_metadata(image):
+    """Dimensions and a few harmless EXIF fields; GPS position is only flagged, never kept"""
+    exif = image.getexif()
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    # Dimensions as displayed: orientations 5-8 rotate by 90 degrees
+    width, height = (image.height, image.width) if orientation in (5, 6, 7, 8) else image.size
+    metadata = {
+        'width': width,
+        'height': height,
+        'format': image.format,
+        'mode': image.mode,
+        'orientation': orientation,
+        'has_gps': ExifTags.IFD.GPSInfo in exif,
+    }
+
+    sub_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    for tag, key in EXIF_FIELDS.items():
+        value = sub_ifd.get(tag, exif.get(tag))
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        if value:
+            metadata[key] = str(value).strip('\x00 ')[:100]
+    return metadata
+
+
+def _encode(image, spec, directory):
+    """Write one derivative to a temporary file; JPEG unless transparency has to survive"""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        image = image.convert('RGBA')
+        extension, options = 'png', {'format': 'PNG', 'optimize': True}
+    else:
+        image = image.convert('RGB')
+        extension, options = 'jpg', {
+            'format': 'JPEG', 'quality': spec.get('quality', 82), 'optimize': True, 'progressive': True,
+        }
+
+    fd, path = tempfile.mkstemp(suffix=f'.{extension}', dir=directory)
+    with os.fdopen(fd, 'wb') as output:
+        # No exif= argument: derivatives carry no EXIF (GPS, serial numbers, ...)
+        image.save(output, **options)
+
+    return {
+        'path': path,
+        'extension': extension,
+        'content_type': f'image/{"png" if has_alpha else "jpeg"}',
+        'width': image.width,
+        'height': image.height,
+        'size': os.path.getsize(path),
+    }
+
+
+def render_derivatives(source_path, specs, directory=None):
+    """
+    Resize an image into each derivative spec ({name: {'max_size': (w, h), 'quality': q}}),
+    largest first so every step shrinks the previous result instead of the original.
+    Returns {'metadata': ..., 'derivatives': {name: {path, extension, ...}}}, or
+    {'metadata': {}, 'derivatives': {}, 'error': ...} for files Pillow cannot read.
+    """
+    try:
+        with Image.open(source_path) as image:
+            metadata = extract_metadata(image)
+
+            largest = max((spec['max_size'] for spec in specs.values()), key=lambda size: size[0] * size[1])
+            # Let JPEG decode at a reduced scale when even the largest derivative is smaller;
+            # bounds are squared because EXIF rotation may swap width and height
+            bound = max(largest)
+            image.draft('RGB', (bound, bound))
+
+            current = ImageOps.exif_transpose(image)
+            current.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        return {'metadata': {}, 'derivatives': {}, 'error': str(e)[:200]}
+
+    derivatives = {}
+    ordered = sorted(specs.items(), key=lambda item: item[1]['max_size'][0] * item[1]['max_size'][1], reverse=True)
+    for name, spec in ordered:
+        current.thumbnail(tuple(spec['max_size']), Image.Resampling.LANCZOS)
+        derivatives[name] = _encode(current, spec, directory)
+
+    return {'metadata': metadata, 'derivatives': derivatives}
@@ -0,0 +1,40 @@
+# apps/forms_builder/management/commands/archive_submissions.py
+from django.core.management.base import BaseCommand
+
+from apps.forms_builder.archive import archive_submissions, WATERMARK_NAME
+from apps.forms_builder.models import JobWatermark
+
+
+class Command(BaseCommand):
+    help = 'Move finished submissions older than ARCHIVE_AFTER_DAYS into the compressed archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive submissions that ended more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Submissions moved per transaction (default ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, default=0,
+                            help='Stop after this many batches; 0 runs the whole pass')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start from the first id instead of the stored watermark')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['restart']:
+            JobWatermark.objects.filter(name=WATERMARK_NAME).update(position=0)
+
+        def progress(stats):
+            self.stdout.write(f"Batch {stats['batches']}: {stats['archived']} of {stats['scanned']} archived")
+
+        stats = archive_submissions(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+            progress=progress
+        )
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        where = 'pass complete' if stats['finished_pass'] else f"resumes after id {stats['watermark']}"
+        self.stdout.write(self.style.SUCCESS(f"Done: {verb} {stats['archived']} submissions ({where})"))
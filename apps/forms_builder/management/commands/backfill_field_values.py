@@ -0,0 +1,42 @@
+# apps/forms_builder/management/commands/backfill_field_values.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from apps.forms_builder.models import FormField
+from apps.forms_builder.projections import backfill_field_values
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the SubmissionFieldValue projections of indexed fields over existing submissions '
+            '(and drop those of fields no longer indexed)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', help='Only fields of this form (id)')
+        parser.add_argument('--field', action='append', default=[],
+                            help='Only this field name (with --form); repeatable')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Submissions projected per transaction')
+
+    def handle(self, *args, **options):
+        fields = FormField.objects.select_related('form').order_by('form_id', 'order')
+        if options['form']:
+            fields = fields.filter(form_id=options['form'])
+        elif options['field']:
+            raise CommandError('--field needs --form')
+        if options['field']:
+            fields = fields.filter(name__in=options['field'])
+        if not options['field']:
+            # Everything indexed, plus unindexed fields that still have projections to drop
+            fields = fields.filter(Q(indexed=True) | Q(values__isnull=False))
+
+        for field in fields.distinct():
+            processed = backfill_field_values(
+                field, batch_size=options['batch_size'],
+                progress=lambda count, field=field: self.stdout.write(f'{field.form.name}.{field.name}: {count}')
+            )
+            if field.indexed:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{field.form.name}.{field.name}: indexed on {processed} submissions'
+                ))
+            else:
+                self.stdout.write(f'{field.form.name}.{field.name}: projections removed')
@@ -0,0 +1,41 @@
+# apps/forms_builder/management/commands/cleanup_old_submissions.py
+from django.core.management.base import BaseCommand
+
+from apps.forms_builder.retention import delete_old_drafts
+
+
+class Command(BaseCommand):
+    help = 'Delete old draft submissions in batches, releasing their files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Delete drafts older than this (default DRAFT_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Submissions deleted per transaction (default SUBMISSION_CLEANUP_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Seconds between batches (default SUBMISSION_CLEANUP_PAUSE_SECONDS)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            self.stdout.write(
+                f"Batch {stats['batches']}: {stats['submissions']} drafts, {stats['files']} files "
+                f"({stats['file_bytes'] / 1024 / 1024:.1f} MB)"
+            )
+
+        stats = delete_old_drafts(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+            progress=progress
+        )
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {verb} {stats['submissions']} drafts and {stats['files']} files "
+            f"({stats['legacy_files']} outside blob storage) in {stats['seconds']}s"
+        ))
+        for label, count in sorted(stats['rows'].items()):
+            self.stdout.write(f'  {label}: {count}')
@@ -0,0 +1,57 @@
+# apps/forms_builder/management/commands/dedupe_form_files.py
+import mimetypes
+import os
+
+from django.core.management.base import BaseCommand
+
+from apps.forms_builder.blobs import store_blob
+from apps.forms_builder.models import FormFile
+
+
+class Command(BaseCommand):
+    help = ('Move form files stored before content-addressed storage into blobs, '
+            'keeping one copy of each distinct file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the per-submission copies on disk')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        moved = missing = freed = 0
+
+        while True:
+            form_files = list(
+                FormFile.objects.filter(id__gt=last_id, blob__isnull=True).order_by('id')[:options['batch_size']]
+            )
+            if not form_files:
+                break
+
+            for form_file in form_files:
+                storage = form_file.file.storage
+                original = form_file.file.name
+                if not original or not storage.exists(original):
+                    missing += 1
+                    continue
+
+                with form_file.file.open('rb') as content:
+                    blob = store_blob(content, content_type=mimetypes.guess_type(original)[0] or '')
+                # store_blob's reference passes to the FormFile
+                FormFile.objects.filter(id=form_file.id).update(
+                    blob=blob,
+                    file=blob.file.name,
+                    original_name=form_file.original_name or os.path.basename(original)
+                )
+
+                if not options['keep_originals'] and original != blob.file.name:
+                    freed += blob.size
+                    storage.delete(original)
+                moved += 1
+
+            last_id = form_files[-1].id
+            self.stdout.write(f'Moved {moved} files ({missing} missing on disk)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {moved} files moved, {missing} missing, {freed / 1024 / 1024:.1f} MB of copies removed'
+        ))
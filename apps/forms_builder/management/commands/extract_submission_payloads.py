@@ -0,0 +1,76 @@
+# apps/forms_builder/management/commands/extract_submission_payloads.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.forms_builder.models import FormSubmission
+from apps.forms_builder.payloads import PayloadExtractor
+from apps.workflow.models import WorkflowHistory
+
+HISTORY_FIELDS = ('snapshot', 'before_patch', 'data_patch', 'data_before', 'data_after')
+
+
+class Command(BaseCommand):
+    help = ('Move inline binary payloads (data: URLs) of existing submissions into file storage, '
+            'leaving references in the submission data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Submissions scanned per batch; each is rewritten in its own transaction')
+        parser.add_argument('--min-length', type=int, default=None,
+                            help='Shortest data: URL extracted (default SUBMISSION_INLINE_PAYLOAD_MIN_LENGTH)')
+        parser.add_argument('--skip-history', action='store_true',
+                            help='Leave copies in workflow history rows as they are')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        scanned = rewritten = extracted = 0
+
+        while True:
+            submission_ids = list(
+                FormSubmission.objects.filter(id__gt=last_id, data__icontains='data:')
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not submission_ids:
+                break
+
+            for submission_id in submission_ids:
+                files = self.extract_submission(submission_id, options)
+                if files is not None:
+                    rewritten += 1
+                    extracted += files
+            scanned += len(submission_ids)
+            last_id = submission_ids[-1]
+            self.stdout.write(f'Scanned {scanned} submissions, rewrote {rewritten}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {rewritten} of {scanned} submissions rewritten, {extracted} files extracted'
+        ))
+
+    @transaction.atomic
+    def extract_submission(self, submission_id, options):
+        """Number of files attached, or None when the submission had nothing to extract"""
+        submission = FormSubmission.objects.select_for_update().filter(id=submission_id).first()
+        if submission is None:
+            return None
+
+        extractor = PayloadExtractor(options['min_length'])
+        data = extractor.extract(submission.data)
+        if not extractor.payloads:
+            return None
+        FormSubmission.objects.filter(id=submission.id).update(data=data)
+
+        if not options['skip_history']:
+            # The same payloads end up as the same blobs, so history keeps matching the data
+            history = WorkflowHistory.objects.select_for_update().filter(instance__submission_id=submission.id)
+            for entry in history:
+                changes = {}
+                for field in HISTORY_FIELDS:
+                    value = getattr(entry, field)
+                    # Payloads found only in history are attached under a 'history' field name
+                    replaced = extractor.extract(value, 'history')
+                    if replaced != value:
+                        changes[field] = replaced
+                if changes:
+                    WorkflowHistory.objects.filter(id=entry.id).update(**changes)
+
+        return len(extractor.attach(submission))
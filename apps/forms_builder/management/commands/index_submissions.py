@@ -0,0 +1,24 @@
+# apps/forms_builder/management/commands/index_submissions.py
+from django.core.management.base import BaseCommand
+
+from apps.forms_builder.search import reindex_submissions
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the full-text search postings of submissions from their text, textarea '
+            'and richtext answers (saves keep them current afterwards)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', help='Only submissions of this form (id)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Submissions indexed per transaction')
+
+    def handle(self, *args, **options):
+        processed, indexed = reindex_submissions(
+            form_id=options['form'],
+            batch_size=options['batch_size'],
+            progress=lambda processed, indexed: self.stdout.write(f'{processed} submissions, {indexed} indexed')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} of {processed} submissions'
+        ))
@@ -0,0 +1,95 @@
+# apps/forms_builder/management/commands/manage_partitions.py
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.forms_builder.partitions import (partitioned_tables, detachable_tables, get_partitions,
+                                           setup_statements, maintain_partitions, pruning_checks,
+                                           explain_partitions)
+
+
+class Command(BaseCommand):
+    help = ('Create and maintain monthly range partitions of the submission and workflow history tables '
+            '(MySQL): --setup converts the tables once, the default run adds future months and removes '
+            'old ones, --explain checks that dashboard and chart queries prune partitions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setup', action='store_true',
+                            help='Partition tables that are not partitioned yet (rebuilds them)')
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help='Future months to keep partitions for (default PARTITION_MONTHS_AHEAD)')
+        parser.add_argument('--retention-months', type=int, default=None,
+                            help='Remove partitions wholly older than this (default PARTITION_RETENTION_MONTHS)')
+        parser.add_argument('--detach', action='store_true',
+                            help='Swap old workflow history partitions that still hold rows into their '
+                                 'own tables before dropping them (submission partitions are only '
+                                 'dropped once archive_submissions has emptied them)')
+        parser.add_argument('--explain', action='store_true',
+                            help='Show which partitions the dashboard and chart queries read')
+        parser.add_argument('--user-id', type=uuid.UUID, default=None,
+                            help='User the explained queries are built for')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the statements instead of running them')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('Partitioning is only supported on MySQL')
+
+        months_ahead = options['months_ahead']
+        if months_ahead is None:
+            months_ahead = settings.PARTITION_MONTHS_AHEAD
+
+        if options['setup']:
+            for table, column in partitioned_tables():
+                if get_partitions(table):
+                    self.stdout.write(f'{table} is already partitioned')
+                    continue
+                self.run_statements(setup_statements(table, column, months_ahead), options['dry_run'])
+                self.stdout.write(self.style.SUCCESS(f'Partitioned {table} by month on {column}'))
+
+        if options['explain']:
+            self.explain(options['user_id'])
+            return
+
+        results = maintain_partitions(
+            months_ahead=months_ahead,
+            retention_months=options['retention_months'],
+            detach=options['detach'],
+            dry_run=options['dry_run']
+        )
+        for table, (statements, kept) in results.items():
+            for statement in statements:
+                self.stdout.write(f'{"Would run" if options["dry_run"] else "Ran"}: {statement}')
+            if kept:
+                remedy = 'use --detach' if table in detachable_tables() else 'run archive_submissions first'
+                self.stdout.write(self.style.WARNING(
+                    f'{table}: {len(kept)} old partitions still hold rows ({", ".join(kept)}); {remedy}'
+                ))
+            partitions = get_partitions(table)
+            self.stdout.write(self.style.SUCCESS(
+                f'{table}: {len(partitions)} partitions, {partitions[0][0]} to {partitions[-1][0]}'
+            ))
+
+    def run_statements(self, statements, dry_run):
+        with connection.cursor() as cursor:
+            for statement in statements:
+                self.stdout.write(f'{"Would run" if dry_run else "Running"}: {statement}')
+                if not dry_run:
+                    cursor.execute(statement)
+
+    def explain(self, user_id):
+        totals = {table: len(get_partitions(table)) for table, _ in partitioned_tables()}
+        failures = []
+        for label, queryset, should_prune in pruning_checks(user_id):
+            total = totals[queryset.model._meta.db_table]
+            read = explain_partitions(queryset)
+            pruned = bool(read) and len(read) < total
+            self.stdout.write(f'{label}: {len(read)} of {total} partitions ({", ".join(read) or "none"})')
+            if should_prune and total > 1 and not pruned:
+                failures.append(label)
+
+        if failures:
+            raise CommandError(f'No partition pruning for: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Bounded queries prune partitions'))
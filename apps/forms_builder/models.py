@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
 from django.contrib.postgres.fields import JSONField
 from colorfield.fields import ColorField
 import uuid
@@ -21,6 +26,9 @@ class FormTemplate(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', 'created_at', 'id'], name='form_template_list_idx'),
+        ]
         permissions = [
             ("can_publish_form", "Can publish form"),
             ("can_archive_form", "Can archive form"),
@@ -87,6 +95,9 @@ class FormField(models.Model):
     width = models.CharField(max_length=20, default='full')
     css_class = models.CharField(max_length=200, blank=True)
     
+    # Answers are copied into SubmissionFieldValue so submissions can be filtered on them
+    indexed = models.BooleanField(default=False)
+    
     class Meta:
         ordering = ['order']
         unique_together = ['form', 'name']
@@ -113,8 +124,10 @@ class FormValidationRule(models.Model):
         return f"{self.field.label} - {self.rule_type}"
 
 class FormSubmission(models.Model):
-    form = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, related_name='submissions')
-    submitted_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Partitioned by month on submitted_at (see partitions.py): no database-level foreign keys
+    form = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, related_name='submissions',
+                             db_constraint=False)
+    submitted_by = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
     data = models.JSONField(default=dict)
     status = models.CharField(max_length=50, default='draft')
@@ -122,7 +135,8 @@ class FormSubmission(models.Model):
     # Workflow tracking
     current_step = models.CharField(max_length=100, blank=True)
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, 
-                                  null=True, blank=True, related_name='assigned_submissions')
+                                  null=True, blank=True, related_name='assigned_submissions',
+                                  db_constraint=False)
     
     class Meta:
         ordering = ['-submitted_at']
@@ -134,12 +148,67 @@ class FormSubmission(models.Model):
     def __str__(self):
         return f"{self.form.name} - {self.submitted_by.username} - {self.submitted_at}"
 
+class FileBlob(models.Model):
+    """
+    Uploaded content stored once under its SHA-256, shared by every FormFile (and
+    finalized upload or archived file) with the same bytes. ref_count counts those
+    holders; blobs left at zero are removed by collect_blob_garbage.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    file = models.FileField(max_length=255)
+    ref_count = models.IntegerField(default=0)
+    # Filled by process_file_upload for images; derivatives maps name -> {name, content_type, width, height, size}
+    metadata = models.JSONField(default=dict, blank=True)
+    derivatives = models.JSONField(default=dict, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='file_blob_gc_idx'),
+            models.Index(fields=['processed_at'], name='file_blob_processed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
 class FormFile(models.Model):
-    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='files')
+    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='files',
+                                   db_constraint=False)
     field_name = models.CharField(max_length=100)
-    file = models.FileField(upload_to='form_uploads/%Y/%m/%d/')
+    # Points at the blob's stored file; rows from before blobs keep their own copy
+    file = models.FileField(upload_to='form_uploads/%Y/%m/%d/', max_length=255)
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='form_files')
+    original_name = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    @property
+    def name(self):
+        return self.original_name or self.file.name.split('/')[-1]
+    
+    @property
+    def download_url(self):
+        """Permission-checked URL; files are not served from MEDIA_URL"""
+        return reverse('form_file_download', args=[self.id])
+    
+    def derivative_url(self, derivative):
+        """URL of a resized copy (e.g. 'thumbnail', 'web'), None until processed or for non-images"""
+        if not self.blob_id or derivative not in self.blob.derivatives:
+            return None
+        return reverse('form_file_derivative', args=[self.id, derivative])
+    
+    @property
+    def thumbnail_url(self):
+        return self.derivative_url('thumbnail')
+    
+    @property
+    def web_url(self):
+        return self.derivative_url('web')
+    
     def __str__(self):
         return f"{self.submission.id} - {self.field_name}"
 
@@ -156,4 +225,258 @@ class FormFieldPermission(models.Model):
     permission_type = models.CharField(max_length=20, choices=PERMISSION_TYPES)
     
     class Meta:
-        unique_together = ['field', 'user', 'group', 'permission_type']
\ No newline at end of file
+        unique_together = ['field', 'user', 'group', 'permission_type']
+class ActivityFeedEntry(models.Model):
+    """
+    Entry of a precomputed activity feed. Written to each recipient's own feed (user),
+    or once for a large group or role that readers pull from instead.
+    """
+    ACTIVITY_TYPES = [
+        ('submission', 'Submission'),
+        ('workflow', 'Workflow'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='activity_feed')
+    group = models.ForeignKey('auth.Group', on_delete=models.CASCADE, null=True, blank=True)
+    role = models.CharField(max_length=20, blank=True)
+    
+    activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=300)
+    description = models.CharField(max_length=300, blank=True)
+    icon = models.CharField(max_length=50, default='document')
+    link = models.CharField(max_length=300, blank=True)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='activity_user_feed_idx'),
+            models.Index(fields=['group', 'created_at', 'id'], name='activity_group_feed_idx'),
+            models.Index(fields=['role', 'created_at', 'id'], name='activity_role_feed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id or self.group_id or self.role} - {self.title}"
+
+class SubmissionIdempotencyKey(models.Model):
+    """Response of a submit request, replayed when the client retries with the same key"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, blank=True)  # Of the form and body; blank on older rows
+    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='+',
+                                   db_constraint=False)
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        # The unique index collapses concurrent duplicates that slip past the cache lock
+        unique_together = ['user', 'key']
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.key}"
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload. Chunks are appended to a temporary file; finalizing
+    stores it as a FileBlob, and the id is then the token a submission sends for the
+    file field. The session holds a blob reference until a FormFile takes it over.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    form = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, related_name='+')
+    field_name = models.CharField(max_length=100)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='upload_session_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+class SubmissionFieldValue(models.Model):
+    """
+    Typed copy of a submission's answer to an indexed field, one row per value
+    (multi-selects have several), rewritten whenever the submission is saved; see
+    projections.py. Filters on answers are index range reads here instead of
+    parsing every FormSubmission.data.
+    """
+    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='field_values',
+                                   db_constraint=False)
+    field = models.ForeignKey(FormField, on_delete=models.CASCADE, related_name='values')
+    value_string = models.CharField(max_length=255, null=True, blank=True)
+    value_number = models.DecimalField(max_digits=20, decimal_places=6, null=True, blank=True)
+    value_date = models.DateField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['field', 'value_string', 'submission'], name='field_value_string_idx'),
+            models.Index(fields=['field', 'value_number', 'submission'], name='field_value_number_idx'),
+            models.Index(fields=['field', 'value_date', 'submission'], name='field_value_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.submission_id} - {self.field_id}"
+
+class SearchDocument(models.Model):
+    """
+    A submission in the full-text index (search.py), with its length in terms for
+    BM25 length normalization; submissions without searchable text have none.
+    """
+    submission = models.OneToOneField(FormSubmission, on_delete=models.CASCADE, primary_key=True,
+                                      related_name='search_document', db_constraint=False)
+    length = models.PositiveIntegerField()
+    indexed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.submission_id} ({self.length} terms)"
+
+class SearchPosting(models.Model):
+    """
+    Inverted index entry: a term of a submission's text, textarea and richtext
+    answers and how often it occurs. The document length is copied in so ranking
+    reads nothing but the (term, submission) postings.
+    """
+    term = models.CharField(max_length=64)
+    submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name='search_postings',
+                                   db_constraint=False)
+    frequency = models.PositiveIntegerField()
+    length = models.PositiveIntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'submission', 'frequency', 'length'], name='search_posting_term_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} - {self.submission_id}"
+
+class ArchivedSubmission(models.Model):
+    """
+    A submission in a terminal state moved out of FormSubmission by archive_submissions.
+    Columns keep what lists filter on; the data and the workflow (instance, history,
+    work items, votes, intervals) are one zlib-compressed JSON document, see archive.py.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The submission's id, so links keep working
+    form = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, related_name='archived_submissions')
+    submitted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    submitted_at = models.DateTimeField()
+    status = models.CharField(max_length=50)
+    assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.BinaryField()
+    
+    class Meta:
+        ordering = ['-submitted_at']
+        indexes = [
+            models.Index(fields=['form', 'submitted_at'], name='archived_submission_form_idx'),
+            models.Index(fields=['submitted_by', 'submitted_at'], name='archived_submission_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.form_id} - {self.id} (archived)"
+
+class ArchivedFile(models.Model):
+    """A FormFile of an archived submission; keeps the blob reference the FormFile held"""
+    archive = models.ForeignKey(ArchivedSubmission, on_delete=models.CASCADE, related_name='files')
+    field_name = models.CharField(max_length=100)
+    file = models.FileField(max_length=255)
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='archived_files')
+    original_name = models.CharField(max_length=255, blank=True)
+    uploaded_at = models.DateTimeField()
+    
+    @property
+    def name(self):
+        return self.original_name or self.file.name.split('/')[-1]
+    
+    @property
+    def download_url(self):
+        return reverse('archived_file_download', args=[self.id])
+    
+    def __str__(self):
+        return f"{self.archive_id} - {self.field_name}"
+
+class JobWatermark(models.Model):
+    """Where a batched maintenance job stopped, so the next run resumes there"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+@receiver(post_delete, sender=FormFile)
+@receiver(post_delete, sender=UploadSession)
+@receiver(post_delete, sender=ArchivedFile)
+def release_file_blob(sender, instance, **kwargs):
+    """Drop the deleted holder's blob reference"""
+    if instance.blob_id:
+        FileBlob.objects.filter(id=instance.blob_id).update(
+            ref_count=F('ref_count') - 1, updated_at=timezone.now()
+        )
+
+
+@receiver(post_save, sender=FormSubmission)
+def refresh_submission_field_values(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the indexed field projections in step with the submission's data"""
+    if raw or (update_fields is not None and 'data' not in update_fields):
+        return
+    from .projections import refresh_field_values
+    refresh_field_values(instance)
+
+
+@receiver(post_save, sender=FormSubmission)
+def refresh_submission_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the full-text postings in step with the submission's data; saves of other columns skip it"""
+    if raw or (update_fields is not None and 'data' not in update_fields):
+        return
+    from .search import index_submission
+    index_submission(instance)
+
+
+@receiver(pre_save, sender=FormField)
+def remember_indexed_field_key(sender, instance, raw=False, **kwargs):
+    """Note the stored name and type of an indexed field, which its projections depend on"""
+    instance._projection_key = None
+    if not raw and instance.pk:
+        instance._projection_key = FormField.objects.filter(pk=instance.pk).values_list(
+            'name', 'field_type'
+        ).first()
+
+
+@receiver(post_save, sender=FormField)
+def sync_indexed_field(sender, instance, raw=False, **kwargs):
+    """
+    Backfill a newly indexed field or one whose name or type changed (its values
+    are read from another key or belong in another column), or drop the
+    projections of one no longer indexed
+    """
+    if raw:
+        return
+    old_key = getattr(instance, '_projection_key', None)
+    key_changed = old_key is not None and old_key != (instance.name, instance.field_type)
+    if not (instance.indexed and key_changed) and \
+            instance.indexed == SubmissionFieldValue.objects.filter(field_id=instance.id).exists():
+        return
+    from .tasks import backfill_field_values
+    field_id = instance.id
+    transaction.on_commit(lambda: backfill_field_values.delay(field_id))
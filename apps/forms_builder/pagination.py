@@ -0,0 +1,238 @@
+# apps/forms_builder/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps full microsecond precision; DjangoJSONEncoder truncates to milliseconds"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    """Opaque cursor for a position: direction ('n'ext or 'p'revious) and the ordering values"""
+    payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise InvalidCursor('Invalid cursor')
+    return direction, values
+
+
+def estimate_count(queryset):
+    """
+    Row estimate from the query planner instead of an exact COUNT(*).
+    Returns None when the database cannot provide one.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql':
+        return None
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            row = cursor.fetchone()
+    except Exception:
+        return None
+
+    if not row:
+        return 0
+
+    plan = dict(zip(columns, row))
+    rows = plan.get('rows') or 0
+    filtered = plan.get('filtered') or 100
+    return int(rows * filtered / 100)
+
+
+class KeysetPage:
+    """One page of a keyset pagination; iterable like a Django Page"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, estimated_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_total = estimated_total
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a unique ordering such as ('-timestamp', '-id').
+    Each page is one indexed range read, so the cost does not grow with depth.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        directions = {field.startswith('-') for field in ordering}
+        if len(directions) != 1:
+            raise ImproperlyConfigured('Keyset ordering fields must all sort in the same direction')
+
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.fields = [field.lstrip('-') for field in ordering]
+        self.descending = ordering[0].startswith('-')
+
+    def _position_filter(self, values, forward):
+        """Rows strictly after (forward) or before the given position"""
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            clause = Q(**{f'{field}__{lookup}': values[index]})
+            for previous_field, value in zip(self.fields[:index], values[:index]):
+                clause &= Q(**{previous_field: value})
+            condition |= clause
+        return condition
+
+    def _values(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor('Invalid cursor')
+
+        parsed = []
+        for field, value in zip(self.fields, values):
+            model_field = self.queryset.model._meta.get_field('id' if field == 'pk' else field)
+            if isinstance(value, str) and model_field.get_internal_type() == 'DateTimeField':
+                value = parse_datetime(value)
+                if value is None:
+                    raise InvalidCursor('Invalid cursor')
+            parsed.append(value)
+        return parsed
+
+    def get_page(self, cursor=None, with_estimate=False):
+        """Page after (or before) the cursor; an invalid or missing cursor gives the first page"""
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+                values = self._parse_values(values)
+            except InvalidCursor:
+                direction, values = 'n', None
+
+        forward = direction == 'n'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._position_filter(values, forward))
+
+        if forward:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*[field[1:] if field.startswith('-') else f'-{field}'
+                                           for field in self.ordering])
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor('n', self._values(rows[-1]))
+            if values is not None and (forward or has_more):
+                previous_cursor = encode_cursor('p', self._values(rows[0]))
+
+        estimated_total = estimate_count(self.queryset) if with_estimate else None
+        return KeysetPage(rows, next_cursor, previous_cursor, estimated_total)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF cursor pagination on a unique (timestamp, id) ordering.
+    Views set keyset_ordering, otherwise the model's Meta.ordering plus '-pk' is used.
+    Pass ?estimate_total=1 for a planner-estimated total instead of COUNT(*).
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    estimate_query_param = 'estimate_total'
+
+    def get_ordering(self, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            return ordering
+
+        ordering = list(queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-pk' if descending or not ordering else 'pk')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.page_size, self.get_ordering(queryset, view))
+        self.page = paginator.get_page(
+            request.query_params.get(self.cursor_query_param),
+            with_estimate=request.query_params.get(self.estimate_query_param) in ('1', 'true')
+        )
+        return list(self.page)
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if cursor is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        }
+        if self.page.estimated_total is not None:
+            response['estimated_total'] = self.page.estimated_total
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'estimated_total': {'type': 'integer'},
+                'results': schema,
+            },
+        }
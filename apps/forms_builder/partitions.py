@@ -0,0 +1,226 @@
+# apps/forms_builder/partitions.py
+#
+# Monthly RANGE partitions on FormSubmission.submitted_at and WorkflowHistory.timestamp
+# (MySQL). Partitioned InnoDB tables cannot take part in foreign keys and need the
+# partition column in every unique key, so the primary key becomes (id, <column>)
+# and the relations to and from these tables are declared with db_constraint=False;
+# Django still enforces on_delete itself. Queries bounded on the column only read
+# the partitions they need; lookups by id or instance read one index per partition.
+from datetime import date, timedelta
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.workflow.models import WorkflowHistory
+from .models import FormSubmission
+
+MAXVALUE_PARTITION = 'pmax'
+
+
+def detachable_tables():
+    """
+    Tables whose old partitions may be swapped out with rows still in them. Nothing
+    refers to history rows; submissions have files, workflow instances, work items,
+    projections and search postings that only Django's on_delete removes, so their
+    partitions must be emptied through the ORM (archive_submissions) instead.
+    """
+    return {WorkflowHistory._meta.db_table}
+
+
+def partitioned_tables():
+    """(table, partition column) of each partitioned model"""
+    return [
+        (FormSubmission._meta.db_table, FormSubmission._meta.get_field('submitted_at').column),
+        (WorkflowHistory._meta.db_table, WorkflowHistory._meta.get_field('timestamp').column),
+    ]
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def partition_clause(month):
+    """Partition holding the month: rows before the first day of the next one"""
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{add_months(month, 1).isoformat()}'))"
+
+
+def get_partitions(table):
+    """[(name, upper bound as a date or None for MAXVALUE, estimated rows)] in order"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            [table]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, description, table_rows in rows:
+        # TO_DAYS() counts days from year 0; date.toordinal() from year 1
+        bound = None if description == 'MAXVALUE' else date.fromordinal(int(description) - 365)
+        partitions.append((name, bound, table_rows or 0))
+    return partitions
+
+
+def foreign_keys(table):
+    """(table, constraint) of the foreign keys declared on or pointing at a table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL "
+            "AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)",
+            [table, table]
+        )
+        return cursor.fetchall()
+
+
+def partition_is_empty(table, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT 1 FROM `{table}` PARTITION (`{name}`) LIMIT 1')
+        return cursor.fetchone() is None
+
+
+def setup_statements(table, column, months_ahead):
+    """
+    Statements converting an unpartitioned table: drop the foreign keys, then one
+    rebuild that widens the primary key and partitions by month from the oldest row.
+    """
+    statements = [
+        f'ALTER TABLE `{constraint_table}` DROP FOREIGN KEY `{constraint}`'
+        for constraint_table, constraint in foreign_keys(table)
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(`{column}`) FROM `{table}`')
+        oldest = cursor.fetchone()[0]
+    this_month = month_start(timezone.now().date())
+    month = month_start(oldest.date()) if oldest else this_month
+
+    clauses = []
+    while month <= add_months(this_month, months_ahead):
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    clauses.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE')
+
+    statements.append(
+        f'ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `{column}`) '
+        f'PARTITION BY RANGE (TO_DAYS(`{column}`)) ({", ".join(clauses)})'
+    )
+    return statements
+
+
+def maintenance_statements(table, months_ahead, retention_months=None, detach=False):
+    """
+    Statements keeping a partitioned table current: split months_ahead future months
+    off the (empty) MAXVALUE partition, and remove partitions wholly older than
+    retention_months. An old partition is dropped once empty; with detach a partition
+    of a detachable table still holding rows is swapped into its own table
+    (<table>_<partition>) first, so either way no rows are deleted one by one.
+    Returns (statements, kept), kept being old partitions left alone because they
+    hold rows.
+    """
+    partitions = get_partitions(table)
+    bounded = [bound for _, bound, _ in partitions if bound is not None]
+    this_month = month_start(timezone.now().date())
+    statements = []
+    kept = []
+
+    next_month = bounded[-1] if bounded else this_month
+    new_clauses = []
+    while next_month <= add_months(this_month, months_ahead):
+        new_clauses.append(partition_clause(next_month))
+        next_month = add_months(next_month, 1)
+    if new_clauses:
+        new_clauses.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE')
+        statements.append(
+            f'ALTER TABLE `{table}` REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ({", ".join(new_clauses)})'
+        )
+
+    if retention_months:
+        cutoff = add_months(this_month, -retention_months)
+        for name, bound, _ in partitions:
+            if bound is None or bound > cutoff:
+                break
+            if partition_is_empty(table, name):
+                statements.append(f'ALTER TABLE `{table}` DROP PARTITION `{name}`')
+            elif detach and table in detachable_tables():
+                detached = f'{table}_{name}'
+                statements += [
+                    f'CREATE TABLE `{detached}` LIKE `{table}`',
+                    f'ALTER TABLE `{detached}` REMOVE PARTITIONING',
+                    f'ALTER TABLE `{table}` EXCHANGE PARTITION `{name}` WITH TABLE `{detached}`',
+                    f'ALTER TABLE `{table}` DROP PARTITION `{name}`',
+                ]
+            else:
+                kept.append(name)
+    return statements, kept
+
+
+def maintain_partitions(months_ahead=None, retention_months=None, detach=False, dry_run=False):
+    """Run maintenance_statements for every partitioned table; returns {table: (statements, kept)}"""
+    months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    retention_months = settings.PARTITION_RETENTION_MONTHS if retention_months is None else retention_months
+
+    results = {}
+    for table, _ in partitioned_tables():
+        if not get_partitions(table):
+            continue
+        statements, kept = maintenance_statements(table, months_ahead, retention_months, detach)
+        if not dry_run:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        results[table] = (statements, kept)
+    return results
+
+
+def pruning_checks(user_id=None):
+    """
+    (label, queryset, should prune) for the dashboard and chart queries on the
+    partitioned tables, built the way DashboardStatsAPI, ChartDataAPI and the
+    approval history build them. Unbounded counts are listed to show their cost.
+    Without a user id the nil UUID stands in: the plan, not the rows, matters.
+    """
+    user_id = user_id or uuid.UUID(int=0)
+    now = timezone.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    submissions = FormSubmission.objects.filter(submitted_by_id=user_id)
+
+    def per_day(days):
+        return submissions.filter(submitted_at__gte=now - timedelta(days=days)).extra(
+            select={'day': 'date(submitted_at)'}
+        ).values('day').annotate(count=Count('id')).order_by('day')
+
+    return [
+        ('dashboard: completed today', submissions.filter(status='completed', submitted_at__gte=today_start), True),
+        ('dashboard: submissions last week', submissions.filter(submitted_at__gte=now - timedelta(days=7)), True),
+        ('dashboard: total submissions', submissions, False),
+        ('chart: submissions per day, 7d', per_day(7), True),
+        ('chart: submissions per day, 30d', per_day(30), True),
+        ('chart: submissions per day, 90d', per_day(90), True),
+        ('history: approvals, last 30 days',
+         WorkflowHistory.objects.filter(actor_id=user_id, timestamp__gte=now - timedelta(days=30)), True),
+    ]
+
+
+def explain_partitions(queryset):
+    """Partitions the plan reads for a queryset's table, from EXPLAIN"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in cursor.description]
+        row = dict(zip(columns, cursor.fetchone()))
+    return [name for name in (row.get('partitions') or '').split(',') if name]
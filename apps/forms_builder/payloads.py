@@ -0,0 +1,125 @@
+# apps/forms_builder/payloads.py
+import base64
+import binascii
+import hashlib
+import mimetypes
+import re
+from urllib.parse import unquote_to_bytes
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .blobs import store_blob, attach_blob, release_blob
+
+# Submission data holds {"$file": "<sha256>", "content_type": ..., "size": ...}
+# where a client sent the bytes inline
+FILE_REFERENCE_KEY = '$file'
+
+DATA_URL_RE = re.compile(
+    r'^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?P<params>(?:;[\w.+-]+=[^;,]*)*)(?P<base64>;base64)?,(?P<data>.*)$',
+    re.DOTALL
+)
+
+
+def parse_data_url(value):
+    """(content_type, bytes) of a data: URL, None for anything else"""
+    match = DATA_URL_RE.match(value)
+    if not match:
+        return None
+
+    try:
+        if match.group('base64'):
+            content = base64.b64decode(match.group('data'), validate=True)
+        else:
+            content = unquote_to_bytes(match.group('data'))
+    except (binascii.Error, ValueError):
+        return None
+    return match.group('type') or 'text/plain', content
+
+
+def is_file_reference(value):
+    return isinstance(value, dict) and FILE_REFERENCE_KEY in value
+
+
+class PayloadExtractor:
+    """
+    Replaces inline binary payloads (data: URLs) anywhere in a JSON value with file
+    references, storing each distinct payload once as a blob. attach() then gives
+    the submission a FormFile per payload, in the same transaction.
+    """
+
+    def __init__(self, min_length=None):
+        self.min_length = settings.SUBMISSION_INLINE_PAYLOAD_MIN_LENGTH if min_length is None else min_length
+        self.payloads = {}  # sha256 -> (blob, field path)
+
+    def extract(self, value, path=''):
+        if isinstance(value, dict):
+            if is_file_reference(value):
+                return value
+            return {key: self.extract(item, f'{path}.{key}' if path else str(key)) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.extract(item, f'{path}.{index}') for index, item in enumerate(value)]
+        if isinstance(value, str) and len(value) >= self.min_length and value.startswith('data:'):
+            parsed = parse_data_url(value)
+            if parsed is not None:
+                return self._store(path, *parsed)
+        return value
+
+    def _store(self, path, content_type, content):
+        sha256 = hashlib.sha256(content).hexdigest()
+        if sha256 not in self.payloads:
+            blob = store_blob(ContentFile(content), sha256=sha256, size=len(content), content_type=content_type)
+            self.payloads[sha256] = (blob, path)
+        return {FILE_REFERENCE_KEY: sha256, 'content_type': content_type, 'size': len(content)}
+
+    def attach(self, submission):
+        """FormFiles for the extracted payloads the submission does not have yet"""
+        if not self.payloads:
+            return []
+
+        existing = set(
+            submission.files.filter(blob__sha256__in=list(self.payloads)).values_list('blob__sha256', flat=True)
+        )
+        form_files = []
+        for sha256, (blob, path) in self.payloads.items():
+            if sha256 not in existing:
+                extension = mimetypes.guess_extension(blob.content_type) or ''
+                form_files.append(attach_blob(blob, submission, path.split('.')[0][:100], f'{path}{extension}'))
+            # The FormFile holds its own reference
+            release_blob(blob)
+
+        self.payloads = {}
+        return form_files
+
+
+def extract_payloads(data):
+    """(data with payloads replaced by references, extractor to attach() once the submission exists)"""
+    extractor = PayloadExtractor()
+    return extractor.extract(data), extractor
+
+
+def resolve_file_references(value, files_by_sha256):
+    """
+    Add the download URL and name to each file reference, given the submission's
+    FormFiles by blob hash. Bytes are never inlined again.
+    """
+    if isinstance(value, dict):
+        if is_file_reference(value):
+            form_file = files_by_sha256.get(value[FILE_REFERENCE_KEY])
+            return {
+                **value,
+                'url': form_file.download_url if form_file else None,
+                'name': form_file.name if form_file else None,
+            }
+        return {key: resolve_file_references(item, files_by_sha256) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_file_references(item, files_by_sha256) for item in value]
+    return value
+
+
+def has_file_references(value):
+    if isinstance(value, dict):
+        return is_file_reference(value) or any(has_file_references(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_file_references(item) for item in value)
+    return False
@@ -0,0 +1,215 @@
+# apps/forms_builder/processing.py
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import LocalFile
+from .imaging import render_derivatives
+from .models import FileBlob, FormFile
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff', '.heic'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    The worker's pool for CPU-bound image work, or None to work inline: when
+    FILE_PROCESSING_WORKERS is 0, or inside a prefork child, whose daemonic
+    processes cannot start their own.
+    """
+    global _pool
+
+    if not settings.FILE_PROCESSING_WORKERS or multiprocessing.current_process().daemon:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the worker has other threads that may hold locks
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.FILE_PROCESSING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _reset_process_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def is_image(blob, original_name=''):
+    if blob.content_type.startswith('image/'):
+        return True
+    return os.path.splitext(original_name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_name(sha256, derivative, extension):
+    return f'derivatives/{sha256[:2]}/{sha256[2:4]}/{sha256}/{derivative}.{extension}'
+
+
+@contextmanager
+def local_path(blob, directory):
+    """Filesystem path of a blob's file, copied to directory first for remote storage"""
+    try:
+        path = blob.file.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    fd, path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as local, blob.file.open('rb') as remote:
+        shutil.copyfileobj(remote, local, 1024 * 1024)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def save_derivatives(blob, result):
+    """Move rendered derivatives into storage and record them on the blob"""
+    storage = blob.file.storage
+    derivatives = {}
+
+    for derivative, rendered in result['derivatives'].items():
+        name = derivative_name(blob.sha256, derivative, rendered['extension'])
+        if storage.exists(name):
+            storage.delete(name)
+        with open(rendered['path'], 'rb') as content:
+            name = storage.save(name, LocalFile(content, name=os.path.basename(name)))
+        derivatives[derivative] = {
+            'name': name,
+            'content_type': rendered['content_type'],
+            'width': rendered['width'],
+            'height': rendered['height'],
+            'size': rendered['size'],
+        }
+
+    metadata = result['metadata']
+    if result.get('error'):
+        metadata = {'error': result['error']}
+        logger.warning(f"Could not process blob {blob.sha256}: {result['error']}")
+
+    FileBlob.objects.filter(id=blob.id).update(
+        metadata=metadata, derivatives=derivatives, processed_at=timezone.now()
+    )
+
+
+def process_blobs(blobs):
+    """
+    Render the derivatives of a batch of image blobs. The files are decoded and
+    resized in the process pool in parallel; storage and database writes stay here.
+    Returns the number of blobs processed.
+    """
+    specs = settings.FILE_DERIVATIVES
+    processed = 0
+
+    with tempfile.TemporaryDirectory(prefix='derivatives-') as directory, ExitStack() as stack:
+        paths = {blob.id: stack.enter_context(local_path(blob, directory)) for blob in blobs}
+
+        pool = get_process_pool()
+        futures = {}
+        if pool is not None:
+            try:
+                futures = {
+                    blob.id: pool.submit(render_derivatives, paths[blob.id], specs, directory)
+                    for blob in blobs
+                }
+            except (BrokenProcessPool, RuntimeError):
+                logger.exception("File processing pool unavailable; processing inline")
+                _reset_process_pool()
+                futures = {}
+
+        for blob in blobs:
+            future = futures.get(blob.id)
+            try:
+                result = future.result() if future else None
+            except BrokenProcessPool:
+                logger.exception(f"File processing pool broke on blob {blob.sha256}; processing inline")
+                _reset_process_pool()
+                result = None
+            except Exception as e:
+                logger.exception(f"Processing blob {blob.sha256} failed")
+                result = {'metadata': {}, 'derivatives': {}, 'error': str(e)[:200]}
+            if result is None:
+                result = render_derivatives(paths[blob.id], specs, directory)
+
+            save_derivatives(blob, result)
+            processed += 1
+
+    return processed
+
+
+def process_form_files(file_ids):
+    """Process the unprocessed image blobs behind some FormFiles; each blob only once"""
+    blobs = {}
+    skipped = []
+    for form_file in FormFile.objects.filter(
+            id__in=file_ids, blob__processed_at__isnull=True).select_related('blob'):
+        if is_image(form_file.blob, form_file.name):
+            blobs[form_file.blob_id] = form_file.blob
+        else:
+            skipped.append(form_file.blob_id)
+
+    # Nothing to render, but the sweep should not pick them up again
+    FileBlob.objects.filter(id__in=skipped).exclude(id__in=list(blobs)).update(processed_at=timezone.now())
+
+    return process_blobs(list(blobs.values())) if blobs else 0
+
+
+def queue_file_processing(submission):
+    """Once the submission commits, process its image files in one task"""
+    from .tasks import process_file_upload
+
+    def enqueue():
+        file_ids = [
+            form_file.id for form_file in
+            FormFile.objects.filter(submission_id=submission.id, blob__processed_at__isnull=True)
+            .select_related('blob')
+            if is_image(form_file.blob, form_file.name)
+        ]
+        if file_ids:
+            process_file_upload.delay(file_ids)
+
+    transaction.on_commit(enqueue)
+
+
+def queue_pending_file_processing(batch_size=None):
+    """Queue tasks for files whose processing never ran (lost tasks, migrated files)"""
+    from .tasks import process_file_upload
+
+    batch_size = batch_size or settings.FILE_PROCESSING_BATCH_SIZE
+    last_id = 0
+    queued = 0
+
+    while True:
+        file_ids = list(
+            FormFile.objects.filter(id__gt=last_id, blob__processed_at__isnull=True)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not file_ids:
+            break
+        process_file_upload.delay(file_ids)
+        queued += len(file_ids)
+        last_id = file_ids[-1]
+
+    return queued
@@ -0,0 +1,209 @@
+# apps/forms_builder/projections.py
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import operator
+
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import FormField, FormSubmission, SubmissionFieldValue
+
+# Indexed fields are projected into the SubmissionFieldValue column for their type
+VALUE_COLUMNS = {
+    'number': 'value_number',
+    'rating': 'value_number',
+    'date': 'value_date',
+    'datetime': 'value_date',  # Indexed by day
+    'text': 'value_string',
+    'email': 'value_string',
+    'select': 'value_string',
+    'multiselect': 'value_string',
+    'radio': 'value_string',
+    'checkbox': 'value_string',
+    'lookup': 'value_string',
+}
+STRING_VALUE_LENGTH = 255
+
+# value_number is DecimalField(max_digits=20, decimal_places=6): larger numbers are not indexed
+_number_field = SubmissionFieldValue._meta.get_field('value_number')
+NUMBER_LIMIT = Decimal(10) ** (_number_field.max_digits - _number_field.decimal_places)
+NUMBER_QUANTUM = Decimal(1).scaleb(-_number_field.decimal_places)
+
+# Query parameters: field.<name>=value, field.<name>__gte=value, field.<name>__in=a,b
+FILTER_PREFIX = 'field.'
+FILTER_LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'in': lambda value, options: value in options,
+}
+
+
+class FieldFilterError(ValueError):
+    pass
+
+
+def is_indexable(field):
+    return field.field_type in VALUE_COLUMNS
+
+
+def convert_value(field, raw):
+    """A single answer as the type of its column, None when it does not convert or fit"""
+    column = VALUE_COLUMNS[field.field_type]
+    if raw is None or raw == '':
+        return None
+
+    if column == 'value_number':
+        if isinstance(raw, bool):
+            return None
+        try:
+            value = Decimal(str(raw))
+        except InvalidOperation:
+            return None
+        if not value.is_finite() or abs(value) >= NUMBER_LIMIT:
+            return None
+        value = value.quantize(NUMBER_QUANTUM)
+        return value if abs(value) < NUMBER_LIMIT else None
+
+    if column == 'value_date':
+        if isinstance(raw, datetime):
+            return raw.date()
+        if isinstance(raw, date):
+            return raw
+        if not isinstance(raw, str):
+            return None
+        try:
+            parsed = parse_datetime(raw) or parse_date(raw[:10])
+        except ValueError:
+            return None
+        return parsed.date() if isinstance(parsed, datetime) else parsed
+
+    if isinstance(raw, bool):
+        return 'true' if raw else 'false'
+    if isinstance(raw, (dict, list)):
+        return None
+    return str(raw)[:STRING_VALUE_LENGTH]
+
+
+def project_values(field, raw):
+    """Typed values of an answer; lists (multi-selects) give one per item"""
+    items = raw if isinstance(raw, list) else [raw]
+    values = []
+    for item in items:
+        value = convert_value(field, item)
+        if value is not None and value not in values:
+            values.append(value)
+    return values
+
+
+def get_indexed_fields(form_id):
+    return [field for field in FormField.objects.filter(form_id=form_id, indexed=True) if is_indexable(field)]
+
+
+def build_field_values(submission, fields):
+    rows = []
+    for field in fields:
+        column = VALUE_COLUMNS[field.field_type]
+        for value in project_values(field, (submission.data or {}).get(field.name)):
+            rows.append(SubmissionFieldValue(submission_id=submission.id, field_id=field.id, **{column: value}))
+    return rows
+
+
+def refresh_field_values(submission, fields=None):
+    """Rewrite a submission's projections from its data, in the caller's transaction"""
+    if fields is None:
+        fields = get_indexed_fields(submission.form_id)
+
+    with transaction.atomic():
+        SubmissionFieldValue.objects.filter(submission_id=submission.id).delete()
+        SubmissionFieldValue.objects.bulk_create(build_field_values(submission, fields))
+
+
+def backfill_field_values(field, batch_size=500, progress=None):
+    """
+    Project one field over every submission of its form, in primary-key batches of
+    one transaction each; removes the projections instead when the field is no
+    longer indexed. Returns the number of submissions processed.
+    """
+    if not (field.indexed and is_indexable(field)):
+        SubmissionFieldValue.objects.filter(field_id=field.id).delete()
+        return 0
+
+    column = VALUE_COLUMNS[field.field_type]
+    last_id = 0
+    processed = 0
+    while True:
+        submissions = list(
+            FormSubmission.objects.filter(form_id=field.form_id, id__gt=last_id)
+            .order_by('id').only('id', 'data')[:batch_size]
+        )
+        if not submissions:
+            break
+
+        with transaction.atomic():
+            ids = [submission.id for submission in submissions]
+            SubmissionFieldValue.objects.filter(field_id=field.id, submission_id__in=ids).delete()
+            SubmissionFieldValue.objects.bulk_create([
+                SubmissionFieldValue(submission_id=submission.id, field_id=field.id, **{column: value})
+                for submission in submissions
+                for value in project_values(field, (submission.data or {}).get(field.name))
+            ])
+
+        processed += len(submissions)
+        last_id = submissions[-1].id
+        if progress:
+            progress(processed)
+    return processed
+
+
+def parse_field_filters(form, params):
+    """
+    [(field, lookup, value)] from field.<name>[__lookup] query parameters; only
+    indexed fields can be filtered on. Raises FieldFilterError.
+    """
+    names = {}
+    for key in params:
+        if key.startswith(FILTER_PREFIX):
+            name, _, lookup = key[len(FILTER_PREFIX):].partition('__')
+            names.setdefault(name, []).append((key, lookup or 'exact'))
+    if not names:
+        return []
+
+    fields = {field.name: field for field in FormField.objects.filter(form=form, name__in=list(names))}
+    filters = []
+    for name, keys in names.items():
+        field = fields.get(name)
+        if field is None or not field.indexed or not is_indexable(field):
+            raise FieldFilterError(f'{name} is not an indexed field of this form')
+        for key, lookup in keys:
+            if lookup not in FILTER_LOOKUPS:
+                raise FieldFilterError(f'Unsupported lookup {lookup} for {name}')
+            raw = params.get(key)
+            items = raw.split(',') if lookup == 'in' else [raw]
+            values = [convert_value(field, item) for item in items]
+            if any(value is None for value in values):
+                raise FieldFilterError(f'Invalid value for {name}: {raw}')
+            filters.append((field, lookup, values if lookup == 'in' else values[0]))
+    return filters
+
+
+def apply_field_filters(queryset, filters):
+    """Restrict a FormSubmission queryset; each filter is a semi-join on a (field, value) index"""
+    for field, lookup, value in filters:
+        column = VALUE_COLUMNS[field.field_type]
+        matching = SubmissionFieldValue.objects.filter(
+            field_id=field.id, **{f'{column}__{lookup}': value}
+        ).values('submission_id')
+        queryset = queryset.filter(id__in=matching)
+    return queryset
+
+
+def matches_field_filters(data, filters):
+    """The same filters evaluated on a data dict, for rows without projections (the archive)"""
+    for field, lookup, value in filters:
+        compare = FILTER_LOOKUPS[lookup]
+        if not any(compare(candidate, value) for candidate in project_values(field, (data or {}).get(field.name))):
+            return False
+    return True
@@ -0,0 +1,90 @@
+# apps/forms_builder/retention.py
+from datetime import timedelta
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import FormFile, FormSubmission
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_stored_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception(f"Could not delete stored file {name}")
+
+
+def delete_old_drafts(days=None, batch_size=None, pause=None, dry_run=False, progress=None):
+    """
+    Delete drafts older than days in primary-key order, batch_size at a time, each
+    batch in its own short transaction followed by a pause so replicas and other
+    writers keep up. Blob-backed files only drop their reference (collect_blob_garbage
+    removes the content); files stored before blobs are deleted once the batch commits.
+    With dry_run nothing is deleted and the counts say what would be.
+
+    progress, if given, is called with the running stats after every batch.
+    Returns the stats: batches, submissions, files, file_bytes, legacy_files and
+    rows deleted per model.
+    """
+    days = settings.DRAFT_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or settings.SUBMISSION_CLEANUP_BATCH_SIZE
+    pause = settings.SUBMISSION_CLEANUP_PAUSE_SECONDS if pause is None else pause
+
+    cutoff = timezone.now() - timedelta(days=days)
+    drafts = FormSubmission.objects.filter(status='draft', submitted_at__lt=cutoff)
+    stats = {'batches': 0, 'submissions': 0, 'files': 0, 'file_bytes': 0, 'legacy_files': 0, 'rows': {}}
+    started = time.monotonic()
+    last_id = 0
+
+    while True:
+        if stats['batches'] and pause:
+            time.sleep(pause)
+
+        submission_ids = list(
+            drafts.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not submission_ids:
+            break
+        last_id = submission_ids[-1]
+
+        with transaction.atomic():
+            if not dry_run:
+                # Lock the batch, dropping drafts submitted since they were listed
+                submission_ids = list(
+                    drafts.select_for_update().filter(id__in=submission_ids).values_list('id', flat=True)
+                )
+
+            files = FormFile.objects.filter(submission_id__in=submission_ids)
+            totals = files.aggregate(count=Count('id'), size=Sum('blob__size'))
+            legacy = list(files.filter(blob__isnull=True).values_list('file', flat=True))
+
+            if not dry_run:
+                _, rows = FormSubmission.objects.filter(id__in=submission_ids).delete()
+                for label, count in rows.items():
+                    stats['rows'][label] = stats['rows'].get(label, 0) + count
+                if legacy:
+                    storage = FormFile._meta.get_field('file').storage
+                    transaction.on_commit(lambda names=legacy: _delete_stored_files(storage, names))
+
+        stats['batches'] += 1
+        stats['submissions'] += len(submission_ids)
+        stats['files'] += totals['count']
+        stats['file_bytes'] += totals['size'] or 0
+        stats['legacy_files'] += len(legacy)
+        if progress:
+            progress(stats)
+
+    stats['seconds'] = round(time.monotonic() - started, 1)
+    logger.info(
+        f"{'Would delete' if dry_run else 'Deleted'} {stats['submissions']} drafts older than {days} days "
+        f"in {stats['batches']} batches ({stats['files']} files, {stats['legacy_files']} outside blob storage) "
+        f"in {stats['seconds']}s"
+    )
+    return stats
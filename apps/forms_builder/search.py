@@ -0,0 +1,290 @@
+# apps/forms_builder/search.py
+#
+# Full-text search over submission answers. The text, textarea and richtext
+# answers of each submission are tokenized into SearchPosting rows (term,
+# submission, frequency), rewritten whenever a save may have changed its data
+# (saves with update_fields leaving out data, such as workflow status and
+# assignee changes, keep them as they are); a query reads the postings of
+# its terms through the (term, submission) index, keeps submissions holding all
+# of them and ranks those by BM25. Terms are lowercased whole words, without
+# stemming; whether accents matter is up to the database collation.
+from collections import Counter
+import html
+import math
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.utils.html import escape, strip_tags
+
+from .models import FormField, FormSubmission, SearchDocument, SearchPosting
+
+SEARCHABLE_FIELD_TYPES = ('text', 'textarea', 'richtext')
+
+TOKEN_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64  # SearchPosting.term
+STOP_WORDS = frozenset({
+    'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it',
+    'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there', 'these',
+    'they', 'this', 'to', 'was', 'will', 'with',
+})
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STATS_CACHE_KEY = 'search:stats'
+TERM_CACHE_KEY = 'search:df:{}'
+
+
+def tokenize(text):
+    """Lowercased word terms of a text, stop words and out-of-range lengths dropped"""
+    return [
+        term for term in TOKEN_RE.findall(text.lower())
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in STOP_WORDS
+    ]
+
+
+def answer_text(field, raw):
+    """Plain text of an answer; richtext loses its markup"""
+    if raw is None:
+        return ''
+    if isinstance(raw, list):
+        return ' '.join(answer_text(field, item) for item in raw)
+    if isinstance(raw, dict):
+        return ''
+    text = str(raw)
+    if field.field_type == 'richtext':
+        text = html.unescape(strip_tags(text))
+    return text
+
+
+def get_searchable_fields(form_id):
+    return list(FormField.objects.filter(form_id=form_id, field_type__in=SEARCHABLE_FIELD_TYPES))
+
+
+def document_terms(submission, fields):
+    data = submission.data or {}
+    terms = Counter()
+    for field in fields:
+        terms.update(tokenize(answer_text(field, data.get(field.name))))
+    return terms
+
+
+def build_postings(submission, fields):
+    """(SearchDocument, [SearchPosting]) of a submission, (None, []) without searchable text"""
+    terms = document_terms(submission, fields)
+    if not terms:
+        return None, []
+    length = sum(terms.values())
+    document = SearchDocument(submission_id=submission.id, length=length)
+    postings = [
+        SearchPosting(term=term, submission_id=submission.id, frequency=frequency, length=length)
+        for term, frequency in terms.items()
+    ]
+    return document, postings
+
+
+def index_submission(submission, fields=None):
+    """Rewrite a submission's postings from its data, in the caller's transaction"""
+    if fields is None:
+        fields = get_searchable_fields(submission.form_id)
+    document, postings = build_postings(submission, fields)
+
+    with transaction.atomic():
+        SearchPosting.objects.filter(submission_id=submission.id).delete()
+        SearchDocument.objects.filter(submission_id=submission.id).delete()
+        if document:
+            document.save(force_insert=True)
+            SearchPosting.objects.bulk_create(postings)
+
+
+def reindex_submissions(form_id=None, batch_size=500, progress=None):
+    """
+    Rebuild the postings of every submission (of one form), in primary-key batches
+    of one transaction each. Returns (submissions processed, submissions indexed).
+    """
+    submissions = FormSubmission.objects.order_by('id').only('id', 'form_id', 'data')
+    if form_id:
+        submissions = submissions.filter(form_id=form_id)
+
+    fields_by_form = {}
+    last_id = 0
+    processed = indexed = 0
+    while True:
+        batch = list(submissions.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+
+        documents, postings = [], []
+        for submission in batch:
+            if submission.form_id not in fields_by_form:
+                fields_by_form[submission.form_id] = get_searchable_fields(submission.form_id)
+            document, document_postings = build_postings(submission, fields_by_form[submission.form_id])
+            if document:
+                documents.append(document)
+                postings += document_postings
+
+        with transaction.atomic():
+            ids = [submission.id for submission in batch]
+            SearchPosting.objects.filter(submission_id__in=ids).delete()
+            SearchDocument.objects.filter(submission_id__in=ids).delete()
+            SearchDocument.objects.bulk_create(documents)
+            SearchPosting.objects.bulk_create(postings, batch_size=1000)
+
+        processed += len(batch)
+        indexed += len(documents)
+        last_id = batch[-1].id
+        if progress:
+            progress(processed, indexed)
+    return processed, indexed
+
+
+def parse_query(query):
+    """Distinct terms of a search query, at most SEARCH_MAX_TERMS"""
+    terms = []
+    for term in tokenize(query or ''):
+        if term not in terms:
+            terms.append(term)
+    return terms[:settings.SEARCH_MAX_TERMS]
+
+
+def get_statistics(terms):
+    """
+    (indexed documents, average length, {term: document frequency}). Counts are
+    cached for SEARCH_STATS_TIMEOUT: BM25 weights barely move between refreshes
+    and counting millions of rows per query would cost more than the query.
+    """
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        documents = SearchDocument.objects.count()
+        total = SearchDocument.objects.aggregate(total=Sum('length'))['total'] or 0
+        stats = (documents, total / documents if documents else 0.0)
+        cache.set(STATS_CACHE_KEY, stats, settings.SEARCH_STATS_TIMEOUT)
+
+    keys = {TERM_CACHE_KEY.format(term): term for term in terms}
+    cached = cache.get_many(list(keys))
+    frequencies = {keys[key]: count for key, count in cached.items()}
+    missing = [term for term in terms if term not in frequencies]
+    if missing:
+        counted = dict(
+            SearchPosting.objects.filter(term__in=missing).values('term')
+            .annotate(count=Count('id')).values_list('term', 'count')
+        )
+        counted = {term: counted.get(term, 0) for term in missing}
+        cache.set_many({TERM_CACHE_KEY.format(term): count for term, count in counted.items()},
+                       settings.SEARCH_STATS_TIMEOUT)
+        frequencies.update(counted)
+    return stats[0], stats[1], frequencies
+
+
+def idf(documents, frequency):
+    return math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+
+
+def matching_postings(terms, frequencies=None):
+    """
+    Postings of submissions containing every term, grouped by submission. With
+    document frequencies at hand, candidates are first narrowed to the postings
+    of the rarest term so common terms are only read for those.
+    """
+    postings = SearchPosting.objects.filter(term__in=terms)
+    if frequencies and len(terms) > 1:
+        rarest = min(terms, key=lambda term: frequencies[term])
+        postings = postings.filter(
+            submission_id__in=SearchPosting.objects.filter(term=rarest).values('submission_id')
+        )
+    return postings.values('submission_id').annotate(matched=Count('id')).filter(matched=len(terms))
+
+
+def matching_submission_ids(query):
+    """Subquery of the ids of submissions containing every term of a query; None without terms"""
+    terms = parse_query(query)
+    if not terms:
+        return None
+    return matching_postings(terms).values('submission_id')
+
+
+def search_submissions(query, scope=None, form_id=None, limit=None):
+    """
+    [(submission id, score)] of the best BM25 matches for a query, among the
+    submissions matching the scope filter (a Q, see accessible_submissions_filter)
+    and of one form if given.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return []
+    limit = min(limit or settings.SEARCH_RESULTS_LIMIT, settings.SEARCH_MAX_RESULTS)
+
+    documents, average_length, frequencies = get_statistics(terms)
+    # Cached counts lag behind writes: a term or document newer than them still counts once
+    documents = max(documents, *frequencies.values(), 1)
+    average_length = average_length or 1.0
+
+    postings = matching_postings(terms, frequencies)
+    if scope is not None or form_id:
+        submissions = FormSubmission.objects.all()
+        if scope is not None:
+            submissions = submissions.filter(scope)
+        if form_id:
+            submissions = submissions.filter(form_id=form_id)
+        postings = postings.filter(submission_id__in=submissions.values('id'))
+
+    weight = Case(
+        *[When(term=term, then=Value(idf(documents, frequencies[term]))) for term in terms],
+        output_field=FloatField()
+    )
+    saturation = ExpressionWrapper(
+        F('frequency') * Value(K1 + 1) /
+        (F('frequency') + Value(K1 * (1 - B)) + Value(K1 * B / average_length) * F('length')),
+        output_field=FloatField()
+    )
+    ranked = postings.annotate(
+        score=Sum(ExpressionWrapper(weight * saturation, output_field=FloatField()))
+    ).order_by('-score', '-submission_id')[:limit]
+    return [(row['submission_id'], row['score']) for row in ranked]
+
+
+def highlight(text, terms, length=None):
+    """
+    An excerpt of text around the first term it contains, HTML-escaped, with the
+    terms wrapped in <mark>; None when it contains none.
+    """
+    length = length or settings.SEARCH_SNIPPET_LENGTH
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+    first = pattern.search(text)
+    if not first:
+        return None
+
+    start = max(0, first.start() - length // 3)
+    if start:
+        space = text.find(' ', start, first.start())
+        start = space + 1 if space != -1 else start
+    end = min(len(text), start + length)
+    if end < len(text):
+        space = text.rfind(' ', first.end(), end)
+        end = space if space != -1 else end
+    excerpt = text[start:end]
+
+    parts = []
+    position = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    return ('…' if start else '') + ''.join(parts) + ('…' if end < len(text) else '')
+
+
+def get_highlights(submission, fields, terms):
+    """[{'field', 'label', 'snippet'}] for the searchable answers containing a term"""
+    data = submission.data or {}
+    highlights = []
+    for field in fields:
+        snippet = highlight(answer_text(field, data.get(field.name)), terms)
+        if snippet:
+            highlights.append({'field': field.name, 'label': field.label, 'snippet': snippet})
+    return highlights
@@ -1,7 +1,14 @@
 # apps/forms_builder/serializers.py
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import FormTemplate, FormField, FormSubmission, FormFile, FormValidationRule
+from django.core.files.uploadedfile import UploadedFile
+from django.urls import reverse
+from .models import (FormTemplate, FormField, FormSubmission, FormFile, FormValidationRule, UploadSession,
+                     ArchivedSubmission)
+from .uploads import get_bindable_upload, bind_upload, UploadError
+from .payloads import extract_payloads, resolve_file_references, has_file_references
+from .archive import get_document
 from .validators import DynamicFieldValidator
 
 User = get_user_model()
@@ -36,7 +43,7 @@ class FormFieldSerializer(serializers.ModelSerializer):
             'required', 'order', 'default_value', 'min_value', 'max_value',
             'min_length', 'max_length', 'regex_pattern', 'choices',
             'lookup_model', 'lookup_field', 'nested_form', 'allow_multiple',
-            'show_if', 'width', 'css_class', 'validation_rules',
+            'show_if', 'width', 'css_class', 'indexed', 'validation_rules',
             'can_edit', 'can_view'
         ]
     
@@ -72,6 +79,7 @@ class FormSubmissionSerializer(serializers.ModelSerializer):
     form = FormTemplateSerializer(read_only=True)
     submitted_by = UserSerializer(read_only=True)
     assigned_to = UserSerializer(read_only=True)
+    data = serializers.SerializerMethodField()
     files = serializers.SerializerMethodField()
     workflow_status = serializers.SerializerMethodField()
     
@@ -84,15 +92,34 @@ class FormSubmissionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['submitted_at']
     
+    def _get_form_files(self, obj):
+        """The submission's FormFiles, loaded once for get_data and get_files"""
+        cache = self.__dict__.setdefault('_form_files', {})
+        if obj.pk not in cache:
+            cache[obj.pk] = list(obj.files.select_related('blob'))
+        return cache[obj.pk]
+    
+    def get_data(self, obj):
+        # Inline payloads were extracted at submit time; point their references at the files
+        if not has_file_references(obj.data):
+            return obj.data
+        files_by_sha256 = {file.blob.sha256: file for file in self._get_form_files(obj) if file.blob_id}
+        return resolve_file_references(obj.data, files_by_sha256)
+    
     def get_files(self, obj):
         return [
             {
                 'field_name': file.field_name,
-                'url': file.file.url,
-                'name': file.file.name.split('/')[-1],
-                'uploaded_at': file.uploaded_at
+                'url': file.download_url,
+                'name': file.name,
+                'uploaded_at': file.uploaded_at,
+                # Resized copies without EXIF; null until processed and for non-images
+                'thumbnail_url': file.thumbnail_url,
+                'web_url': file.web_url,
+                'width': file.blob.metadata.get('width') if file.blob_id else None,
+                'height': file.blob.metadata.get('height') if file.blob_id else None,
             }
-            for file in obj.files.all()
+            for file in self._get_form_files(obj)
         ]
     
     def get_workflow_status(self, obj):
@@ -108,6 +135,132 @@ class FormSubmissionSerializer(serializers.ModelSerializer):
         return None
 
 
+class ArchivedSubmissionSerializer(serializers.ModelSerializer):
+    """An archived submission in the shape of FormSubmissionSerializer, plus archived_at"""
+    form = FormTemplateSerializer(read_only=True)
+    submitted_by = UserSerializer(read_only=True)
+    assigned_to = UserSerializer(read_only=True)
+    data = serializers.SerializerMethodField()
+    current_step = serializers.SerializerMethodField()
+    files = serializers.SerializerMethodField()
+    workflow_status = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ArchivedSubmission
+        fields = [
+            'id', 'form', 'submitted_by', 'submitted_at', 'data',
+            'status', 'current_step', 'assigned_to', 'files',
+            'workflow_status', 'archived', 'archived_at'
+        ]
+    
+    def _get_archived_files(self, obj):
+        cache = self.__dict__.setdefault('_archived_files', {})
+        if obj.pk not in cache:
+            cache[obj.pk] = list(obj.files.select_related('blob'))
+        return cache[obj.pk]
+    
+    def get_data(self, obj):
+        data = get_document(obj)['data']
+        if not has_file_references(data):
+            return data
+        files_by_sha256 = {file.blob.sha256: file for file in self._get_archived_files(obj) if file.blob_id}
+        return resolve_file_references(data, files_by_sha256)
+    
+    def get_current_step(self, obj):
+        return get_document(obj)['current_step']
+    
+    def get_files(self, obj):
+        # Derivatives are not served for archived files
+        return [
+            {
+                'field_name': file.field_name,
+                'url': file.download_url,
+                'name': file.name,
+                'uploaded_at': file.uploaded_at,
+                'thumbnail_url': None,
+                'web_url': None,
+                'width': file.blob.metadata.get('width') if file.blob_id else None,
+                'height': file.blob.metadata.get('height') if file.blob_id else None,
+            }
+            for file in self._get_archived_files(obj)
+        ]
+    
+    def get_workflow_status(self, obj):
+        workflow = get_document(obj)['workflow']
+        if workflow is None:
+            return None
+        return {
+            'workflow': workflow['workflow'],
+            'current_step': workflow['current_step'],
+            'is_active': workflow['is_active'],
+            'started_at': workflow['started_at'],
+            'completed_at': workflow['completed_at']
+        }
+    
+    def get_archived(self, obj):
+        return True
+
+
+class UploadTokenMixin:
+    """
+    File field that also accepts the id of a finalized chunked upload, which
+    validates to its UploadSession
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs.pop('allow_blank', None)
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                return get_bindable_upload(
+                    self.context['request'].user, self.context['form'], self.field_name, data
+                )
+            except UploadError as e:
+                raise serializers.ValidationError(str(e))
+        return super().to_internal_value(data)
+
+
+class UploadFileField(UploadTokenMixin, serializers.FileField):
+    pass
+
+
+class UploadImageField(UploadTokenMixin, serializers.ImageField):
+    pass
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    form = serializers.UUIDField()
+    field_name = serializers.CharField(max_length=100)
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    content_type = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+    url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'field_name', 'filename', 'content_type', 'size', 'offset',
+            'chunk_size', 'status', 'sha256', 'url'
+        ]
+    
+    def get_chunk_size(self, obj):
+        return settings.CHUNKED_UPLOAD_CHUNK_SIZE
+    
+    def get_url(self, obj):
+        url = reverse('api_upload_session', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class FormSubmitSerializer(serializers.Serializer):
     """Serializer for form submission"""
     
@@ -154,9 +307,9 @@ class FormSubmitSerializer(serializers.Serializer):
                         **field_kwargs
                     )
                 elif field.field_type == 'file':
-                    serializer_field = serializers.FileField(**field_kwargs)
+                    serializer_field = UploadFileField(**field_kwargs)
                 elif field.field_type == 'image':
-                    serializer_field = serializers.ImageField(**field_kwargs)
+                    serializer_field = UploadImageField(**field_kwargs)
                 else:
                     serializer_field = serializers.CharField(**field_kwargs)
                 
@@ -204,12 +357,33 @@ class FormSubmitSerializer(serializers.Serializer):
         form = self.context.get('form')
         request = self.context.get('request')
         
+        # Files are stored as FormFiles; the submission data keeps their names
+        uploads = {}
+        data = dict(validated_data)
+        for field_name, value in validated_data.items():
+            if isinstance(value, UploadSession):
+                uploads[field_name] = value
+                data[field_name] = value.filename
+            elif isinstance(value, UploadedFile):
+                data[field_name] = value.name
+        
+        # Inline payloads (signature and image data URLs) become files too
+        data, payloads = extract_payloads(data)
+        
         submission = FormSubmission.objects.create(
             form=form,
             submitted_by=request.user,
-            data=validated_data,
+            data=data,
             status='pending'
         )
+        payloads.attach(submission)
+        
+        # Bound in the submission's transaction
+        for upload in uploads.values():
+            try:
+                bind_upload(upload, submission)
+            except UploadError as e:
+                raise serializers.ValidationError({upload.field_name: str(e)})
         
         return submission
 
@@ -7,16 +7,73 @@ from django.template.loader import render_to_string
 from .models import FormSubmission
 
 
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def cleanup_old_submissions(dry_run=False):
+    """Clean up old draft submissions, in batches"""
+    from .retention import delete_old_drafts
+    
+    stats = delete_old_drafts(dry_run=dry_run)
+    
+    return (f"{'Would delete' if dry_run else 'Deleted'} {stats['submissions']} old draft submissions "
+            f"in {stats['batches']} batches ({stats['files']} files)")
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def archive_submissions():
+    """Move old completed submissions into the compressed archive"""
+    from .archive import archive_submissions as archive
+    
+    stats = archive()
+    return f"Archived {stats['archived']} submissions in {stats['batches']} batches"
+
+
 @shared_task
-def cleanup_old_submissions():
-    """Clean up old draft submissions"""
-    cutoff_date = timezone.now() - timedelta(days=30)
-    deleted_count = FormSubmission.objects.filter(
-        status='draft',
-        submitted_at__lt=cutoff_date
-    ).delete()[0]
+def maintain_partitions():
+    """Add next months' partitions and drop emptied old ones"""
+    from django.db import connection
+    from .partitions import maintain_partitions as maintain
     
-    return f"Deleted {deleted_count} old draft submissions"
+    if connection.vendor != 'mysql':
+        return "Partitioning is only supported on MySQL"
+    results = maintain()
+    statements = sum(len(table_statements) for table_statements, _ in results.values())
+    return f"Ran {statements} partition statements on {len(results)} tables"
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def backfill_field_values(field_id):
+    """Project a newly indexed field over existing submissions (or drop an unindexed one's)"""
+    from .models import FormField
+    from .projections import backfill_field_values as backfill
+    
+    try:
+        field = FormField.objects.get(id=field_id)
+    except FormField.DoesNotExist:
+        return f"Field {field_id} not found"
+    
+    processed = backfill(field)
+    return f"Indexed {field.name} on {processed} submissions"
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Delete stored submit responses past their retention"""
+    from django.conf import settings
+    from .models import SubmissionIdempotencyKey
+    
+    cutoff_date = timezone.now() - timedelta(days=settings.IDEMPOTENCY_KEY_RETENTION_DAYS)
+    deleted_count = SubmissionIdempotencyKey.objects.filter(created_at__lt=cutoff_date).delete()[0]
+    
+    return f"Deleted {deleted_count} idempotency keys"
+
+
+@shared_task
+def fan_out_activity(activity, user_ids, group_ids, roles):
+    """Write an activity to the feeds of its recipients"""
+    from .activity import write_activity
+    
+    written = write_activity(activity, user_ids, group_ids, roles)
+    return f"Wrote activity to {written} feeds"
 
 
 @shared_task
@@ -47,7 +104,7 @@ def send_submission_notification(submission_id):
         return f"Submission {submission_id} not found"
 
 
-@shared_task
+@shared_task(acks_late=True)  # Not redelivered on worker loss: it sends email
 def generate_analytics_report():
     """Generate weekly analytics report"""
     from django.contrib.auth import get_user_model
@@ -97,17 +154,43 @@ def generate_analytics_report():
     return f"Analytics report sent to {admins.count()} administrators"
 
 
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def process_file_upload(file_ids):
+    """
+    Render thumbnails and web-sized copies of a batch of uploaded images, without
+    EXIF, and record their metadata. Accepts one FormFile id or a list.
+    """
+    from .processing import process_form_files
+    
+    if isinstance(file_ids, int):
+        file_ids = [file_ids]
+    
+    processed = process_form_files(file_ids)
+    return f"Processed {processed} images of {len(file_ids)} files"
+
+
 @shared_task
-def process_file_upload(file_id):
-    """Process uploaded files (e.g., virus scan, thumbnail generation)"""
-    from .models import FormFile
+def queue_pending_file_processing():
+    """Queue processing for files that missed it"""
+    from .processing import queue_pending_file_processing as queue_pending
     
-    try:
-        form_file = FormFile.objects.get(id=file_id)
-        
-        # Add file processing logic here
-        # For example: virus scanning, image optimization, etc.
-        
-        return f"Processed file {file_id}"
-    except FormFile.DoesNotExist:
-        return f"File {file_id} not found"
\ No newline at end of file
+    queued = queue_pending()
+    return f"Queued {queued} files for processing"
+
+
+@shared_task
+def purge_upload_sessions():
+    """Drop abandoned chunked uploads"""
+    from .uploads import purge_upload_sessions as purge
+    
+    purged = purge()
+    return f"Purged {purged} upload sessions"
+
+
+@shared_task
+def collect_blob_garbage():
+    """Remove stored files no FormFile or upload references any more"""
+    from .blobs import collect_blob_garbage as collect
+    
+    removed = collect()
+    return f"Removed {removed} unreferenced blobs"
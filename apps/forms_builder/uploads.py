@@ -0,0 +1,239 @@
+# apps/forms_builder/uploads.py
+from contextlib import contextmanager
+from datetime import timedelta
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .blobs import acquire_blob, release_blob, store_blob, attach_blob, LocalFile
+from .models import FormField, FormFile, UploadSession
+
+# Bytes read from the request (and from disk when hashing) at a time
+STREAM_BLOCK_SIZE = 64 * 1024
+
+FILE_FIELD_TYPES = ('file', 'image')
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadOffsetMismatch(UploadError):
+    """The chunk does not start where the upload left off; the client resumes from offset"""
+
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+class UploadInProgress(UploadError):
+    pass
+
+
+def get_part_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id.hex}.part')
+
+
+def user_holds_blob(user, sha256):
+    """
+    Whether a user already has the content with this SHA-256, through their own
+    uploads or the files of their submissions. Knowing a hash proves nothing, so
+    only then may an upload skip sending the bytes.
+    """
+    return (
+        UploadSession.objects.filter(user=user, blob__sha256=sha256).exists() or
+        FormFile.objects.filter(submission__submitted_by=user, blob__sha256=sha256).exists()
+    )
+
+
+def create_upload_session(user, form, field_name, filename, size, content_type='', sha256=None):
+    """
+    Start a chunked upload for a file field of a form. When the client sends the
+    file's SHA-256 and the user already holds that content, the session is
+    complete at once and no bytes need to be sent; anyone else uploads the bytes
+    and finalize_upload deduplicates them.
+    """
+    if not FormField.objects.filter(form=form, name=field_name, field_type__in=FILE_FIELD_TYPES).exists():
+        raise UploadError(f'{field_name} is not a file field of this form')
+    if size < 0 or size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(f'File size must be at most {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes')
+
+    session = UploadSession(
+        user=user,
+        form=form,
+        field_name=field_name,
+        filename=os.path.basename(filename)[:255],
+        content_type=content_type[:100],
+        size=size
+    )
+
+    sha256 = sha256.lower() if sha256 else None
+    blob = acquire_blob(sha256) if sha256 and user_holds_blob(user, sha256) else None
+    if blob is not None and blob.size != size:
+        release_blob(blob)
+        blob = None
+    if blob is not None:
+        session.status = 'complete'
+        session.received = size
+        session.sha256 = blob.sha256
+        session.blob = blob
+        session.save()
+        return session
+
+    session.save()
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(get_part_path(session), 'wb').close()
+    return session
+
+
+@contextmanager
+def upload_lock(session):
+    """Only one request writes to (or finalizes) a session at a time"""
+    lock_key = f'upload:lock:{session.id}'
+    if not cache.add(lock_key, 1, settings.CHUNKED_UPLOAD_LOCK_SECONDS):
+        raise UploadInProgress('Another request is writing to this upload')
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def write_chunk(session, offset, stream, length, checksum=None):
+    """
+    Append length bytes of stream at offset, hashing them as they are written.
+    A dropped connection keeps whatever arrived so the client can resume from the
+    returned offset, unless a chunk checksum was given, in which case the partial
+    chunk is discarded. Returns the new offset.
+    """
+    with upload_lock(session):
+        session.refresh_from_db(fields=['received', 'status'])
+        if session.status != 'uploading':
+            raise UploadError('Upload is already finalized')
+        if offset != session.received:
+            raise UploadOffsetMismatch(session.received)
+        if length > session.size - offset:
+            raise UploadError(f'Chunk runs past the declared size of {session.size} bytes')
+
+        hasher = hashlib.sha256()
+        written = 0
+        with open(get_part_path(session), 'r+b') as part:
+            # Drop bytes of an earlier attempt that were written but never recorded
+            part.truncate(offset)
+            part.seek(offset)
+            while written < length:
+                data = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+                if not data:
+                    break
+                part.write(data)
+                hasher.update(data)
+                written += len(data)
+
+            if checksum and (written < length or hasher.hexdigest() != checksum.lower()):
+                part.truncate(offset)
+                written = 0
+
+        if written:
+            updated = UploadSession.objects.filter(id=session.id, received=offset).update(
+                received=offset + written, updated_at=timezone.now()
+            )
+            if not updated:
+                raise UploadOffsetMismatch(UploadSession.objects.get(id=session.id).received)
+            session.received = offset + written
+
+        if checksum and written < length:
+            raise UploadError('Chunk checksum mismatch or incomplete chunk')
+
+    return session.received
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(STREAM_BLOCK_SIZE * 16), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def finalize_upload(session, sha256=None):
+    """
+    Check that every byte arrived and store the file as a blob. Hash state cannot
+    follow an upload across workers, so the whole file is hashed here from disk.
+    Content that is already stored is dropped instead of kept twice.
+    """
+    with upload_lock(session):
+        session.refresh_from_db()
+        if session.status == 'complete':
+            return session
+        if session.received != session.size:
+            raise UploadError(f'Upload is incomplete: {session.received} of {session.size} bytes')
+
+        path = get_part_path(session)
+        digest = hash_file(path)
+        if sha256 and sha256.lower() != digest:
+            raise UploadError('SHA-256 of the uploaded file does not match')
+
+        with open(path, 'rb') as part:
+            blob = store_blob(LocalFile(part, name=session.filename), sha256=digest,
+                              size=session.size, content_type=session.content_type)
+        if os.path.exists(path):
+            os.remove(path)
+
+        updated = UploadSession.objects.filter(id=session.id, status='uploading').update(
+            status='complete', sha256=digest, blob=blob, updated_at=timezone.now()
+        )
+        if not updated:
+            release_blob(blob)
+            raise UploadError('Upload was removed while finalizing')
+        session.status = 'complete'
+        session.sha256 = digest
+        session.blob = blob
+    return session
+
+
+def get_bindable_upload(user, form, field_name, token):
+    """The finalized upload a submission refers to by token"""
+    try:
+        session = UploadSession.objects.select_related('blob').get(
+            id=token, user=user, form=form, field_name=field_name
+        )
+    except (UploadSession.DoesNotExist, ValueError, TypeError, ValidationError):
+        raise UploadError('Unknown upload token')
+
+    if session.status != 'complete':
+        raise UploadError('Upload is not finalized')
+    return session
+
+
+def bind_upload(session, submission):
+    """
+    Attach a finalized upload to a submission, in the submission's transaction.
+    The FormFile takes a blob reference and the session (with its reference) goes.
+    """
+    form_file = attach_blob(session.blob, submission, session.field_name, session.filename)
+
+    deleted, _ = UploadSession.objects.filter(id=session.id, status='complete').delete()
+    if not deleted:
+        raise UploadError('Upload is already attached to a submission')
+    return form_file
+
+
+def discard_upload(session):
+    """Delete a session that will not be submitted, with its partial file"""
+    path = get_part_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+    session.delete()
+
+
+def purge_upload_sessions():
+    """Drop sessions left idle past CHUNKED_UPLOAD_EXPIRY_HOURS; returns how many"""
+    cutoff = timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+    purged = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard_upload(session)
+        purged += 1
+    return purged
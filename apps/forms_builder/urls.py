@@ -11,7 +11,11 @@ urlpatterns = [
     path('', views.form_list, name='form_list'),
     path('<uuid:form_id>/', views.form_render, name='form_render'),
     path('<uuid:form_id>/submit/', views.handle_form_submission, name='form_submit'),
+    path('<uuid:form_id>/export/', views.export_submissions, name='form_export'),
     path('submission/<uuid:submission_id>/', views.submission_detail, name='submission_detail'),
+    path('files/<int:file_id>/', views.download_form_file, name='form_file_download'),
+    path('files/<int:file_id>/<slug:derivative>/', views.download_form_file, name='form_file_derivative'),
+    path('archive/files/<int:file_id>/', views.download_archived_file, name='archived_file_download'),
     
     # Lookup endpoints
     path('lookup/<str:model_name>/', views.lookup_view, name='lookup'),
@@ -21,7 +25,12 @@ urlpatterns = [
         path('forms/', api_views.FormListAPI.as_view(), name='api_form_list'),
         path('forms/<uuid:form_id>/', api_views.FormDetailAPI.as_view(), name='api_form_detail'),
         path('forms/<uuid:form_id>/submit/', api_views.FormSubmitAPI.as_view(), name='api_form_submit'),
-        path('submissions/<uuid:submission_id>/', api_views.SubmissionDetailAPI.as_view(), name='api_submission_detail'),
+        path('forms/<uuid:form_id>/submissions/', api_views.FormSubmissionListAPI.as_view(), name='api_form_submissions'),
+        path('uploads/', api_views.UploadSessionCreateAPI.as_view(), name='api_upload_create'),
+        path('uploads/<uuid:upload_id>/', api_views.UploadSessionAPI.as_view(), name='api_upload_session'),
+        path('uploads/<uuid:upload_id>/finalize/', api_views.UploadFinalizeAPI.as_view(), name='api_upload_finalize'),
+        path('submissions/<int:submission_id>/', api_views.SubmissionDetailAPI.as_view(), name='api_submission_detail'),
+        path('submissions/search/', api_views.SubmissionSearchAPI.as_view(), name='api_submission_search'),
         path('dashboard/stats/', api_views.DashboardStatsAPI.as_view(), name='api_dashboard_stats'),
         path('dashboard/activity/', api_views.RecentActivityAPI.as_view(), name='api_recent_activity'),
         path('dashboard/charts/', api_views.ChartDataAPI.as_view(), name='api_chart_data'),
@@ -1,15 +1,27 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Q, Count
 from django.contrib import messages
-from django.core.paginator import Paginator
+from .pagination import KeysetPaginator
+from .activity import publish_submission_activity
 from django.urls import reverse
-from .models import FormTemplate, FormField, FormSubmission, FormFile
+from .models import FormTemplate, FormField, FormSubmission, FormFile, ArchivedSubmission, ArchivedFile
+from .uploads import get_bindable_upload, bind_upload, UploadError
+from .blobs import attach_file
+from .processing import queue_file_processing
+from .payloads import extract_payloads, is_file_reference, FILE_REFERENCE_KEY
+from .archive import get_document
+from .projections import parse_field_filters, apply_field_filters, matches_field_filters, FieldFilterError
+from .downloads import serve_file
+from .permissions import can_access_submission, can_access_archived_submission
 from .utils import FormRenderer, FormValidator
 from apps.workflow.utils import trigger_workflow
 from apps.users.models import User, Department, Project
+import csv
 import json
 
 @login_required
@@ -65,10 +77,9 @@ def form_list(request):
     # Get all categories for filter
     categories = FormTemplate.objects.filter(is_active=True).values_list('category', flat=True).distinct()
     
-    # Pagination
-    paginator = Paginator(forms, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (keyset on created_at, id)
+    paginator = KeysetPaginator(forms, 12, ordering=('-created_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'), with_estimate=True)
     
     context = {
         'page_obj': page_obj,
@@ -132,6 +143,7 @@ def handle_form_submission(request, form_template):
     """Handle form submission with validation"""
     form_data = {}
     files = {}
+    uploads = {}
     errors = {}
     
     # Validate each field
@@ -152,34 +164,48 @@ def handle_form_submission(request, form_template):
         else:
             form_data[field_name] = value
         
-        # Handle file uploads
+        # Handle file uploads: small files arrive inline, larger ones as chunked upload tokens
         if field.field_type in ['file', 'image']:
             file = request.FILES.get(field_name)
             if file:
                 files[field_name] = file
+            elif value and field_name not in errors:
+                try:
+                    uploads[field_name] = get_bindable_upload(request.user, form_template, field_name, value)
+                    form_data[field_name] = uploads[field_name].filename
+                except UploadError as e:
+                    errors[field_name] = str(e)
     
     if errors:
         messages.error(request, 'Please correct the errors below.')
         return JsonResponse({'success': False, 'errors': errors}, status=400)
     
-    # Create submission
-    submission = FormSubmission.objects.create(
-        form=form_template,
-        submitted_by=request.user,
-        data=form_data,
-        status='pending'
-    )
-    
-    # Save files
-    for field_name, file in files.items():
-        FormFile.objects.create(
-            submission=submission,
-            field_name=field_name,
-            file=file
-        )
+    try:
+        with transaction.atomic():
+            # Inline payloads (signature and image data URLs) are stored as files
+            form_data, payloads = extract_payloads(form_data)
+            
+            # Create submission
+            submission = FormSubmission.objects.create(
+                form=form_template,
+                submitted_by=request.user,
+                data=form_data,
+                status='pending'
+            )
+            payloads.attach(submission)
+            
+            # Save files
+            for field_name, file in files.items():
+                attach_file(submission, field_name, file)
+            for upload in uploads.values():
+                bind_upload(upload, submission)
+            queue_file_processing(submission)
+    except UploadError as e:
+        return JsonResponse({'success': False, 'errors': {'__all__': str(e)}}, status=400)
     
     # Trigger workflow
     trigger_workflow(submission)
+    publish_submission_activity(submission)
     
     messages.success(request, 'Form submitted successfully!')
     return JsonResponse({
@@ -287,9 +313,121 @@ def submission_detail(request, submission_id):
     context = {
         'submission': submission,
         'form_template': submission.form,
-        'files': submission.files.all(),
+        'files': submission.files.select_related('blob'),
         'workflow': getattr(submission, 'workflow_instance', None),
         'title': f'Submission - {submission.form.name}'
     }
     
-    return render(request, 'forms/submission_detail.html', context)
\ No newline at end of file
+    return render(request, 'forms/submission_detail.html', context)
+
+@login_required
+def download_form_file(request, file_id, derivative=None):
+    """Serve an uploaded file (or one of its resized copies) to users who may see its submission"""
+    form_file = get_object_or_404(
+        FormFile.objects.select_related('submission', 'blob'), id=file_id
+    )
+    if not can_access_submission(request.user, form_file.submission):
+        raise Http404('File not found')
+    
+    blob = form_file.blob
+    if derivative is not None:
+        stored = blob.derivatives.get(derivative) if blob else None
+        if stored is None:
+            raise Http404('File not found')
+        stem = form_file.name.rsplit('.', 1)[0]
+        return serve_file(
+            request, form_file.file.storage, stored['name'],
+            filename=f"{stem}-{derivative}.{stored['name'].rsplit('.', 1)[-1]}",
+            content_type=stored['content_type'],
+            etag=f"{blob.sha256}-{derivative}",
+            size=stored['size'],
+            last_modified=blob.processed_at
+        )
+    
+    if not form_file.file.name:
+        raise Http404('File not found')
+    return serve_file(
+        request, form_file.file.storage, form_file.file.name,
+        filename=form_file.name,
+        content_type=blob.content_type if blob else '',
+        # Blobs are content-addressed, so their hash is a strong validator
+        etag=blob.sha256 if blob else None,
+        size=blob.size if blob else None,
+        last_modified=form_file.uploaded_at,
+        as_attachment=request.GET.get('download') == '1'
+    )
+
+@login_required
+def download_archived_file(request, file_id):
+    """Serve a file of an archived submission"""
+    archived_file = get_object_or_404(
+        ArchivedFile.objects.select_related('archive', 'blob'), id=file_id
+    )
+    if not can_access_archived_submission(request.user, archived_file.archive):
+        raise Http404('File not found')
+    
+    blob = archived_file.blob
+    if not archived_file.file.name:
+        raise Http404('File not found')
+    return serve_file(
+        request, archived_file.file.storage, archived_file.file.name,
+        filename=archived_file.name,
+        content_type=blob.content_type if blob else '',
+        etag=blob.sha256 if blob else None,
+        size=blob.size if blob else None,
+        last_modified=archived_file.uploaded_at,
+        as_attachment=request.GET.get('download') == '1'
+    )
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line instead of buffering it"""
+    def write(self, value):
+        return value
+
+def _export_value(value):
+    if is_file_reference(value):
+        return value[FILE_REFERENCE_KEY]
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+@login_required
+def export_submissions(request, form_id):
+    """
+    CSV of every submission of a form, archived ones included, streamed row by row.
+    Takes the field.<name> filters of the submission list API.
+    """
+    form_template = get_object_or_404(FormTemplate, id=form_id)
+    if not (request.user.is_superuser or request.user == form_template.created_by or
+            request.user.has_perm('forms_builder.view_formsubmission')):
+        raise Http404('Form not found')
+    
+    try:
+        filters = parse_field_filters(form_template, request.GET)
+    except FieldFilterError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    field_names = list(form_template.fields.order_by('order').values_list('name', flat=True))
+    
+    def rows():
+        yield ['id', 'submitted_at', 'submitted_by', 'status', 'archived'] + field_names
+        live = apply_field_filters(FormSubmission.objects.filter(form=form_template), filters)
+        live = live.select_related('submitted_by').order_by('id').iterator(chunk_size=500)
+        for submission in live:
+            yield ([submission.id, submission.submitted_at.isoformat(), submission.submitted_by.username,
+                    submission.status, 0] +
+                   [_export_value(submission.data.get(name, '')) for name in field_names])
+        archived = (ArchivedSubmission.objects.filter(form=form_template).select_related('submitted_by')
+                    .order_by('id').iterator(chunk_size=500))
+        for archive in archived:
+            data = get_document(archive)['data']
+            # Archived rows have no projections; the filters are checked on the data
+            if filters and not matches_field_filters(data, filters):
+                continue
+            yield ([archive.id, archive.submitted_at.isoformat(), archive.submitted_by.username,
+                    archive.status, 1] +
+                   [_export_value(data.get(name, '')) for name in field_names])
+    
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows()), content_type='text/csv')
+    response['Content-Disposition'] = content_disposition_header(True, f'{form_template.name}-submissions.csv')
+    return response
@@ -0,0 +1,181 @@
+#
+# FILE: apps/workflow/graph.py
+# PURPOSE: Compiled, cached workflow graphs for in-memory step routing
+#
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional, Tuple
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Compiled graphs kept per process, keyed by (workflow id, workflow version)
+GRAPH_CACHE_SIZE = 256
+
+_graph_cache = OrderedDict()
+_graph_cache_lock = threading.Lock()
+
+
+def compile_condition(condition):
+    """Turn a step condition dict into a predicate over submission data"""
+    if not condition or 'field' not in condition or 'value' not in condition:
+        return lambda data: True
+
+    field_name = condition['field']
+    expected_value = condition['value']
+    operator = condition.get('operator', 'equals')
+
+    if operator == 'equals':
+        expected = str(expected_value)
+        test = lambda actual: str(actual) == expected
+    elif operator == 'not_equals':
+        expected = str(expected_value)
+        test = lambda actual: str(actual) != expected
+    elif operator == 'greater_than':
+        test = lambda actual: float(actual) > float(expected_value)
+    elif operator == 'less_than':
+        test = lambda actual: float(actual) < float(expected_value)
+    elif operator == 'contains':
+        test = lambda actual: expected_value in str(actual)
+    else:
+        return lambda data: True
+
+    def predicate(data):
+        try:
+            return test(data.get(field_name))
+        except Exception as e:
+            logger.error(f"Error evaluating step conditions: {str(e)}")
+            return True  # Default to allowing step
+
+    predicate.field = field_name
+    predicate.spec = (field_name, operator, repr(expected_value))  # Identifies equal conditions
+    return predicate
+
+
+@dataclass(frozen=True)
+class CompiledStep:
+    id: int
+    name: str
+    step_type: str
+    order: int
+    assigned_to_user_id: Optional[object]
+    assigned_to_group_id: Optional[int]
+    assigned_to_role: str
+    auto_approve_after: Optional[int]
+    require_all_approvals: bool
+    condition: Callable
+    # action id -> next step id, only for actions that name a next step
+    edges: Mapping
+
+    def applies_to(self, data):
+        return self.condition(data)
+
+
+@dataclass(frozen=True)
+class CompiledWorkflow:
+    id: int
+    version: int
+    steps: Tuple[CompiledStep, ...]
+    by_id: Mapping
+
+    def step(self, step_id):
+        return self.by_id.get(step_id)
+
+    def first_step(self, data):
+        """First step of the workflow whose conditions the data meets"""
+        candidates = [step for step in self.steps if step.order >= 0]
+        if not candidates:
+            return None
+
+        if candidates[0].applies_to(data):
+            return candidates[0]
+        return self.next_eligible_step(0, data)
+
+    def next_eligible_step(self, current_order, data):
+        """First step after current_order whose conditions the data meets"""
+        for step in self.steps:
+            if step.order > current_order and step.applies_to(data):
+                return step
+        return None
+
+    def next_step(self, current_step_id, action_id, data):
+        """Step an action on the current step leads to, None when the workflow ends"""
+        current = self.by_id[current_step_id]
+
+        # Explicit action target wins over step order
+        target_id = current.edges.get(action_id)
+        if target_id is not None:
+            return self.by_id.get(target_id)
+
+        return self.next_eligible_step(current.order, data)
+
+
+def compile_workflow(workflow):
+    """Build the immutable routing graph of a WorkflowTemplate (two queries)"""
+    from .models import WorkflowAction
+
+    steps = list(workflow.steps.order_by('order', 'id'))
+
+    edges = {step.id: {} for step in steps}
+    actions = WorkflowAction.objects.filter(
+        step__workflow=workflow,
+        next_step__isnull=False
+    ).values_list('step_id', 'id', 'next_step_id')
+    for step_id, action_id, next_step_id in actions:
+        edges[step_id][action_id] = next_step_id
+
+    compiled_steps = tuple(
+        CompiledStep(
+            id=step.id,
+            name=step.name,
+            step_type=step.step_type,
+            order=step.order,
+            assigned_to_user_id=step.assigned_to_user_id,
+            assigned_to_group_id=step.assigned_to_group_id,
+            assigned_to_role=step.assigned_to_role,
+            auto_approve_after=step.auto_approve_after,
+            require_all_approvals=step.require_all_approvals,
+            condition=compile_condition(step.condition),
+            edges=MappingProxyType(edges[step.id]),
+        )
+        for step in steps
+    )
+
+    return CompiledWorkflow(
+        id=workflow.id,
+        version=workflow.version,
+        steps=compiled_steps,
+        by_id=MappingProxyType({step.id: step for step in compiled_steps}),
+    )
+
+
+def get_compiled_workflow(workflow):
+    """Return the cached graph for the workflow's current version, compiling on a miss"""
+    key = (workflow.id, workflow.version)
+
+    with _graph_cache_lock:
+        graph = _graph_cache.get(key)
+        if graph is not None:
+            _graph_cache.move_to_end(key)
+            return graph
+
+    graph = compile_workflow(workflow)
+
+    with _graph_cache_lock:
+        # Older versions of this workflow can never be requested again
+        for stale_key in [k for k in _graph_cache if k[0] == workflow.id and k[1] < workflow.version]:
+            del _graph_cache[stale_key]
+
+        _graph_cache[key] = graph
+        while len(_graph_cache) > GRAPH_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+
+    return graph
+
+
+def clear_graph_cache():
+    with _graph_cache_lock:
+        _graph_cache.clear()
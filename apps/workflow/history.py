@@ -0,0 +1,191 @@
+#
+# FILE: apps/workflow/history.py
+# PURPOSE: Delta-encoded workflow history with periodic full snapshots
+#
+
+import copy
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import WorkflowHistory
+
+# Patches are JSON Patch (RFC 6902) operation lists limited to add / remove / replace.
+# Lists are compared as whole values: a changed list is a single replace.
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(source, target, path=''):
+    """Operations turning source into target"""
+    if source == target:
+        return []
+
+    if not (isinstance(source, dict) and isinstance(target, dict)):
+        return [{'op': 'replace', 'path': path, 'value': target}]
+
+    operations = []
+    for key, value in source.items():
+        key_path = f'{path}/{_escape(key)}'
+        if key not in target:
+            operations.append({'op': 'remove', 'path': key_path})
+        else:
+            operations.extend(make_patch(value, target[key], key_path))
+
+    for key, value in target.items():
+        if key not in source:
+            operations.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+
+    return operations
+
+
+def apply_patch(document, operations):
+    """Return a copy of document with the operations applied"""
+    document = copy.deepcopy(document)
+
+    for operation in operations:
+        if operation['path'] == '':
+            document = copy.deepcopy(operation['value'])
+            continue
+
+        *parents, last = [_unescape(token) for token in operation['path'].split('/')[1:]]
+        container = document
+        for token in parents:
+            container = container[token]
+
+        if operation['op'] == 'remove':
+            container.pop(last, None)
+        else:
+            container[last] = copy.deepcopy(operation['value'])
+
+    return document
+
+
+def get_snapshot_interval():
+    return getattr(settings, 'WORKFLOW_HISTORY_SNAPSHOT_INTERVAL', 20)
+
+
+def _is_full(entry):
+    return entry.snapshot is not None or entry.data_after is not None
+
+
+def _replay(entries):
+    """
+    Walk entries (oldest first, the first one a full entry) and yield
+    (entry, data_before, data_after) for each of them.
+    """
+    data_after = None
+    for entry in entries:
+        if entry.data_after is not None:
+            # Legacy row holding full copies
+            data_before, data_after = entry.data_before or {}, entry.data_after
+        else:
+            if entry.snapshot is not None:
+                data_before = entry.snapshot
+            else:
+                data_before = apply_patch(data_after, entry.before_patch)
+            data_after = apply_patch(data_before, entry.data_patch)
+        yield entry, data_before, data_after
+
+
+def _entries_since_snapshot(instance_id, up_to_id=None):
+    """History rows of an instance from the latest full entry on (two queries)"""
+    entries = WorkflowHistory.objects.filter(instance_id=instance_id)
+    if up_to_id is not None:
+        entries = entries.filter(id__lte=up_to_id)
+
+    start_id = entries.filter(
+        Q(snapshot__isnull=False) | Q(data_after__isnull=False)
+    ).order_by('-id').values_list('id', flat=True).first()
+    if start_id is None:
+        return []
+
+    return list(
+        entries.filter(id__gte=start_id).order_by('id').only(
+            'id', 'snapshot', 'before_patch', 'data_patch', 'data_before', 'data_after'
+        )
+    )
+
+
+def build_history(instance, step, action, actor, comment, data_before, data_after):
+    """
+    Build an unsaved history entry storing only the changes since the previous
+    entry and the changes made by this action; every snapshot interval entries
+    (and for the first one) the full data is stored instead.
+    """
+    entry = WorkflowHistory(
+        instance=instance,
+        step=step,
+        action=action,
+        actor=actor,
+        comment=comment,
+        data_before=None,
+        data_after=None,
+        data_patch=make_patch(data_before, data_after),
+    )
+
+    chain = _entries_since_snapshot(instance.id)
+    if not chain or len(chain) >= get_snapshot_interval():
+        entry.snapshot = data_before
+    else:
+        *_, (_, _, previous_after) = _replay(chain)
+        entry.before_patch = make_patch(previous_after, data_before)
+
+    return entry
+
+
+def record_history(instance, step, action, actor, comment, data_before, data_after):
+    """Create a delta-encoded history entry"""
+    entry = build_history(instance, step, action, actor, comment, data_before, data_after)
+    entry.save()
+    return entry
+
+
+def get_history_data(entry):
+    """Rebuild (data_before, data_after) at a history entry"""
+    if entry.data_after is not None:
+        return entry.data_before or {}, entry.data_after
+
+    chain = _entries_since_snapshot(entry.instance_id, up_to_id=entry.id)
+    if not chain:
+        return {}, {}
+
+    *_, (_, data_before, data_after) = _replay(chain)
+    return data_before, data_after
+
+
+def compact_instance_history(instance_id):
+    """
+    Re-encode the history of an instance as snapshots and patches.
+    Returns the rows to save with bulk_update.
+    """
+    entries = list(WorkflowHistory.objects.filter(instance_id=instance_id).order_by('id'))
+    if not entries or not _is_full(entries[0]):
+        return []
+
+    interval = get_snapshot_interval()
+    previous_after = None
+    since_snapshot = 0
+
+    for entry, data_before, data_after in list(_replay(entries)):
+        entry.data_patch = make_patch(data_before, data_after)
+        if previous_after is None or since_snapshot >= interval:
+            entry.snapshot = data_before
+            entry.before_patch = []
+            since_snapshot = 0
+        else:
+            entry.snapshot = None
+            entry.before_patch = make_patch(previous_after, data_before)
+
+        entry.data_before = None
+        entry.data_after = None
+        previous_after = data_after
+        since_snapshot += 1
+
+    return entries
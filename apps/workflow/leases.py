@@ -0,0 +1,159 @@
+#
+# FILE: apps/workflow/leases.py
+# PURPOSE: Expiring leases so only one worker runs a periodic scan (or scan shard) at a time
+#
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RedisLeaseBackend:
+    """Leases as Redis keys set with NX and a millisecond expiry"""
+
+    # Only the holder (matching token) may release or extend a lease
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    EXTEND_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+        self._extend = client.register_script(self.EXTEND_SCRIPT)
+
+    def acquire(self, name, token, ttl):
+        return bool(self.client.set(self.prefix + name, token, nx=True, px=int(ttl * 1000)))
+
+    def release(self, name, token):
+        return bool(self._release(keys=[self.prefix + name], args=[token]))
+
+    def extend(self, name, token, ttl):
+        return bool(self._extend(keys=[self.prefix + name], args=[token, int(ttl * 1000)]))
+
+    def is_held(self, name):
+        return bool(self.client.exists(self.prefix + name))
+
+
+class InMemoryLeaseBackend:
+    """Process-local stand-in for RedisLeaseBackend (development and tests)"""
+
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _current(self, name):
+        lease = self._leases.get(name)
+        if lease and lease[1] <= time.monotonic():
+            del self._leases[name]
+            return None
+        return lease
+
+    def acquire(self, name, token, ttl):
+        with self._lock:
+            if self._current(name):
+                return False
+            self._leases[name] = (token, time.monotonic() + ttl)
+            return True
+
+    def release(self, name, token):
+        with self._lock:
+            lease = self._current(name)
+            if lease and lease[0] == token:
+                del self._leases[name]
+                return True
+            return False
+
+    def extend(self, name, token, ttl):
+        with self._lock:
+            lease = self._current(name)
+            if lease and lease[0] == token:
+                self._leases[name] = (token, time.monotonic() + ttl)
+                return True
+            return False
+
+    def is_held(self, name):
+        with self._lock:
+            return self._current(name) is not None
+
+
+class Lease:
+    """A held lease; extend() it between batches of long work"""
+
+    def __init__(self, backend, name, token, ttl):
+        self.backend = backend
+        self.name = name
+        self.token = token
+        self.ttl = ttl
+
+    def extend(self):
+        """Push the expiry out again; False if the lease expired and someone else took it"""
+        extended = self.backend.extend(self.name, self.token, self.ttl)
+        if not extended:
+            logger.warning(f"Lost lease {self.name}")
+        return extended
+
+    def release(self):
+        return self.backend.release(self.name, self.token)
+
+
+_lease_backend = None
+
+
+def get_lease_backend():
+    """Return the configured lease backend (WORKFLOW_LEASE_BACKEND = 'redis' or 'memory')"""
+    global _lease_backend
+
+    if _lease_backend is None:
+        backend_name = getattr(settings, 'WORKFLOW_LEASE_BACKEND', 'redis')
+        if backend_name == 'memory':
+            _lease_backend = InMemoryLeaseBackend()
+        else:
+            import redis
+            _lease_backend = RedisLeaseBackend(redis.Redis.from_url(settings.REDIS_URL), 'workflow:lease:')
+
+    return _lease_backend
+
+
+def acquire_lease(name, ttl):
+    """Take the lease if nobody holds it; returns a Lease or None"""
+    backend = get_lease_backend()
+    token = uuid.uuid4().hex
+    if backend.acquire(name, token, ttl):
+        return Lease(backend, name, token, ttl)
+    return None
+
+
+@contextmanager
+def hold_lease(name, ttl, release=True):
+    """
+    Run a block under a lease. Yields the Lease, or None when someone else holds it.
+    With release=False the lease is left to expire, which keeps the block from running
+    again within ttl.
+    """
+    lease = acquire_lease(name, ttl)
+    try:
+        yield lease
+    finally:
+        if lease and release:
+            lease.release()
+
+
+def is_lease_held(name):
+    return get_lease_backend().is_held(name)
@@ -0,0 +1,83 @@
+# apps/workflow/management/commands/backfill_step_deadlines.py
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from apps.workflow.models import WorkflowInstance, WorkflowHistory, StepInterval
+from apps.workflow.timers import get_timer_service, TIMER_AUTO_APPROVE
+from apps.workflow.utils import get_auto_approve_due_at
+
+
+class Command(BaseCommand):
+    help = ('Stamp the auto-approve deadline of active instances that entered a timed step before '
+            'deadlines were recorded, so auto_approve_workflows and the timers pick them up')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the instances that would get a deadline')
+
+    def get_entered_at(self, instance):
+        """
+        When the instance entered its current step: step_entered_at when recorded,
+        else the open interval of the step, its latest history entry or its start
+        """
+        if instance.step_entered_at:
+            return instance.step_entered_at
+        interval = StepInterval.objects.filter(
+            instance_id=instance.id, step_id=instance.current_step_id, exited_at__isnull=True
+        ).aggregate(entered_at=Max('entered_at'))['entered_at']
+        if interval:
+            return interval
+        history = WorkflowHistory.objects.filter(
+            instance_id=instance.id
+        ).aggregate(timestamp=Max('timestamp'))['timestamp']
+        return history or instance.started_at
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        stamped = 0
+
+        while True:
+            # Steps without an approve action are left alone: auto_approve_instance clears their deadline
+            instances = list(
+                WorkflowInstance.objects.filter(
+                    id__gt=last_id,
+                    is_active=True,
+                    auto_approve_due_at__isnull=True,
+                    current_step__auto_approve_after__gt=0,
+                    current_step__actions__action_type='approve'
+                ).select_related('current_step').distinct().order_by('id')[:batch_size]
+            )
+            if not instances:
+                break
+
+            for instance in instances:
+                entered_at = self.get_entered_at(instance)
+                due_at = get_auto_approve_due_at(instance.current_step, entered_at)
+                if options['dry_run']:
+                    stamped += 1
+                    continue
+
+                # Only if the instance is still on that step without a deadline
+                updated = WorkflowInstance.objects.filter(
+                    id=instance.id,
+                    current_step_id=instance.current_step_id,
+                    auto_approve_due_at__isnull=True
+                ).update(step_entered_at=entered_at, auto_approve_due_at=due_at)
+                if updated:
+                    stamped += 1
+                    try:
+                        get_timer_service().schedule(
+                            instance.id, instance.current_step_id, TIMER_AUTO_APPROVE, due_at
+                        )
+                    except Exception as e:
+                        # The auto_approve_workflows sweep picks the deadline up regardless
+                        self.stderr.write(f'Could not schedule timer for instance {instance.id}: {e}')
+
+            last_id = instances[-1].id
+            self.stdout.write(f'{stamped} deadlines {"to stamp" if options["dry_run"] else "stamped"}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {stamped} active instances {"would get" if options["dry_run"] else "got"} an auto-approve deadline'
+        ))
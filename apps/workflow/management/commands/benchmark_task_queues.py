@@ -0,0 +1,54 @@
+# apps/workflow/management/commands/benchmark_task_queues.py
+import statistics
+import time
+
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.workflow.tasks import notification_latency_probe, heavy_export_probe
+
+
+class Command(BaseCommand):
+    help = ('Measure notification latency while heavy export tasks run. Start the workers first, '
+            'e.g. the "notifications" and "reports" WORKER_PROFILES, or one worker on all queues.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--heavy-tasks', type=int, default=8,
+                            help='Heavy export tasks queued before probing')
+        parser.add_argument('--heavy-seconds', type=float, default=20.0,
+                            help='CPU time each heavy task burns')
+        parser.add_argument('--probes', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=0.2,
+                            help='Seconds between probes')
+        parser.add_argument('--single-queue', action='store_true',
+                            help='Send everything to the workflow queue, as before dedicated queues')
+        parser.add_argument('--timeout', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        queue_options = {'queue': 'workflow'} if options['single_queue'] else {}
+
+        for _ in range(options['heavy_tasks']):
+            heavy_export_probe.apply_async(args=[options['heavy_seconds']], **queue_options)
+
+        probes = []
+        for _ in range(options['probes']):
+            probes.append(notification_latency_probe.apply_async(args=[time.time()], **queue_options))
+            time.sleep(options['interval'])
+
+        latencies = []
+        deadline = time.monotonic() + options['timeout']
+        for probe in probes:
+            try:
+                latencies.append(probe.get(timeout=max(deadline - time.monotonic(), 0.1)))
+            except CeleryTimeoutError:
+                raise CommandError(f"Only {len(latencies)} of {len(probes)} probes finished within "
+                                   f"{options['timeout']}s; are workers consuming the queues?")
+
+        latencies.sort()
+        percentile = lambda p: latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)]
+        mode = 'single queue' if options['single_queue'] else 'dedicated queues'
+        self.stdout.write(
+            f"Notification latency with {options['heavy_tasks']} heavy tasks ({mode}): "
+            f"median {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {percentile(95) * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms"
+        )
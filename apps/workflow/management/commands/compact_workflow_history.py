@@ -0,0 +1,45 @@
+# apps/workflow/management/commands/compact_workflow_history.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.workflow.history import compact_instance_history
+from apps.workflow.models import WorkflowHistory
+
+
+class Command(BaseCommand):
+    help = 'Re-encode workflow history rows holding full data copies as snapshots and patches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Instances compacted per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_instance_id = 0
+        instances_done = rows_done = 0
+
+        while True:
+            instance_ids = list(
+                WorkflowHistory.objects.filter(
+                    instance_id__gt=last_instance_id,
+                    data_after__isnull=False
+                ).order_by('instance_id').values_list('instance_id', flat=True).distinct()[:batch_size]
+            )
+            if not instance_ids:
+                break
+
+            with transaction.atomic():
+                for instance_id in instance_ids:
+                    entries = compact_instance_history(instance_id)
+                    WorkflowHistory.objects.bulk_update(
+                        entries,
+                        ['snapshot', 'before_patch', 'data_patch', 'data_before', 'data_after'],
+                        batch_size=200
+                    )
+                    rows_done += len(entries)
+
+            instances_done += len(instance_ids)
+            last_instance_id = instance_ids[-1]
+            self.stdout.write(f'Compacted {rows_done} history rows of {instances_done} instances')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {instances_done} instances, {rows_done} rows'))
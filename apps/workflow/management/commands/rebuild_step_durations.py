@@ -0,0 +1,46 @@
+# apps/workflow/management/commands/rebuild_step_durations.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.workflow.metrics import duration_bucket
+from apps.workflow.models import StepInterval, StepDurationBucket
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the step duration histograms from closed step intervals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counts = {}
+        last_id = 0
+        scanned = 0
+
+        while True:
+            intervals = list(
+                StepInterval.objects.filter(
+                    id__gt=last_id,
+                    exited_at__isnull=False
+                ).order_by('id').values_list('id', 'workflow_id', 'step_id', 'entered_at', 'exited_at')[:batch_size]
+            )
+            if not intervals:
+                break
+
+            for _, workflow_id, step_id, entered_at, exited_at in intervals:
+                key = (workflow_id, step_id, duration_bucket((exited_at - entered_at).total_seconds()))
+                counts[key] = counts.get(key, 0) + 1
+
+            scanned += len(intervals)
+            last_id = intervals[-1][0]
+            self.stdout.write(f'Scanned {scanned} intervals')
+
+        with transaction.atomic():
+            StepDurationBucket.objects.all().delete()
+            StepDurationBucket.objects.bulk_create([
+                StepDurationBucket(workflow_id=workflow_id, step_id=step_id, bucket=bucket, count=count)
+                for (workflow_id, step_id, bucket), count in counts.items()
+            ], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(counts)} buckets from {scanned} intervals'))
@@ -0,0 +1,40 @@
+# apps/workflow/management/commands/rebuild_work_items.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.workflow.models import WorkflowInstance, WorkItem
+from apps.workflow.utils import open_work_items
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the open approval inbox entries of all active workflow instances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        rebuilt = 0
+
+        while True:
+            instances = list(
+                WorkflowInstance.objects.filter(
+                    id__gt=last_id,
+                    is_active=True,
+                    current_step__isnull=False
+                ).select_related('current_step').order_by('id')[:batch_size]
+            )
+            if not instances:
+                break
+
+            with transaction.atomic():
+                WorkItem.objects.filter(instance__in=instances, status='open').delete()
+                for instance in instances:
+                    open_work_items(instance, instance.current_step)
+
+            rebuilt += len(instances)
+            last_id = instances[-1].id
+            self.stdout.write(f'Rebuilt inbox entries for {rebuilt} instances')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {rebuilt} active instances'))
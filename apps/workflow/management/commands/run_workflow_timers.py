@@ -0,0 +1,20 @@
+# apps/workflow/management/commands/run_workflow_timers.py
+from django.core.management.base import BaseCommand
+from apps.workflow.timers import run_poller
+
+
+class Command(BaseCommand):
+    help = 'Run a standalone poller that fires due workflow timers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Timers popped per batch')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Polling workflow timers every {options['interval']}s")
+        try:
+            run_poller(interval=options['interval'], batch_size=options['batch_size'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Timer poller stopped'))
@@ -0,0 +1,111 @@
+# apps/workflow/management/commands/stress_workflow_transitions.py
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.users.models import User
+from apps.forms_builder.models import FormTemplate, FormSubmission
+from apps.workflow.models import WorkflowTemplate, WorkflowStep, WorkflowAction, WorkflowInstance
+from apps.workflow.utils import trigger_workflow, handle_workflow_action
+
+
+class Command(BaseCommand):
+    help = ('Concurrency stress test: many threads approve the same workflow instance at once '
+            'and exactly one approval per step may win')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32,
+                            help='Concurrent approvers per step')
+        parser.add_argument('--steps', type=int, default=3,
+                            help='Approval steps in the throwaway workflow')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated fixture data')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite serializes writers; run this against MySQL')
+
+        threads = options['threads']
+        user, form, steps = self._create_fixture(options['steps'])
+
+        try:
+            submission = FormSubmission.objects.create(form=form, submitted_by=user, data={}, status='pending')
+            instance = trigger_workflow(submission)
+            if not instance:
+                raise CommandError('Workflow did not start')
+
+            for step in steps:
+                approve = step.actions.get(action_type='approve')
+                results = self._hammer(instance.id, approve, user, threads)
+
+                won = sum(1 for r in results if r['success'])
+                conflicts = sum(1 for r in results if r.get('conflict'))
+                errors = [r['error'] for r in results if not r['success'] and not r.get('conflict')]
+
+                self.stdout.write(f"{step.name}: {won} won, {conflicts} conflicts, {len(errors)} errors")
+                if won != 1 or conflicts != threads - 1:
+                    raise CommandError(f"Expected exactly one winner on {step.name}; errors: {errors[:3]}")
+
+            instance.refresh_from_db()
+            if instance.is_active or instance.version != len(steps) + 1:
+                raise CommandError(
+                    f"Instance ended active={instance.is_active} version={instance.version}, "
+                    f"expected completed at version {len(steps) + 1}"
+                )
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Every step advanced exactly once under {threads} concurrent approvers"
+            ))
+        finally:
+            if not options['keep']:
+                form.delete()
+                user.delete()
+
+    def _create_fixture(self, step_count):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username=f'stress-{tag}', email='', is_superuser=True)
+        form = FormTemplate.objects.create(name=f'Stress test {tag}', created_by=user)
+        workflow = WorkflowTemplate.objects.create(name=f'Stress test {tag}', form=form)
+
+        steps = []
+        for order in range(1, step_count + 1):
+            step = WorkflowStep.objects.create(
+                workflow=workflow,
+                name=f'Step {order}',
+                step_type='approval',
+                order=order,
+                assigned_to_user=user
+            )
+            WorkflowAction.objects.create(step=step, action_type='approve', name='Approve')
+            steps.append(step)
+
+        return user, form, steps
+
+    def _hammer(self, instance_id, action, user, threads):
+        barrier = threading.Barrier(threads)
+        results = []
+        lock = threading.Lock()
+
+        def approve():
+            try:
+                # Every thread loads its own copy, like concurrent requests do
+                instance = WorkflowInstance.objects.select_related('workflow', 'submission').get(id=instance_id)
+                barrier.wait()
+                result = handle_workflow_action(instance, action, user, comment='stress test')
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            finally:
+                connection.close()
+
+            with lock:
+                results.append(result)
+
+        workers = [threading.Thread(target=approve) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return results
@@ -0,0 +1,115 @@
+#
+# FILE: apps/workflow/metrics.py
+# PURPOSE: Step intervals and incrementally maintained step-duration percentiles
+#
+
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import F
+import logging
+import math
+
+from .models import StepInterval, StepDurationBucket
+
+logger = logging.getLogger(__name__)
+
+# Log-scale buckets about 19% wide: bucket 0 is [0s, 1s), bucket k is [BASE^(k-1), BASE^k)
+BUCKET_BASE = 2 ** 0.25
+MAX_BUCKET = 160
+
+PERCENTILES = (50, 90, 95, 99)
+STATS_CACHE_TIMEOUT = 300  # Seconds
+
+
+def duration_bucket(seconds):
+    if seconds < 1:
+        return 0
+    return min(int(math.log(seconds, BUCKET_BASE)) + 1, MAX_BUCKET)
+
+
+def bucket_upper_bound(bucket):
+    return BUCKET_BASE ** bucket
+
+
+def open_interval(instance, step, entered_at):
+    StepInterval.objects.create(
+        instance_id=instance.id,
+        workflow_id=instance.workflow_id,
+        step_id=step.id,
+        entered_at=entered_at
+    )
+
+
+def close_interval(instance, step_id, entered_at, exited_at, actor=None, outcome=''):
+    """Close the open interval of an instance and count its duration once committed"""
+    StepInterval.objects.filter(instance_id=instance.id, exited_at__isnull=True).update(
+        exited_at=exited_at,
+        actor=actor,
+        outcome=outcome
+    )
+
+    if entered_at:
+        seconds = (exited_at - entered_at).total_seconds()
+        workflow_id = instance.workflow_id
+        transaction.on_commit(lambda: record_step_duration(workflow_id, step_id, seconds))
+
+
+def record_step_duration(workflow_id, step_id, seconds):
+    """Add one duration to the histogram of a step"""
+    bucket = duration_bucket(seconds)
+    try:
+        updated = StepDurationBucket.objects.filter(step_id=step_id, bucket=bucket).update(count=F('count') + 1)
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                StepDurationBucket.objects.create(workflow_id=workflow_id, step_id=step_id, bucket=bucket, count=1)
+        except IntegrityError:
+            # Created concurrently
+            StepDurationBucket.objects.filter(step_id=step_id, bucket=bucket).update(count=F('count') + 1)
+
+    except Exception as e:
+        logger.error(f"Error recording duration of step {step_id}: {str(e)}")
+
+
+def percentiles_from_buckets(counts):
+    """Percentile durations in seconds from {bucket: count}; upper bucket bounds, so never understated"""
+    total = sum(counts.values())
+    stats = {'count': total}
+
+    running = 0
+    targets = [(p, math.ceil(total * p / 100)) for p in PERCENTILES]
+    for bucket in sorted(counts):
+        running += counts[bucket]
+        while targets and running >= targets[0][1]:
+            percentile, _ = targets.pop(0)
+            stats[f'p{percentile}'] = round(bucket_upper_bound(bucket))
+
+    for percentile, _ in targets:
+        stats[f'p{percentile}'] = None
+    return stats
+
+
+def get_step_duration_stats(workflow):
+    """Per-step duration percentiles of a workflow, cached for STATS_CACHE_TIMEOUT"""
+    cache_key = f'workflow:step_durations:{workflow.id}'
+    stats = cache.get(cache_key)
+    if stats is not None:
+        return stats
+
+    counts = {}
+    for step_id, bucket, count in StepDurationBucket.objects.filter(workflow=workflow).values_list(
+            'step_id', 'bucket', 'count'):
+        counts.setdefault(step_id, {})[bucket] = count
+
+    stats = []
+    for step_id, name in workflow.steps.order_by('order', 'id').values_list('id', 'name'):
+        stats.append(dict(
+            percentiles_from_buckets(counts.get(step_id, {})),
+            step_id=step_id,
+            step=name
+        ))
+
+    cache.set(cache_key, stats, STATS_CACHE_TIMEOUT)
+    return stats
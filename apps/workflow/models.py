@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from apps.forms_builder.models import FormTemplate, FormSubmission
 
@@ -10,6 +13,7 @@ class WorkflowTemplate(models.Model):
     form = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, related_name='workflows')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=1, editable=False)  # Bumped on step/action changes
     
     def __str__(self):
         return self.name
@@ -71,25 +75,157 @@ class WorkflowAction(models.Model):
 class WorkflowInstance(models.Model):
     workflow = models.ForeignKey(WorkflowTemplate, on_delete=models.CASCADE)
     submission = models.OneToOneField(FormSubmission, on_delete=models.CASCADE, 
-                                    related_name='workflow_instance')
+                                    related_name='workflow_instance', db_constraint=False)
     current_step = models.ForeignKey(WorkflowStep, on_delete=models.SET_NULL, null=True)
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    version = models.PositiveIntegerField(default=0, editable=False)  # Compare-and-set on transitions
+    
+    # Deadline queue for timed steps
+    step_entered_at = models.DateTimeField(null=True, blank=True)
+    auto_approve_due_at = models.DateTimeField(null=True, blank=True)
+    last_reminder_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'auto_approve_due_at'], name='wf_instance_auto_due_idx'),
+            # Keyset pagination of a workflow's instances on (started_at, id)
+            models.Index(fields=['workflow', 'started_at', 'id'], name='wf_instance_started_idx'),
+        ]
     
     def __str__(self):
         return f"{self.workflow.name} - {self.submission.id}"
 
+class WorkItem(models.Model):
+    """Denormalized inbox entry: one row per assignee of an instance's current step"""
+    ASSIGNEE_TYPES = [
+        ('user', 'User'),
+        ('group', 'Group'),
+        ('role', 'Role'),
+    ]
+    
+    STATUSES = [
+        ('open', 'Open'),
+        ('done', 'Done'),
+        ('delegated', 'Delegated'),
+    ]
+    
+    instance = models.ForeignKey(WorkflowInstance, on_delete=models.CASCADE, related_name='work_items')
+    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE)
+    assignee_type = models.CharField(max_length=10, choices=ASSIGNEE_TYPES)
+    assignee_id = models.CharField(max_length=100)  # User UUID, group id or role name
+    status = models.CharField(max_length=10, choices=STATUSES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Covering index for inbox lookups: the scan yields instance ids without table reads
+            models.Index(fields=['assignee_type', 'assignee_id', 'status', 'created_at', 'instance'],
+                         name='wf_inbox_idx'),
+            models.Index(fields=['instance', 'status'], name='wf_work_item_instance_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.assignee_type}:{self.assignee_id} - {self.instance_id} ({self.status})"
+
+class ApprovalVote(models.Model):
+    DECISIONS = [
+        ('approve', 'Approve'),
+        ('reject', 'Reject'),
+    ]
+    
+    instance = models.ForeignKey(WorkflowInstance, on_delete=models.CASCADE, related_name='votes')
+    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE)
+    approver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='approval_votes')
+    decision = models.CharField(max_length=20, choices=DECISIONS)
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        # One vote per approver; the unique index also serves the per-step tally
+        unique_together = ['instance', 'step', 'approver']
+    
+    def __str__(self):
+        return f"{self.approver} - {self.decision} - {self.step.name}"
+
+class StepInterval(models.Model):
+    """Time an instance spent on a step; closed when the instance leaves the step"""
+    OUTCOMES = [
+        ('approved', 'Approved'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    instance = models.ForeignKey(WorkflowInstance, on_delete=models.CASCADE, related_name='intervals')
+    workflow = models.ForeignKey(WorkflowTemplate, on_delete=models.CASCADE)  # Denormalized for analytics
+    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE)
+    entered_at = models.DateTimeField()
+    exited_at = models.DateTimeField(null=True, blank=True)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)  # Null for system actions
+    outcome = models.CharField(max_length=20, choices=OUTCOMES, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['instance', 'entered_at'], name='wf_interval_timeline_idx'),
+            models.Index(fields=['workflow', 'step', 'exited_at'], name='wf_interval_step_idx'),
+        ]
+    
+    @property
+    def duration(self):
+        if self.exited_at is None:
+            return None
+        return self.exited_at - self.entered_at
+    
+    def __str__(self):
+        return f"{self.instance_id} - {self.step.name} ({self.outcome or 'open'})"
+
+class StepDurationBucket(models.Model):
+    """Log-scale histogram of closed step intervals, updated on every step exit"""
+    workflow = models.ForeignKey(WorkflowTemplate, on_delete=models.CASCADE)
+    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE, related_name='duration_buckets')
+    bucket = models.PositiveSmallIntegerField()  # See metrics.duration_bucket
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['step', 'bucket']
+    
+    def __str__(self):
+        return f"{self.step.name} [{self.bucket}] {self.count}"
+
 class WorkflowHistory(models.Model):
+    # Partitioned by month on timestamp (see forms_builder/partitions.py): no database-level foreign keys
     instance = models.ForeignKey(WorkflowInstance, on_delete=models.CASCADE, 
-                               related_name='history')
-    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE)
-    action = models.ForeignKey(WorkflowAction, on_delete=models.CASCADE)
-    actor = models.ForeignKey(User, on_delete=models.CASCADE)
+                               related_name='history', db_constraint=False)
+    step = models.ForeignKey(WorkflowStep, on_delete=models.CASCADE, db_constraint=False)
+    action = models.ForeignKey(WorkflowAction, on_delete=models.CASCADE, db_constraint=False)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                              db_constraint=False)  # Null for system actions
     timestamp = models.DateTimeField(auto_now_add=True)
     comment = models.TextField(blank=True)
-    data_before = models.JSONField(default=dict, blank=True)
-    data_after = models.JSONField(default=dict, blank=True)
+    # Delta encoding, see history.py: a full copy of data_before every few entries,
+    # otherwise the changes since the previous entry; data_patch holds this action's changes
+    snapshot = models.JSONField(null=True, blank=True)
+    before_patch = models.JSONField(default=list, blank=True)
+    data_patch = models.JSONField(default=list, blank=True)
+    # Full copies written before delta encoding; cleared by compact_workflow_history
+    data_before = models.JSONField(null=True, blank=True)
+    data_after = models.JSONField(null=True, blank=True)
     
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination of a user's approval history on (timestamp, id)
+            models.Index(fields=['actor', 'timestamp', 'id'], name='wf_history_actor_idx'),
+        ]
+
+
+@receiver([post_save, post_delete], sender=WorkflowStep)
+@receiver([post_save, post_delete], sender=WorkflowAction)
+def bump_workflow_version(sender, instance, **kwargs):
+    """Invalidate compiled workflow graphs when steps or actions change"""
+    if sender is WorkflowStep:
+        workflows = WorkflowTemplate.objects.filter(id=instance.workflow_id)
+    else:
+        workflows = WorkflowTemplate.objects.filter(steps__id=instance.step_id)
+    workflows.update(version=F('version') + 1)
@@ -0,0 +1,278 @@
+#
+# FILE: apps/workflow/simulation.py
+# PURPOSE: Dry-run routing of historical submissions through a workflow definition
+#
+
+from collections import Counter
+from types import MappingProxyType
+import json
+import logging
+
+from django.db.models.fields.json import KeyTransform
+
+from .graph import CompiledStep, CompiledWorkflow, compile_condition, get_compiled_workflow
+from .models import WorkflowAction
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_CHUNK_SIZE = 5000
+
+DEAD_END_NO_FIRST_STEP = 'no_first_step'
+DEAD_END_NO_APPROVE_ACTION = 'no_approve_action'
+DEAD_END_CYCLE = 'cycle'
+
+
+class SimulationGraph:
+    """A compiled workflow plus the action that approves each step"""
+
+    def __init__(self, graph, approve_actions):
+        self.graph = graph
+        self.approve_actions = approve_actions  # step id -> approve action id
+
+
+def graph_from_template(workflow):
+    """Simulation graph of a saved WorkflowTemplate"""
+    approve_actions = {}
+    for step_id, action_id in WorkflowAction.objects.filter(
+            step__workflow=workflow, action_type='approve').order_by('id').values_list('step_id', 'id'):
+        approve_actions.setdefault(step_id, action_id)
+
+    return SimulationGraph(get_compiled_workflow(workflow), approve_actions)
+
+
+def graph_from_definition(definition):
+    """
+    Simulation graph of an unsaved definition:
+    {"steps": [{"name", "order", "step_type", "condition",
+                "actions": [{"action_type": "approve", "next_step": "<step name>"}]}]}
+    """
+    steps = sorted(definition.get('steps', []), key=lambda step: step.get('order', 0))
+    ids = {}
+    for index, step in enumerate(steps, start=1):
+        if step['name'] in ids:
+            raise ValueError(f"Duplicate step name {step['name']}")
+        ids[step['name']] = index
+
+    compiled_steps = []
+    approve_actions = {}
+    action_id = 0
+    for step in steps:
+        step_id = ids[step['name']]
+        edges = {}
+        for action in step.get('actions', []):
+            action_id += 1
+            if action.get('next_step'):
+                if action['next_step'] not in ids:
+                    raise ValueError(f"Unknown next step {action['next_step']} on step {step['name']}")
+                edges[action_id] = ids[action['next_step']]
+            if action.get('action_type') == 'approve':
+                approve_actions.setdefault(step_id, action_id)
+
+        compiled_steps.append(CompiledStep(
+            id=step_id,
+            name=step['name'],
+            step_type=step.get('step_type', 'approval'),
+            order=step.get('order', 0),
+            assigned_to_user_id=None,
+            assigned_to_group_id=None,
+            assigned_to_role='',
+            auto_approve_after=step.get('auto_approve_after'),
+            require_all_approvals=step.get('require_all_approvals', False),
+            condition=compile_condition(step.get('condition')),
+            edges=MappingProxyType(edges),
+        ))
+
+    compiled_steps = tuple(compiled_steps)
+    graph = CompiledWorkflow(
+        id=definition.get('id'),
+        version=0,
+        steps=compiled_steps,
+        by_id=MappingProxyType({step.id: step for step in compiled_steps}),
+    )
+    return SimulationGraph(graph, approve_actions)
+
+
+def route(simulation_graph, outcomes):
+    """
+    Path of step ids a submission takes when every step is approved, and its
+    dead end if any. outcomes maps step id -> whether the step's condition holds.
+    """
+    graph = simulation_graph.graph
+    candidates = [step for step in graph.steps if step.order >= 0]
+
+    current = None
+    for step in candidates:
+        if outcomes[step.id]:
+            current = step
+            break
+    if current is None:
+        return (), DEAD_END_NO_FIRST_STEP
+
+    path = [current.id]
+    while True:
+        action_id = simulation_graph.approve_actions.get(current.id)
+        if action_id is None:
+            return tuple(path), DEAD_END_NO_APPROVE_ACTION
+
+        target_id = current.edges.get(action_id)
+        if target_id is not None:
+            current = graph.by_id.get(target_id)
+        else:
+            current = next(
+                (step for step in graph.steps if step.order > current.order and outcomes[step.id]),
+                None
+            )
+
+        if current is None:
+            return tuple(path), None
+        if current.id in path:
+            return tuple(path), DEAD_END_CYCLE
+        path.append(current.id)
+
+
+class ConditionColumn:
+    """One distinct condition, evaluated once per distinct field value"""
+
+    def __init__(self, field, predicate):
+        self.field = field
+        self.predicate = predicate
+        self.memo = {}
+
+    def evaluate(self, values):
+        memo = self.memo
+        results = []
+        for value in values:
+            try:
+                key = (type(value), value)
+                result = memo.get(key)
+            except TypeError:
+                # Unhashable (list or dict) values
+                key = (type(value), json.dumps(value, sort_keys=True, default=str))
+                result = memo.get(key)
+            if result is None:
+                result = memo[key] = bool(self.predicate({self.field: value}))
+            results.append(result)
+        return results
+
+
+def simulate_routing(candidate, submissions, baseline=None, chunk_size=SIMULATION_CHUNK_SIZE):
+    """
+    Route the submissions through the candidate graph (and a baseline graph to compare
+    with) without writing anything. Only the fields the conditions read are fetched,
+    in id-ordered chunks; each distinct condition is evaluated once per distinct value
+    and submissions are routed once per distinct combination of condition outcomes.
+    """
+    graphs = [candidate] + ([baseline] if baseline else [])
+
+    # Distinct conditions across all graphs
+    columns = []
+    column_index = {}
+    step_columns = []  # per graph: step id -> column index, None for unconditional steps
+    for simulation_graph in graphs:
+        mapping = {}
+        for step in simulation_graph.graph.steps:
+            field = getattr(step.condition, 'field', None)
+            if field is None:
+                mapping[step.id] = None
+                continue
+            key = step.condition.spec
+            if key not in column_index:
+                column_index[key] = len(columns)
+                columns.append(ConditionColumn(field, step.condition))
+            mapping[step.id] = column_index[key]
+        step_columns.append(mapping)
+
+    fields = sorted({column.field for column in columns})
+    aliases = {field: f'_sim_{index}' for index, field in enumerate(fields)}
+    queryset = submissions.annotate(
+        **{alias: KeyTransform(field, 'data') for field, alias in aliases.items()}
+    ).order_by('id')
+
+    signatures = Counter()
+    total = 0
+    last_id = None
+
+    while True:
+        chunk = queryset
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = list(chunk.values_list('id', *aliases.values())[:chunk_size])
+        if not rows:
+            break
+
+        field_values = {field: [row[index + 1] for row in rows] for index, field in enumerate(fields)}
+        results = [column.evaluate(field_values[column.field]) for column in columns]
+        signatures.update(zip(*results) if results else [()] * len(rows))
+
+        total += len(rows)
+        last_id = rows[-1][0]
+        if len(rows) < chunk_size:
+            break
+
+    reports = []
+    routes = []
+    for simulation_graph, mapping in zip(graphs, step_columns):
+        graph_routes = {}
+        for signature in signatures:
+            outcomes = {
+                step_id: True if column is None else signature[column]
+                for step_id, column in mapping.items()
+            }
+            graph_routes[signature] = route(simulation_graph, outcomes)
+        routes.append(graph_routes)
+        reports.append(_build_report(simulation_graph, graph_routes, signatures, total))
+
+    report = {'submissions': total, 'candidate': reports[0]}
+    if baseline:
+        report['baseline'] = reports[1]
+        report['changed_routes'] = sum(
+            count for signature, count in signatures.items()
+            if routes[0][signature][0] != _translate(routes[1][signature][0], baseline, candidate)
+        )
+    return report
+
+
+def _translate(path, source, target):
+    """Express a path of source step ids in target step ids, matching steps by name"""
+    ids = {step.name: step.id for step in target.graph.steps}
+    return tuple(ids.get(source.graph.by_id[step_id].name) for step_id in path)
+
+
+def _build_report(simulation_graph, routes, signatures, total):
+    graph = simulation_graph.graph
+    names = {step.id: step.name for step in graph.steps}
+
+    paths = Counter()
+    dead_ends = Counter()
+    visits = Counter()
+    skipped = Counter()
+
+    for signature, count in signatures.items():
+        path, dead_end = routes[signature]
+        paths[path] += count
+        if dead_end:
+            dead_ends[dead_end] += count
+        for step_id in path:
+            visits[step_id] += count
+
+        # Steps ordered before the last visited step that the route passed over
+        if path:
+            last_order = max(graph.by_id[step_id].order for step_id in path)
+            for step in graph.steps:
+                if step.order < last_order and step.id not in path:
+                    skipped[step.id] += count
+
+    return {
+        'paths': [
+            {
+                'path': [names[step_id] for step_id in path],
+                'count': count,
+                'share': round(count / total, 4) if total else 0,
+            }
+            for path, count in paths.most_common()
+        ],
+        'dead_ends': dict(dead_ends),
+        'step_visits': {names[step.id]: visits[step.id] for step in graph.steps},
+        'skipped_steps': {names[step.id]: skipped[step.id] for step in graph.steps if skipped[step.id]},
+        'unreached_steps': [names[step.id] for step in graph.steps if not visits[step.id]],
+    }
@@ -1,76 +1,198 @@
 # apps/workflow/tasks.py
 from celery import shared_task
+from django.conf import settings
+from django.db.models import Q, Min, Max
 from django.utils import timezone
 from datetime import timedelta
 from django.core.mail import send_mail
-from .models import WorkflowInstance, WorkflowStep
+from django.db import transaction
+from .models import WorkflowInstance
+import logging
+import time
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def send_reminder_emails():
-    """Send reminder emails for pending workflow tasks"""
-    # Find workflow instances that have been pending for more than 24 hours
-    cutoff_time = timezone.now() - timedelta(hours=24)
+
+def scan_reminders(min_id=None, max_id=None, lease=None, batch_size=500):
+    """Send reminders for pending workflow tasks in an id range whose reminder timer was lost"""
+    from .utils import send_step_reminder, REMINDER_STEP_TYPES
+    
+    # Find workflow instances that have been pending without a reminder for too long
+    cutoff_time = timezone.now() - timedelta(hours=settings.WORKFLOW_REMINDER_HOURS)
     
     pending_instances = WorkflowInstance.objects.filter(
         is_active=True,
         current_step__isnull=False,
-        current_step__step_type='approval'
-    ).select_related('current_step', 'submission')
+        current_step__step_type__in=REMINDER_STEP_TYPES
+    ).filter(
+        Q(step_entered_at__isnull=True) | Q(step_entered_at__lt=cutoff_time)
+    ).filter(
+        Q(last_reminder_at__isnull=True) | Q(last_reminder_at__lt=cutoff_time)
+    ).select_related('current_step', 'submission', 'submission__form').order_by('id')
+    if max_id is not None:
+        pending_instances = pending_instances.filter(id__lte=max_id)
     
     reminders_sent = 0
+    last_id = min_id - 1 if min_id is not None else None
     
-    for instance in pending_instances:
-        # Check if reminder already sent recently
-        if instance.history.filter(
-            step=instance.current_step,
-            timestamp__gte=cutoff_time
-        ).exists():
-            continue
-            
-        # Send reminder
-        if instance.current_step.assigned_to_user:
-            send_mail(
-                subject=f'Reminder: Pending approval for {instance.submission.form.name}',
-                message=f'You have a pending approval task for {instance.submission.form.name}',
-                from_email='noreply@dynamicforms.com',
-                recipient_list=[instance.current_step.assigned_to_user.email],
+    while True:
+        batch = pending_instances
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        batch = list(batch[:batch_size])
+        
+        for instance in batch:
+            if send_step_reminder(instance):
+                reminders_sent += 1
+        
+        if len(batch) < batch_size or (lease and not lease.extend()):
+            break
+        last_id = batch[-1].id
+    
+    return reminders_sent
+
+
+def scan_auto_approvals(min_id=None, max_id=None, lease=None, batch_size=100):
+    """Auto-approve instances in an id range whose step deadline has passed"""
+    from .utils import auto_approve_instance
+    
+    due = WorkflowInstance.objects.filter(is_active=True)
+    if min_id is not None:
+        due = due.filter(id__gte=min_id)
+    if max_id is not None:
+        due = due.filter(id__lte=max_id)
+    
+    auto_approved = 0
+    
+    # Drain the due queue oldest first; skip_locked lets several workers share it
+    while True:
+        with transaction.atomic():
+            due_instances = list(
+                due.select_for_update(skip_locked=True).filter(
+                    auto_approve_due_at__lte=timezone.now()
+                ).order_by('auto_approve_due_at')[:batch_size]
             )
-            reminders_sent += 1
             
-    return f"Sent {reminders_sent} reminder emails"
+            for instance in due_instances:
+                if auto_approve_instance(instance):
+                    auto_approved += 1
+        
+        if len(due_instances) < batch_size or (lease and not lease.extend()):
+            break
+    
+    return auto_approved
+
+
+# Periodic scans that run as id-range shards, see run_sharded_scan
+SHARDED_SCANS = {
+    'reminders': scan_reminders,
+    'auto_approve': scan_auto_approvals,
+}
+
+
+def shard_ranges(min_id, max_id, shards):
+    """Split [min_id, max_id] into at most `shards` contiguous id ranges"""
+    span = max(-(-(max_id - min_id + 1) // shards), 1)
+    return [(start, min(start + span - 1, max_id)) for start in range(min_id, max_id + 1, span)]
 
 
 @shared_task
-def auto_approve_workflows():
-    """Auto-approve workflows that have exceeded their timeout"""
-    auto_approved = 0
+def run_sharded_scan(scan, shards=None):
+    """
+    Split a periodic scan over active instances into id-range shards and queue one task
+    per shard. Duplicate triggers within WORKFLOW_SCAN_COORDINATOR_LEASE_SECONDS are
+    dropped, and shards whose previous run still holds its lease are skipped.
+    """
+    from .leases import hold_lease, is_lease_held
     
-    workflows = WorkflowInstance.objects.filter(
-        is_active=True,
-        current_step__auto_approve_after__isnull=False
-    ).select_related('current_step')
+    if scan not in SHARDED_SCANS:
+        raise ValueError(f"Unknown workflow scan {scan}")
     
-    for workflow in workflows:
-        step = workflow.current_step
-        timeout = timezone.now() - timedelta(hours=step.auto_approve_after)
+    with hold_lease(f'scan:{scan}', settings.WORKFLOW_SCAN_COORDINATOR_LEASE_SECONDS, release=False) as lease:
+        if not lease:
+            return f"Skipped {scan} scan: already triggered"
         
-        # Check if step has been active longer than timeout
-        last_action = workflow.history.filter(step=step).order_by('-timestamp').first()
+        bounds = WorkflowInstance.objects.filter(is_active=True).aggregate(min_id=Min('id'), max_id=Max('id'))
+        if bounds['min_id'] is None:
+            return f"Skipped {scan} scan: no active instances"
         
-        if last_action and last_action.timestamp < timeout:
-            # Auto-approve
-            from .utils import handle_workflow_action
-            
-            # Find the approve action
-            approve_action = step.actions.filter(action_type='approve').first()
-            if approve_action:
-                handle_workflow_action(
-                    workflow,
-                    approve_action,
-                    user=None,  # System auto-approval
-                    comment='Auto-approved due to timeout'
-                )
-                auto_approved += 1
-                
-    return f"Auto-approved {auto_approved} workflows"
\ No newline at end of file
+        queued = skipped = 0
+        ranges = shard_ranges(bounds['min_id'], bounds['max_id'], shards or settings.WORKFLOW_SCAN_SHARDS)
+        for shard, (min_id, max_id) in enumerate(ranges):
+            if is_lease_held(f'scan:{scan}:{shard}'):
+                skipped += 1
+                continue
+            run_scan_shard.delay(scan, shard, min_id, max_id)
+            queued += 1
+    
+    return f"Queued {queued} {scan} shards, skipped {skipped} still running"
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def run_scan_shard(scan, shard, min_id, max_id):
+    """Run one shard of a periodic scan under its lease"""
+    from .leases import hold_lease
+    
+    with hold_lease(f'scan:{scan}:{shard}', settings.WORKFLOW_SCAN_SHARD_LEASE_SECONDS) as lease:
+        if not lease:
+            return f"Skipped {scan} shard {shard}: previous run still holds its lease"
+        
+        processed = SHARDED_SCANS[scan](min_id, max_id, lease=lease)
+    
+    return f"{scan} shard {shard} ({min_id}-{max_id}): processed {processed}"
+
+
+@shared_task
+def send_reminder_emails():
+    """Send reminder emails for pending workflow tasks whose reminder timer was lost"""
+    reminders_sent = scan_reminders()
+    return f"Sent {reminders_sent} reminder emails"
+
+
+@shared_task
+def auto_approve_workflows(batch_size=100):
+    """Auto-approve workflows whose step deadline has passed"""
+    auto_approved = scan_auto_approvals(batch_size=batch_size)
+    return f"Auto-approved {auto_approved} workflows"
+
+
+@shared_task
+def poll_workflow_timers(batch_size=500):
+    """Fire due workflow timers (auto-approval, reminders, escalations)"""
+    from .timers import poll_due_timers
+    
+    fired = poll_due_timers(batch_size=batch_size)
+    return f"Fired {fired} workflow timers"
+
+
+@shared_task
+def send_workflow_notifications(events):
+    """Send notifications collected with utils.deferred_notifications()"""
+    from .utils import send_notification_event
+    
+    for event in events:
+        try:
+            send_notification_event(*event)
+        except Exception as e:
+            logger.error(f"Error sending workflow notification {event}: {str(e)}")
+    
+    return f"Sent {len(events)} workflow notifications"
+
+
+# Queue benchmark probes, see the benchmark_task_queues command
+
+@shared_task
+def notification_latency_probe(sent_at):
+    """Seconds between enqueueing and starting, on the notifications queue"""
+    return time.time() - sent_at
+
+
+@shared_task(acks_late=True)
+def heavy_export_probe(seconds):
+    """Stand-in for a CPU-bound export: keeps one worker process busy"""
+    deadline = time.monotonic() + seconds
+    rounds = 0
+    while time.monotonic() < deadline:
+        sum(i * i for i in range(10000))
+        rounds += 1
+    return rounds
@@ -0,0 +1,235 @@
+#
+# FILE: apps/workflow/timers.py
+# PURPOSE: Sorted-set timer service for workflow SLAs, reminders and escalations
+#
+
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TIMER_AUTO_APPROVE = 'auto_approve'
+TIMER_REMINDER = 'reminder'
+TIMER_ESCALATION = 'escalation'
+
+TIMER_TYPES = [TIMER_AUTO_APPROVE, TIMER_REMINDER, TIMER_ESCALATION]
+
+# timer type -> handler(instance_id, step_id), see register_timer_handler
+TIMER_HANDLERS = {}
+
+
+def make_member(instance_id, step_id, timer_type):
+    return f"{instance_id}:{step_id}:{timer_type}"
+
+
+def parse_member(member):
+    if isinstance(member, bytes):
+        member = member.decode()
+    instance_id, step_id, timer_type = member.split(':', 2)
+    return int(instance_id), int(step_id), timer_type
+
+
+class RedisTimerBackend:
+    """Timers stored in a Redis sorted set scored by fire time"""
+
+    # Fetch and remove due members atomically so two pollers never fire the same timer
+    POP_DUE_SCRIPT = """
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    if #due > 0 then
+        redis.call('ZREM', KEYS[1], unpack(due))
+    end
+    return due
+    """
+
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+        self._pop_due = client.register_script(self.POP_DUE_SCRIPT)
+
+    def add(self, member, fire_at):
+        self.client.zadd(self.key, {member: fire_at})
+
+    def remove(self, members):
+        if members:
+            self.client.zrem(self.key, *members)
+
+    def pop_due(self, now, limit):
+        return [m.decode() if isinstance(m, bytes) else m
+                for m in self._pop_due(keys=[self.key], args=[now, limit])]
+
+    def count(self):
+        return self.client.zcard(self.key)
+
+
+class InMemoryTimerBackend:
+    """Process-local stand-in for RedisTimerBackend (development and tests)"""
+
+    def __init__(self):
+        self._scores = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def add(self, member, fire_at):
+        with self._lock:
+            self._scores[member] = fire_at
+            heapq.heappush(self._heap, (fire_at, member))
+
+    def remove(self, members):
+        with self._lock:
+            for member in members:
+                self._scores.pop(member, None)
+
+    def pop_due(self, now, limit):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                fire_at, member = heapq.heappop(self._heap)
+                # Skip heap entries left behind by remove() or a reschedule
+                if self._scores.get(member) == fire_at:
+                    del self._scores[member]
+                    due.append(member)
+        return due
+
+    def count(self):
+        return len(self._scores)
+
+
+class TimerService:
+    """Schedules, cancels and fires (instance, step, timer type) timers"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def schedule(self, instance_id, step_id, timer_type, fire_at):
+        """Schedule a timer; rescheduling the same timer replaces its fire time"""
+        self.backend.add(make_member(instance_id, step_id, timer_type), fire_at.timestamp())
+
+    def cancel(self, instance_id, step_id, timer_types=None):
+        """Cancel the timers of an instance for a step"""
+        self.backend.remove([
+            make_member(instance_id, step_id, timer_type)
+            for timer_type in (timer_types or TIMER_TYPES)
+        ])
+
+    def pop_due(self, limit=500, now=None):
+        """Remove and return up to limit due timers as (instance_id, step_id, timer_type)"""
+        now = (now or timezone.now()).timestamp()
+        return [parse_member(member) for member in self.backend.pop_due(now, limit)]
+
+    def pending_count(self):
+        return self.backend.count()
+
+    def dispatch(self, instance_id, step_id, timer_type):
+        """Run the handler registered for a fired timer"""
+        handler = TIMER_HANDLERS.get(timer_type)
+        if not handler:
+            logger.warning(f"No handler registered for workflow timer type {timer_type}")
+            return False
+
+        try:
+            handler(instance_id, step_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error running {timer_type} timer for instance {instance_id}: {str(e)}")
+            return False
+
+
+_timer_service = None
+
+
+def get_timer_service():
+    """Return the configured timer service (WORKFLOW_TIMER_BACKEND = 'redis' or 'memory')"""
+    global _timer_service
+
+    if _timer_service is None:
+        backend_name = getattr(settings, 'WORKFLOW_TIMER_BACKEND', 'redis')
+        if backend_name == 'memory':
+            backend = InMemoryTimerBackend()
+        else:
+            import redis
+            backend = RedisTimerBackend(
+                redis.Redis.from_url(settings.REDIS_URL),
+                getattr(settings, 'WORKFLOW_TIMER_KEY', 'workflow:timers')
+            )
+        _timer_service = TimerService(backend)
+
+    return _timer_service
+
+
+def register_timer_handler(timer_type):
+    """Decorator registering the handler called when a timer of this type fires"""
+    def decorator(func):
+        TIMER_HANDLERS[timer_type] = func
+        return func
+    return decorator
+
+
+def poll_due_timers(batch_size=500, max_batches=20):
+    """Pop due timers in batches and dispatch them; returns the number fired"""
+    service = get_timer_service()
+    fired = 0
+
+    for _ in range(max_batches):
+        due = service.pop_due(limit=batch_size)
+        for instance_id, step_id, timer_type in due:
+            if service.dispatch(instance_id, step_id, timer_type):
+                fired += 1
+
+        if len(due) < batch_size:
+            break
+
+    return fired
+
+
+def run_poller(interval=5.0, batch_size=500, stop_event=None):
+    """Poll for due timers until stop_event is set"""
+    while not (stop_event and stop_event.is_set()):
+        try:
+            fired = poll_due_timers(batch_size=batch_size)
+            if fired:
+                logger.info(f"Fired {fired} workflow timers")
+        except Exception as e:
+            logger.error(f"Error polling workflow timers: {str(e)}")
+        time.sleep(interval)
+
+
+# Handlers
+
+@register_timer_handler(TIMER_AUTO_APPROVE)
+def handle_auto_approve_timer(instance_id, step_id):
+    from django.db import transaction
+    from .models import WorkflowInstance
+    from .utils import auto_approve_instance
+
+    with transaction.atomic():
+        # The instance may have moved on, or a sweep worker may hold it already
+        instance = WorkflowInstance.objects.select_for_update(skip_locked=True).filter(
+            id=instance_id,
+            is_active=True,
+            current_step_id=step_id,
+            auto_approve_due_at__lte=timezone.now()
+        ).first()
+
+        if instance:
+            auto_approve_instance(instance)
+
+
+@register_timer_handler(TIMER_REMINDER)
+def handle_reminder_timer(instance_id, step_id):
+    from .models import WorkflowInstance
+    from .utils import send_step_reminder, schedule_reminder
+
+    instance = WorkflowInstance.objects.filter(
+        id=instance_id,
+        is_active=True,
+        current_step_id=step_id
+    ).select_related('current_step', 'submission', 'submission__form').first()
+
+    if instance:
+        send_step_reminder(instance)
+        schedule_reminder(instance)
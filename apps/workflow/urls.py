@@ -10,8 +10,11 @@ urlpatterns = [
     # Workflow management
     path('', views.workflow_list, name='workflow_list'),
     path('<uuid:workflow_id>/', views.workflow_detail, name='workflow_detail'),
+    path('<int:workflow_id>/metrics/', views.workflow_step_metrics, name='workflow_step_metrics'),
     path('instance/<uuid:instance_id>/', views.workflow_instance_detail, name='workflow_instance_detail'),
     path('instance/<uuid:instance_id>/action/', views.workflow_action, name='workflow_action'),
+    path('instances/bulk-action/', views.bulk_workflow_action, name='bulk_workflow_action'),
+    path('history/<int:history_id>/data/', views.workflow_history_data, name='workflow_history_data'),
     
     # Approval dashboard
     path('approvals/', views.approval_dashboard, name='approval_dashboard'),
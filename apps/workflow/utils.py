@@ -3,15 +3,40 @@
 # PURPOSE: Utility functions for workflow processing and management
 #
 
-from django.core.mail import send_mail
+from django.core.mail import send_mail, get_connection, EmailMultiAlternatives
+from django.contrib.auth import get_user_model
+from django.db import transaction, IntegrityError
+from django.db.models import Q, F, Count
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.conf import settings
-from .models import WorkflowTemplate, WorkflowInstance, WorkflowStep, WorkflowAction, WorkflowHistory
+from contextlib import contextmanager
+from datetime import timedelta
+from .models import (WorkflowTemplate, WorkflowInstance, WorkflowStep, WorkflowAction,
+                     WorkflowHistory, ApprovalVote, WorkItem)
+from .timers import get_timer_service, TIMER_AUTO_APPROVE, TIMER_REMINDER
+from .graph import get_compiled_workflow, compile_condition
+from .history import record_history
+from .metrics import open_interval, close_interval
+from apps.forms_builder.activity import publish_activity
+import copy
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Notifications collected by deferred_notifications() instead of being sent inline
+_notification_buffer = threading.local()
+
+# Step types whose assignees get periodic reminders
+REMINDER_STEP_TYPES = ['approval', 'parallel']
+
+class WorkflowConflict(Exception):
+    """Raised when another transition changed the instance first"""
+    pass
+
+CONFLICT_MESSAGE = 'This workflow was updated by someone else. Please reload and try again.'
+
 def trigger_workflow(submission):
     """
     Trigger workflow for a form submission
@@ -53,37 +78,30 @@ def start_workflow(instance):
     Start a workflow instance by moving to the first step
     """
     try:
-        # Get the first step (lowest order)
-        first_step = instance.workflow.steps.filter(
-            order__gte=0
-        ).order_by('order').first()
+        graph = get_compiled_workflow(instance.workflow)
         
-        if not first_step:
+        if not graph.steps:
             logger.warning(f"No steps found for workflow {instance.workflow.name}")
             return False
         
-        # Check if step conditions are met
-        if not evaluate_step_conditions(first_step, instance.submission):
-            # Find next eligible step
-            first_step = get_next_eligible_step(instance.workflow, instance.submission, 0)
+        # Get the first step (lowest order) whose conditions are met
+        first_step = graph.first_step(instance.submission.data)
         
         if first_step:
-            # Move to first step
-            instance.current_step = first_step
-            instance.save()
-            
-            # Update submission status
-            instance.submission.status = 'pending'
-            if first_step.assigned_to_user:
-                instance.submission.assigned_to = first_step.assigned_to_user
-            instance.submission.save()
+            with transaction.atomic():
+                # Move to first step
+                enter_step(instance, first_step)
+                
+                # Update submission status
+                instance.submission.status = 'pending'
+                if first_step.assigned_to_user_id:
+                    instance.submission.assigned_to_id = first_step.assigned_to_user_id
+                # Only the workflow columns: a save touching data rewrites its projections and postings
+                instance.submission.save(update_fields=['status', 'assigned_to'])
             
             # Send notifications
             send_step_notifications(instance, first_step)
             
-            # Handle auto-approval if configured
-            handle_auto_approval(instance, first_step)
-            
             logger.info(f"Workflow instance {instance.id} started at step {first_step.name}")
             return True
         else:
@@ -94,52 +112,27 @@ def start_workflow(instance):
         logger.error(f"Error starting workflow instance {instance.id}: {str(e)}")
         return False
 
-def handle_workflow_action(instance, action, user, comment="", delegate_to=None):
+def handle_workflow_action(instance, action, user, comment="", delegate_to=None, check_permissions=True):
     """
     Handle a workflow action (approve, reject, request info, etc.)
+    Callers that verified permissions for many instances at once pass check_permissions=False.
+    The transition and its side effects (intervals, inbox entries, votes, submission
+    status) commit together: an action that fails leaves the instance as it was.
     """
     try:
-        current_step = instance.current_step
-        
-        if not current_step:
-            return {
-                'success': False,
-                'error': 'No current step found'
-            }
-        
-        # Validate user permissions
-        if not can_user_perform_action(user, current_step, action):
-            return {
-                'success': False,
-                'error': 'User does not have permission to perform this action'
-            }
-        
-        # Handle delegation
-        if action.action_type == 'delegate' and delegate_to:
-            current_step.assigned_to_user = delegate_to
-            current_step.save()
-            
-            # Send notification to delegate
-            send_delegation_notification(instance, delegate_to, user, comment)
-            
-            return {
-                'success': True,
-                'message': f'Task delegated to {delegate_to.get_full_name()}'
-            }
-        
-        # Handle other actions
-        if action.action_type == 'approve':
-            return handle_approval(instance, action, user, comment)
-        elif action.action_type == 'reject':
-            return handle_rejection(instance, action, user, comment)
-        elif action.action_type == 'request_info':
-            return handle_info_request(instance, action, user, comment)
-        else:
-            return {
-                'success': False,
-                'error': f'Unknown action type: {action.action_type}'
-            }
-            
+        with transaction.atomic():
+            result = perform_workflow_action(instance, action, user, comment, delegate_to, check_permissions)
+            if not result['success']:
+                transaction.set_rollback(True)
+        return result
+    
+    except WorkflowConflict:
+        logger.info(f"Conflicting {action.action_type} on workflow instance {instance.id}")
+        return {
+            'success': False,
+            'conflict': True,
+            'error': CONFLICT_MESSAGE
+        }
     except Exception as e:
         logger.error(f"Error handling workflow action: {str(e)}")
         return {
@@ -147,29 +140,90 @@ def handle_workflow_action(instance, action, user, comment="", delegate_to=None)
             'error': str(e)
         }
 
+def perform_workflow_action(instance, action, user, comment, delegate_to, check_permissions):
+    """Dispatch an action to its handler; run through handle_workflow_action"""
+    current_step = instance.current_step
+    
+    if not current_step:
+        return {
+            'success': False,
+            'error': 'No current step found'
+        }
+    
+    # Actions of a step the instance already left are stale
+    if action.step_id != current_step.id:
+        return {
+            'success': False,
+            'conflict': True,
+            'error': CONFLICT_MESSAGE
+        }
+    
+    # Validate user permissions
+    if check_permissions and not can_user_perform_action(user, current_step, action, instance=instance):
+        return {
+            'success': False,
+            'error': 'User does not have permission to perform this action'
+        }
+    
+    # Handle delegation (reassigns this instance only, never the shared step)
+    if action.action_type == 'delegate' and delegate_to:
+        delegate_work_items(instance, delegate_to)
+        
+        # Send notification to delegate
+        send_delegation_notification(instance, delegate_to, user, comment)
+        
+        return {
+            'success': True,
+            'message': f'Task delegated to {delegate_to.get_full_name()}'
+        }
+    
+    # Handle other actions
+    if action.action_type == 'approve':
+        return handle_approval(instance, action, user, comment)
+    elif action.action_type == 'reject':
+        return handle_rejection(instance, action, user, comment)
+    elif action.action_type == 'request_info':
+        return handle_info_request(instance, action, user, comment)
+    else:
+        return {
+            'success': False,
+            'error': f'Unknown action type: {action.action_type}'
+        }
+
 def handle_approval(instance, action, user, comment):
     """Handle approval action"""
     try:
         current_step = instance.current_step
         
-        # Check if this step requires all approvals
-        if current_step.require_all_approvals:
-            # Mark this user's approval
-            # TODO: Implement multi-user approval tracking
-            pass
+        # Parallel steps only advance once enough approvers have voted
+        if current_step.step_type == 'parallel' and user is not None:
+            return handle_parallel_vote(instance, action, user, comment, 'approve')
         
+        return advance_workflow(instance, action, user)
+            
+    except WorkflowConflict:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling approval: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def advance_workflow(instance, action, user=None):
+    """Move an approved instance to its next step, or complete it; user is None for system approvals"""
+    try:
         # Get next step
         next_step = get_next_step(instance, action)
         
         if next_step:
             # Move to next step
-            instance.current_step = next_step
-            instance.save()
+            enter_step(instance, next_step, actor=user)
             
             # Update assignment
-            if next_step.assigned_to_user:
-                instance.submission.assigned_to = next_step.assigned_to_user
-                instance.submission.save()
+            if next_step.assigned_to_user_id:
+                instance.submission.assigned_to_id = next_step.assigned_to_user_id
+                instance.submission.save(update_fields=['assigned_to'])
             
             # Send notifications for new step
             send_step_notifications(instance, next_step)
@@ -180,25 +234,118 @@ def handle_approval(instance, action, user, comment):
             }
         else:
             # Workflow completed
-            complete_workflow(instance, 'approved')
+            complete_workflow(instance, 'approved', actor=user)
             
             return {
                 'success': True,
                 'message': 'Workflow completed - approved'
             }
             
+    except WorkflowConflict:
+        raise
     except Exception as e:
-        logger.error(f"Error handling approval: {str(e)}")
+        logger.error(f"Error advancing workflow: {str(e)}")
         return {
             'success': False,
             'error': str(e)
         }
 
+def handle_parallel_vote(instance, action, user, comment, decision):
+    """
+    Record a vote on a parallel step and settle the step once the tally decides it.
+    Votes are plain inserts; only the vote that decides the step writes the instance,
+    through the compare-and-set transition, so the step settles exactly once.
+    """
+    step = instance.current_step
+    
+    try:
+        with transaction.atomic():
+            ApprovalVote.objects.create(
+                instance=instance,
+                step=step,
+                approver=user,
+                decision=decision,
+                comment=comment
+            )
+    except IntegrityError:
+        return {
+            'success': False,
+            'error': 'You have already voted on this step'
+        }
+    
+    result = settle_parallel_step(instance, action, decision, user, comment)
+    
+    # Inside an outer transaction concurrent votes are not visible to each other
+    # until commit, so the tally is repeated once this vote is committed
+    if result is None and transaction.get_connection().in_atomic_block:
+        instance_id, step_id = instance.id, step.id
+        transaction.on_commit(
+            lambda: settle_parallel_step_after_commit(instance_id, step_id, action.id, decision, user, comment)
+        )
+    
+    return result or {
+        'success': True,
+        'message': f'Your {decision} vote has been recorded'
+    }
+
+def settle_parallel_step(instance, action, decision, user, comment):
+    """Advance or reject a parallel step if its tally is decisive; None otherwise"""
+    step = instance.current_step
+    tally = get_vote_tally(instance, step)
+    eligible = get_step_assignees(step).count()
+    required = get_required_approvals(step, eligible)
+    
+    try:
+        if decision == 'approve' and tally['approvals'] >= required:
+            return advance_workflow(instance, action, user)
+        if decision == 'reject' and tally['rejections'] > eligible - required:
+            return reject_workflow(instance, user, comment)
+    except WorkflowConflict:
+        # Another decisive vote settled the step first
+        return {
+            'success': True,
+            'message': f'Your {decision} vote has been recorded'
+        }
+    
+    return None
+
+def settle_parallel_step_after_commit(instance_id, step_id, action_id, decision, user, comment):
+    instance = WorkflowInstance.objects.filter(id=instance_id, current_step_id=step_id, is_active=True).first()
+    action = WorkflowAction.objects.filter(id=action_id).first()
+    if instance and action:
+        try:
+            with transaction.atomic():
+                result = settle_parallel_step(instance, action, decision, user, comment)
+                if result and not result['success']:
+                    transaction.set_rollback(True)
+        except WorkflowConflict:
+            pass  # Another vote settled the step
+
+def get_vote_tally(instance, step):
+    """Approval and rejection counts of a step in one aggregate query"""
+    return ApprovalVote.objects.filter(instance=instance, step=step).aggregate(
+        approvals=Count('id', filter=Q(decision='approve')),
+        rejections=Count('id', filter=Q(decision='reject'))
+    )
+
+def get_required_approvals(step, eligible):
+    """All assignees when require_all_approvals is set, a simple majority otherwise"""
+    if step.require_all_approvals:
+        return max(eligible, 1)
+    return eligible // 2 + 1
+
 def handle_rejection(instance, action, user, comment):
     """Handle rejection action"""
+    if instance.current_step.step_type == 'parallel' and user is not None:
+        return handle_parallel_vote(instance, action, user, comment, 'reject')
+    
+    return reject_workflow(instance, user, comment)
+
+def reject_workflow(instance, user, comment):
+    """Complete an instance as rejected and tell the submitter"""
     try:
         # Complete workflow with rejection
-        complete_workflow(instance, 'rejected')
+        complete_workflow(instance, 'rejected', actor=user)
         
         # Send rejection notification
         send_rejection_notification(instance, user, comment)
@@ -208,6 +355,8 @@ def handle_rejection(instance, action, user, comment):
             'message': 'Request rejected'
         }
         
+    except WorkflowConflict:
+        raise
     except Exception as e:
         logger.error(f"Error handling rejection: {str(e)}")
         return {
@@ -223,7 +372,7 @@ def handle_info_request(instance, action, user, comment):
         
         # Update submission status
         instance.submission.status = 'pending_info'
-        instance.submission.save()
+        instance.submission.save(update_fields=['status'])
         
         return {
             'success': True,
@@ -240,23 +389,8 @@ def handle_info_request(instance, action, user, comment):
 def get_next_step(instance, action):
     """Get the next step in the workflow"""
     try:
-        current_step = instance.current_step
-        
-        # Check if action specifies next step
-        if action.next_step:
-            return action.next_step
-        
-        # Get next step by order
-        next_step = instance.workflow.steps.filter(
-            order__gt=current_step.order
-        ).order_by('order').first()
-        
-        # Check conditions for next step
-        if next_step and not evaluate_step_conditions(next_step, instance.submission):
-            # Find next eligible step
-            return get_next_eligible_step(instance.workflow, instance.submission, current_step.order)
-        
-        return next_step
+        graph = get_compiled_workflow(instance.workflow)
+        return graph.next_step(instance.current_step_id, action.id, instance.submission.data)
         
     except Exception as e:
         logger.error(f"Error getting next step: {str(e)}")
@@ -265,15 +399,8 @@ def get_next_step(instance, action):
 def get_next_eligible_step(workflow, submission, current_order):
     """Find the next eligible step based on conditions"""
     try:
-        steps = workflow.steps.filter(
-            order__gt=current_order
-        ).order_by('order')
-        
-        for step in steps:
-            if evaluate_step_conditions(step, submission):
-                return step
-        
-        return None
+        graph = get_compiled_workflow(workflow)
+        return graph.next_eligible_step(current_order, submission.data)
         
     except Exception as e:
         logger.error(f"Error finding next eligible step: {str(e)}")
@@ -281,112 +408,360 @@ def get_next_eligible_step(workflow, submission, current_order):
 
 def evaluate_step_conditions(step, submission):
     """Evaluate if step conditions are met"""
+    if hasattr(step, 'applies_to'):
+        return step.applies_to(submission.data)
+    return compile_condition(step.condition)(submission.data)
+
+def can_user_perform_action(user, step, action, instance=None):
+    """Check if user can perform the action on this step"""
     try:
-        if not step.condition:
+        # Superusers can perform any action
+        if user.is_superuser:
             return True
         
-        # Simple condition evaluation
-        # Can be enhanced to support complex conditions
-        condition = step.condition
+        # The instance's open work items decide, so delegation is honoured
+        if instance is not None:
+            open_items = list(instance.work_items.filter(status='open').values_list('assignee_type', 'assignee_id'))
+            if open_items:
+                return is_work_item_assignee(user, open_items)
         
-        if 'field' in condition and 'value' in condition:
-            field_name = condition['field']
-            expected_value = condition['value']
-            operator = condition.get('operator', 'equals')
-            
-            actual_value = submission.data.get(field_name)
-            
-            if operator == 'equals':
-                return str(actual_value) == str(expected_value)
-            elif operator == 'not_equals':
-                return str(actual_value) != str(expected_value)
-            elif operator == 'greater_than':
-                return float(actual_value) > float(expected_value)
-            elif operator == 'less_than':
-                return float(actual_value) < float(expected_value)
-            elif operator == 'contains':
-                return expected_value in str(actual_value)
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error evaluating step conditions: {str(e)}")
-        return True  # Default to allowing step
-
-def can_user_perform_action(user, step, action):
-    """Check if user can perform the action on this step"""
-    try:
         # Check if user is assigned to step
-        if step.assigned_to_user == user:
+        if step.assigned_to_user_id and step.assigned_to_user_id == user.id:
             return True
         
         # Check if user is in assigned group
-        if step.assigned_to_group and user.groups.filter(id=step.assigned_to_group.id).exists():
+        if step.assigned_to_group_id and user.groups.filter(id=step.assigned_to_group_id).exists():
             return True
         
         # Check if user has specific role
         if step.assigned_to_role and hasattr(user, 'role') and user.role == step.assigned_to_role:
             return True
         
-        # Superusers can perform any action
-        if user.is_superuser:
-            return True
-        
         return False
         
     except Exception as e:
         logger.error(f"Error checking user permissions: {str(e)}")
         return False
 
-def complete_workflow(instance, status):
+def user_can_act_on(user, instance):
+    """Whether the user may act on the current step of an instance"""
+    if not instance.is_active or not instance.current_step_id:
+        return False
+    return can_user_perform_action(user, instance.current_step, None, instance=instance)
+
+def is_work_item_assignee(user, assignees):
+    """Match (assignee_type, assignee_id) pairs against a user"""
+    group_ids = None
+    for assignee_type, assignee_id in assignees:
+        if assignee_type == 'user' and assignee_id == str(user.id):
+            return True
+        if assignee_type == 'role' and assignee_id == getattr(user, 'role', None):
+            return True
+        if assignee_type == 'group':
+            if group_ids is None:
+                group_ids = {str(group_id) for group_id in user.groups.values_list('id', flat=True)}
+            if assignee_id in group_ids:
+                return True
+    return False
+
+def inbox_filter(user):
+    """WorkItem filter for everything assigned to a user directly, by group or by role"""
+    assignees = Q(assignee_type='user', assignee_id=str(user.id))
+    
+    group_ids = [str(group_id) for group_id in user.groups.values_list('id', flat=True)]
+    if group_ids:
+        assignees |= Q(assignee_type='group', assignee_id__in=group_ids)
+    
+    if getattr(user, 'role', None):
+        assignees |= Q(assignee_type='role', assignee_id=user.role)
+    
+    return assignees
+
+def get_inbox(user):
+    """Open work items of a user; served by the wf_inbox_idx index"""
+    return WorkItem.objects.filter(inbox_filter(user), status='open')
+
+def open_work_items(instance, step):
+    """Create inbox entries for the assignees of the step an instance entered"""
+    items = []
+    if step.assigned_to_user_id:
+        items.append(('user', str(step.assigned_to_user_id)))
+    if step.assigned_to_group_id:
+        items.append(('group', str(step.assigned_to_group_id)))
+    if step.assigned_to_role:
+        items.append(('role', step.assigned_to_role))
+    
+    WorkItem.objects.bulk_create([
+        WorkItem(instance_id=instance.id, step_id=step.id, assignee_type=assignee_type, assignee_id=assignee_id)
+        for assignee_type, assignee_id in items
+    ])
+
+def close_work_items(instance, status='done'):
+    """Take the open inbox entries of an instance out of every inbox"""
+    WorkItem.objects.filter(instance_id=instance.id, status='open').update(
+        status=status,
+        completed_at=timezone.now()
+    )
+
+def delegate_work_items(instance, delegate_to):
+    """Hand the current step of one instance to another user"""
+    with transaction.atomic():
+        close_work_items(instance, status='delegated')
+        WorkItem.objects.create(
+            instance=instance,
+            step_id=instance.current_step_id,
+            assignee_type='user',
+            assignee_id=str(delegate_to.id)
+        )
+    
+    instance.submission.assigned_to = delegate_to
+    instance.submission.save(update_fields=['assigned_to'])
+
+def complete_workflow(instance, status, actor=None):
     """Complete a workflow instance"""
     try:
-        instance.is_active = False
-        instance.completed_at = timezone.now()
-        instance.current_step = None
-        instance.save()
+        previous_step_id = instance.current_step_id
+        previous_entered_at = instance.step_entered_at
+        completed_at = timezone.now()
+        apply_transition(
+            instance,
+            previous_step_id,
+            is_active=False,
+            completed_at=completed_at,
+            current_step_id=None,
+            auto_approve_due_at=None
+        )
+        if previous_step_id:
+            close_interval(instance, previous_step_id, previous_entered_at, completed_at, actor, status)
+        close_work_items(instance)
+        schedule_step_timers(instance, previous_step_id)
         
         # Update submission status
         instance.submission.status = status
-        instance.submission.save()
+        instance.submission.save(update_fields=['status'])
         
         # Send completion notification
         send_completion_notification(instance, status)
         
         logger.info(f"Workflow instance {instance.id} completed with status {status}")
         
+    except WorkflowConflict:
+        raise
     except Exception as e:
+        # Raised so the caller's transaction rolls the half-done transition back
         logger.error(f"Error completing workflow: {str(e)}")
+        raise
 
-def handle_auto_approval(instance, step):
-    """Handle automatic approval if conditions are met"""
+def apply_transition(instance, expected_step_id, **changes):
+    """
+    Write a transition with a compare-and-set on the instance version and step.
+    Raises WorkflowConflict when another transition got there first.
+    """
+    updated = WorkflowInstance.objects.filter(
+        id=instance.id,
+        version=instance.version,
+        current_step_id=expected_step_id
+    ).update(version=F('version') + 1, **changes)
+    
+    if not updated:
+        raise WorkflowConflict(f"Workflow instance {instance.id} changed concurrently")
+    
+    instance.version += 1
+    for field, value in changes.items():
+        setattr(instance, field, value)
+
+def enter_step(instance, step, actor=None):
+    """
+    Move an instance to a step (model or compiled) and stamp its deadline columns.
+    The interval of the previous step is closed as approved by actor.
+    """
+    previous_step_id = instance.current_step_id
+    previous_entered_at = instance.step_entered_at
+    entered_at = timezone.now()
+    apply_transition(
+        instance,
+        previous_step_id,
+        current_step_id=step.id,
+        step_entered_at=entered_at,
+        auto_approve_due_at=get_auto_approve_due_at(step, entered_at)
+    )
+    
+    if previous_step_id:
+        close_interval(instance, previous_step_id, previous_entered_at, entered_at, actor, 'approved')
+    open_interval(instance, step, entered_at)
+    
+    # Move the instance from the previous assignees' inboxes to the new ones
+    close_work_items(instance)
+    open_work_items(instance, step)
+    
+    # Votes from an earlier visit to a parallel step do not carry over
+    if step.step_type == 'parallel':
+        ApprovalVote.objects.filter(instance_id=instance.id, step_id=step.id).delete()
+    
+    schedule_step_timers(instance, previous_step_id, step)
+
+def get_auto_approve_due_at(step, entered_at):
+    """Deadline after which the auto_approve_workflows task approves the step"""
+    if not step.auto_approve_after:
+        return None
+    return entered_at + timedelta(hours=step.auto_approve_after)
+
+def schedule_step_timers(instance, previous_step_id=None, step=None):
+    """
+    Cancel the timers of the step the instance left and schedule those of its new
+    step, once the transition commits: a rolled back transition keeps its timers
+    """
+    instance_id, step_id = instance.id, instance.current_step_id
+    auto_approve_due_at = instance.auto_approve_due_at
+    reminder_due_at = None
+    if step_id and (step or instance.current_step).step_type in REMINDER_STEP_TYPES:
+        reminder_due_at = timezone.now() + timedelta(hours=settings.WORKFLOW_REMINDER_HOURS)
+    
+    def update_timers():
+        try:
+            timers = get_timer_service()
+            
+            if previous_step_id:
+                timers.cancel(instance_id, previous_step_id)
+            
+            if step_id:
+                if auto_approve_due_at:
+                    timers.schedule(instance_id, step_id, TIMER_AUTO_APPROVE, auto_approve_due_at)
+                if reminder_due_at:
+                    timers.schedule(instance_id, step_id, TIMER_REMINDER, reminder_due_at)
+                
+        except Exception as e:
+            # The periodic sweeps still pick up anything a lost timer misses
+            logger.error(f"Error scheduling timers for workflow instance {instance_id}: {str(e)}")
+    
+    transaction.on_commit(update_timers)
+
+def schedule_reminder(instance, step=None):
+    """Schedule the next reminder for the current step of an instance"""
+    step = step or instance.current_step
+    if step.step_type not in REMINDER_STEP_TYPES:
+        return
+    
+    get_timer_service().schedule(
+        instance.id,
+        instance.current_step_id,
+        TIMER_REMINDER,
+        timezone.now() + timedelta(hours=settings.WORKFLOW_REMINDER_HOURS)
+    )
+
+def auto_approve_instance(instance):
+    """Approve the current step of an instance on behalf of the system"""
+    step = instance.current_step
+    approve_action = step.actions.filter(action_type='approve').first() if step else None
+    
+    result = None
+    if approve_action:
+        data_before = copy.deepcopy(instance.submission.data)
+        try:
+            with transaction.atomic():
+                result = handle_approval(instance, approve_action, None, 'Auto-approved due to timeout')
+                if not result['success']:
+                    transaction.set_rollback(True)
+        except WorkflowConflict:
+            # Someone acted on the step in the meantime
+            return False
+        if result['success']:
+            record_history(
+                instance, step, approve_action, None, 'Auto-approved due to timeout',
+                data_before=data_before,
+                data_after=instance.submission.data
+            )
+            publish_workflow_activity(instance, step, approve_action, None)
+            return True
+    
+    # Drop the deadline so the instance is not picked up again
+    logger.warning(f"Could not auto-approve workflow instance {instance.id}: "
+                   f"{result['error'] if result else 'no approve action on step'}")
+    WorkflowInstance.objects.filter(id=instance.id).update(auto_approve_due_at=None)
+    return False
+
+# Activity feed
+ACTIVITY_VERBS = {
+    'approve': ('approved', 'check'),
+    'reject': ('rejected', 'x'),
+    'request_info': ('requested information on', 'question'),
+    'delegate': ('delegated', 'user'),
+}
+
+def publish_workflow_activity(instance, step, action, actor):
+    """
+    Feed entry for an action on an instance, for the actor, the submitter and
+    the assignees of the step the instance is now on
+    """
     try:
-        if not step.auto_approve_after:
-            return
-        
-        # Schedule auto-approval task
-        from .tasks import auto_approve_workflows
-        auto_approve_workflows.apply_async(
-            args=[instance.id],
-            countdown=step.auto_approve_after * 3600  # Convert hours to seconds
+        verb, icon = ACTIVITY_VERBS.get(action.action_type, (action.name.lower(), 'document'))
+        actor_name = actor.get_full_name() if actor else 'System'
+        
+        assignees = {'user': [], 'group': [], 'role': []}
+        for assignee_type, assignee_id in instance.work_items.filter(status='open').values_list(
+                'assignee_type', 'assignee_id'):
+            assignees[assignee_type].append(assignee_id)
+        
+        publish_activity(
+            'workflow',
+            title=f"{actor_name} {verb} {instance.submission.form.name}",
+            description=f"{instance.workflow.name}: {step.name}",
+            icon=icon,
+            link=f"/workflow/instance/{instance.id}/",
+            actor=actor,
+            user_ids=[actor.id if actor else None, instance.submission.submitted_by_id] + assignees['user'],
+            group_ids=assignees['group'],
+            roles=assignees['role']
         )
-        
     except Exception as e:
-        logger.error(f"Error setting up auto-approval: {str(e)}")
+        logger.error(f"Error publishing activity for workflow instance {instance.id}: {str(e)}")
 
 # Notification functions
+@contextmanager
+def deferred_notifications():
+    """
+    Collect the workflow notifications raised inside the block instead of sending them.
+    Yields the list of events; hand it to tasks.send_workflow_notifications.
+    """
+    events = []
+    _notification_buffer.events = events
+    try:
+        yield events
+    finally:
+        _notification_buffer.events = None
+
+def defer_notification(kind, *args):
+    """Buffer a notification event if deferral is active; returns whether it was buffered"""
+    events = getattr(_notification_buffer, 'events', None)
+    if events is None:
+        return False
+    events.append([kind, *args])
+    return True
+
+def send_notification_event(kind, instance_id, *args):
+    """Send a notification collected by deferred_notifications()"""
+    instance = WorkflowInstance.objects.select_related(
+        'submission', 'submission__form', 'submission__submitted_by'
+    ).get(id=instance_id)
+    
+    if kind == 'step':
+        send_step_notifications(instance, WorkflowStep.objects.get(id=args[0]))
+    elif kind == 'completion':
+        send_completion_notification(instance, args[0])
+    elif kind == 'rejection':
+        rejected_by = get_user_model().objects.filter(id=args[0]).first() if args[0] else None
+        send_rejection_notification(instance, rejected_by, args[1])
+    else:
+        logger.warning(f"Unknown workflow notification event {kind}")
+
 def send_step_notifications(instance, step):
     """Send notifications for a new workflow step"""
+    if defer_notification('step', instance.id, step.id):
+        return
+    
     try:
         # Get recipients
-        recipients = []
-        
-        if step.assigned_to_user:
-            recipients.append(step.assigned_to_user.email)
-        
-        if step.assigned_to_group:
-            group_emails = step.assigned_to_group.user_set.values_list('email', flat=True)
-            recipients.extend(group_emails)
+        recipients = get_step_recipients(step)
         
         if not recipients:
             return
@@ -404,23 +779,72 @@ def send_step_notifications(instance, step):
         html_message = render_to_string('emails/workflow_notification.html', context)
         plain_message = render_to_string('emails/workflow_notification.txt', context)
         
-        # Send email
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipients,
-            html_message=html_message,
-            fail_silently=True
-        )
+        # One message per approver, delivered as a batch over a single connection
+        connection = get_connection(fail_silently=True)
+        emails = []
+        for recipient in recipients:
+            email = EmailMultiAlternatives(
+                subject=subject,
+                body=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[recipient],
+                connection=connection
+            )
+            email.attach_alternative(html_message, 'text/html')
+            emails.append(email)
+        connection.send_messages(emails)
         
         logger.info(f"Step notification sent to {len(recipients)} recipients")
         
     except Exception as e:
         logger.error(f"Error sending step notifications: {str(e)}")
 
+def get_step_assignees(step):
+    """Users assigned to a step (model or compiled) directly, by group or by role"""
+    assignees = Q()
+    if step.assigned_to_user_id:
+        assignees |= Q(id=step.assigned_to_user_id)
+    if step.assigned_to_group_id:
+        assignees |= Q(groups__id=step.assigned_to_group_id)
+    if step.assigned_to_role:
+        assignees |= Q(role=step.assigned_to_role)
+    
+    if not assignees:
+        return get_user_model().objects.none()
+    
+    return get_user_model().objects.filter(assignees, is_active=True).distinct()
+
+def get_step_recipients(step):
+    """Email addresses of the users assigned to a step in one query"""
+    return list(get_step_assignees(step).exclude(email='').values_list('email', flat=True))
+
+def send_step_reminder(instance):
+    """Remind the assignees of the current step about a pending task"""
+    try:
+        recipients = get_step_recipients(instance.current_step)
+        
+        if recipients:
+            send_mail(
+                subject=f'Reminder: Pending approval for {instance.submission.form.name}',
+                message=f'You have a pending approval task for {instance.submission.form.name}',
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=recipients,
+                fail_silently=True
+            )
+        
+        instance.last_reminder_at = timezone.now()
+        WorkflowInstance.objects.filter(id=instance.id).update(last_reminder_at=instance.last_reminder_at)
+        return bool(recipients)
+        
+    except Exception as e:
+        logger.error(f"Error sending step reminder: {str(e)}")
+        return False
+
 def send_completion_notification(instance, status):
     """Send notification when workflow is completed"""
+    if defer_notification('completion', instance.id, status):
+        return
+    
     try:
         # Notify submitter
         context = {
@@ -476,6 +900,9 @@ def send_delegation_notification(instance, delegate_to, delegated_by, comment):
 
 def send_rejection_notification(instance, rejected_by, comment):
     """Send notification when request is rejected"""
+    if defer_notification('rejection', instance.id, str(rejected_by.id) if rejected_by else None, comment):
+        return
+    
     try:
         context = {
             'instance': instance,
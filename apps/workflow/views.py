@@ -8,13 +8,22 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.contrib import messages
 from django.db.models import Q, Count
-from django.core.paginator import Paginator
-from django.views.decorators.http import require_POST
+from apps.forms_builder.pagination import KeysetPaginator
+from apps.forms_builder.search import matching_submission_ids
+from apps.forms_builder.permissions import can_access_submission
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+import copy
 import json
 
 from .models import WorkflowTemplate, WorkflowInstance, WorkflowStep, WorkflowAction, WorkflowHistory
-from .utils import handle_workflow_action, get_next_step
+from .utils import (handle_workflow_action, get_next_step, get_inbox, user_can_act_on,
+                    deferred_notifications, publish_workflow_activity)
+from .history import build_history, record_history, get_history_data
+from .metrics import get_step_duration_stats
+from apps.forms_builder.activity import get_feed
+from .tasks import send_workflow_notifications
 from apps.forms_builder.models import FormSubmission
 
 @login_required
@@ -41,60 +50,108 @@ def workflow_detail(request, workflow_id):
     workflow = get_object_or_404(WorkflowTemplate, id=workflow_id)
     
     # Get workflow instances
-    instances = WorkflowInstance.objects.filter(workflow=workflow).order_by('-started_at')
+    instances = WorkflowInstance.objects.filter(workflow=workflow)
     
-    # Pagination
-    paginator = Paginator(instances, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (keyset on started_at, id)
+    paginator = KeysetPaginator(instances, 20, ordering=('-started_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'), with_estimate=True)
     
     context = {
         'workflow': workflow,
         'page_obj': page_obj,
+        'step_durations': get_step_duration_stats(workflow),
         'title': f'Workflow: {workflow.name}'
     }
     return render(request, 'workflow/workflow_detail.html', context)
 
+@login_required
+def workflow_step_metrics(request, workflow_id):
+    """Step duration percentiles (seconds) of a workflow"""
+    workflow = get_object_or_404(WorkflowTemplate, id=workflow_id)
+    
+    return JsonResponse({
+        'success': True,
+        'workflow_id': workflow.id,
+        'steps': get_step_duration_stats(workflow)
+    })
+
 @login_required
 def workflow_instance_detail(request, instance_id):
     """Display workflow instance details with history"""
-    instance = get_object_or_404(WorkflowInstance, id=instance_id)
+    instance = get_object_or_404(
+        WorkflowInstance.objects.select_related(
+            'workflow', 'current_step', 'submission', 'submission__form', 'submission__submitted_by'
+        ),
+        id=instance_id
+    )
     
     # Check permissions
-    if not (request.user == instance.submission.submitted_by or 
-            request.user == instance.current_step.assigned_to_user or
-            request.user.groups.filter(id=instance.current_step.assigned_to_group_id).exists() or
-            request.user.is_superuser):
+    can_act = user_can_act_on(request.user, instance)
+    if not (request.user == instance.submission.submitted_by or can_act or request.user.is_superuser):
         messages.error(request, 'You do not have permission to view this workflow.')
         return redirect('workflow_list')
     
     # Get workflow history
-    history = instance.history.all().order_by('-timestamp')
+    history = instance.history.select_related('step', 'action', 'actor').order_by('-timestamp')
+    
+    # Step timeline (one query)
+    timeline = instance.intervals.select_related('step', 'actor').order_by('entered_at', 'id')
     
     # Get available actions for current user
     available_actions = []
-    if instance.is_active and instance.current_step:
-        if (request.user == instance.current_step.assigned_to_user or
-            request.user.groups.filter(id=instance.current_step.assigned_to_group_id).exists()):
-            available_actions = instance.current_step.actions.all()
+    if can_act:
+        available_actions = instance.current_step.actions.all()
     
     context = {
         'instance': instance,
         'history': history,
+        'timeline': timeline,
         'available_actions': available_actions,
         'title': f'Workflow Instance: {instance.workflow.name}'
     }
     return render(request, 'workflow/workflow_instance_detail.html', context)
 
+@login_required
+@require_GET
+def workflow_history_data(request, history_id):
+    """Submission data as it was before and after a history entry"""
+    entry = get_object_or_404(
+        WorkflowHistory.objects.select_related('instance__submission'), id=history_id
+    )
+    instance = entry.instance
+
+    if not can_access_submission(request.user, instance.submission):
+        return JsonResponse({
+            'success': False,
+            'error': 'You do not have permission to view this workflow.'
+        }, status=403)
+
+    data_before, data_after = get_history_data(entry)
+
+    return JsonResponse({
+        'success': True,
+        'history_id': entry.id,
+        'timestamp': entry.timestamp.isoformat(),
+        'data_before': data_before,
+        'data_after': data_after,
+        'changes': entry.data_patch if entry.data_after is None else []
+    })
+
 @login_required
 @require_POST
 def workflow_action(request, instance_id):
     """Handle workflow actions (approve, reject, etc.)"""
     instance = get_object_or_404(WorkflowInstance, id=instance_id)
     
+    if not instance.is_active or not instance.current_step:
+        return JsonResponse({
+            'success': False,
+            'conflict': True,
+            'error': 'This workflow is no longer awaiting action.'
+        }, status=409)
+    
     # Check permissions
-    if not (request.user == instance.current_step.assigned_to_user or
-            request.user.groups.filter(id=instance.current_step.assigned_to_group_id).exists()):
+    if not user_can_act_on(request.user, instance):
         return JsonResponse({
             'success': False,
             'error': 'You do not have permission to perform this action.'
@@ -115,36 +172,27 @@ def workflow_action(request, instance_id):
             delegate_to = get_object_or_404(User, id=delegate_to_id)
         
         # Process the workflow action
-        result = handle_workflow_action(
-            instance=instance,
-            action=action,
-            user=request.user,
-            comment=comment,
-            delegate_to=delegate_to
-        )
-        
-        if result['success']:
-            # Log the action
-            WorkflowHistory.objects.create(
+        acted_step = instance.current_step
+        data_before = copy.deepcopy(instance.submission.data)
+        with transaction.atomic():
+            result = handle_workflow_action(
                 instance=instance,
-                step=instance.current_step,
                 action=action,
-                actor=request.user,
+                user=request.user,
                 comment=comment,
-                data_before=instance.submission.data,
-                data_after=instance.submission.data  # Could be modified by workflow
+                delegate_to=delegate_to
             )
             
-            # Update submission status if needed
-            if action.action_type == 'approve':
-                instance.submission.status = 'approved'
-            elif action.action_type == 'reject':
-                instance.submission.status = 'rejected'
-            elif action.action_type == 'request_info':
-                instance.submission.status = 'pending_info'
-            
-            instance.submission.save()
-            
+            if result['success']:
+                # Log the action with the transition it records
+                record_history(
+                    instance, acted_step, action, request.user, comment,
+                    data_before=data_before,
+                    data_after=instance.submission.data  # Could be modified by workflow
+                )
+                publish_workflow_activity(instance, acted_step, action, request.user)
+        
+        if result['success']:
             messages.success(request, f'Action "{action.name}" completed successfully.')
             
             return JsonResponse({
@@ -155,8 +203,9 @@ def workflow_action(request, instance_id):
         else:
             return JsonResponse({
                 'success': False,
+                'conflict': result.get('conflict', False),
                 'error': result.get('error', 'Action failed')
-            }, status=400)
+            }, status=409 if result.get('conflict') else 400)
             
     except json.JSONDecodeError:
         return JsonResponse({
@@ -169,22 +218,125 @@ def workflow_action(request, instance_id):
             'error': str(e)
         }, status=500)
 
+BULK_ACTION_MAX_INSTANCES = 500
+BULK_ACTION_BATCH_SIZE = 50
+
+@login_required
+@require_POST
+def bulk_workflow_action(request):
+    """Approve or reject many workflow instances in one request"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    
+    action_type = data.get('action')
+    comment = data.get('comment', '')
+    instance_ids = data.get('instance_ids') or []
+    
+    if action_type not in ('approve', 'reject'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Action must be "approve" or "reject"'
+        }, status=400)
+    
+    try:
+        if not isinstance(instance_ids, list) or len(instance_ids) > BULK_ACTION_MAX_INSTANCES:
+            raise ValueError
+        instance_ids = list(dict.fromkeys(int(instance_id) for instance_id in instance_ids))
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'error': f'Provide a list of at most {BULK_ACTION_MAX_INSTANCES} instance ids'
+        }, status=400)
+    
+    # Permissions for every instance in one query against the inbox
+    instances = WorkflowInstance.objects.filter(
+        id__in=instance_ids,
+        is_active=True
+    ).select_related('workflow', 'submission', 'submission__form', 'current_step')
+    if not request.user.is_superuser:
+        instances = instances.filter(id__in=get_inbox(request.user).values('instance_id'))
+    instances = {instance.id: instance for instance in instances}
+    
+    # The matching action of every current step in one query
+    actions = {}
+    for action in WorkflowAction.objects.filter(
+        step_id__in={instance.current_step_id for instance in instances.values()},
+        action_type=action_type
+    ).order_by('id'):
+        actions.setdefault(action.step_id, action)
+    
+    results = {}
+    pending_ids = []
+    for instance_id in instance_ids:
+        instance = instances.get(instance_id)
+        if not instance:
+            results[instance_id] = {'success': False, 'error': 'Not found or not assigned to you'}
+        elif instance.current_step_id not in actions:
+            results[instance_id] = {'success': False, 'error': f'Current step has no {action_type} action'}
+        else:
+            pending_ids.append(instance_id)
+    
+    for start in range(0, len(pending_ids), BULK_ACTION_BATCH_SIZE):
+        batch = pending_ids[start:start + BULK_ACTION_BATCH_SIZE]
+        
+        with transaction.atomic(), deferred_notifications() as notifications:
+            history = []
+            for instance_id in batch:
+                instance = instances[instance_id]
+                acted_step = instance.current_step
+                action = actions[acted_step.id]
+                data_before = copy.deepcopy(instance.submission.data)
+                
+                with transaction.atomic():
+                    result = handle_workflow_action(
+                        instance=instance,
+                        action=action,
+                        user=request.user,
+                        comment=comment,
+                        check_permissions=False
+                    )
+                results[instance_id] = result
+                
+                if result['success']:
+                    history.append(build_history(
+                        instance, acted_step, action, request.user, comment,
+                        data_before=data_before,
+                        data_after=instance.submission.data
+                    ))
+                    publish_workflow_activity(instance, acted_step, action, request.user)
+            
+            WorkflowHistory.objects.bulk_create(history)
+            
+            if notifications:
+                events = list(notifications)
+                transaction.on_commit(lambda events=events: send_workflow_notifications.delay(events))
+    
+    outcomes = [dict(results[instance_id], instance_id=instance_id) for instance_id in instance_ids]
+    succeeded = sum(1 for outcome in outcomes if outcome['success'])
+    
+    return JsonResponse({
+        'success': True,
+        'succeeded': succeeded,
+        'failed': len(outcomes) - succeeded,
+        'results': outcomes
+    })
+
 @login_required
 def approval_dashboard(request):
     """Dashboard for approval management"""
     user = request.user
     
-    # Get pending approvals assigned to user
-    pending_approvals = WorkflowInstance.objects.filter(
-        is_active=True,
-        current_step__assigned_to_user=user
-    ).count()
-    
-    # Get pending approvals for user's groups
-    group_approvals = WorkflowInstance.objects.filter(
-        is_active=True,
-        current_step__assigned_to_group__in=user.groups.all()
-    ).count()
+    # Pending approvals in the user's inbox, split by how they were assigned
+    inbox_counts = dict(
+        get_inbox(user).values_list('assignee_type').annotate(count=Count('id')).order_by()
+    )
+    pending_approvals = inbox_counts.get('user', 0)
+    group_approvals = inbox_counts.get('group', 0) + inbox_counts.get('role', 0)
     
     # Get completed approvals by user in last 30 days
     from datetime import datetime, timedelta
@@ -196,14 +348,8 @@ def approval_dashboard(request):
         action__action_type__in=['approve', 'reject']
     ).count()
     
-    # Get recent activity
-    recent_activity = WorkflowHistory.objects.filter(
-        Q(actor=user) | 
-        Q(instance__current_step__assigned_to_user=user) |
-        Q(instance__current_step__assigned_to_group__in=user.groups.all())
-    ).select_related(
-        'instance', 'step', 'action', 'actor'
-    ).order_by('-timestamp')[:10]
+    # Get recent activity from the user's precomputed feed
+    recent_activity = get_feed(user, limit=10, activity_type='workflow')
     
     context = {
         'pending_approvals': pending_approvals,
@@ -224,12 +370,9 @@ def pending_approvals(request):
     """List of pending approvals for the user"""
     user = request.user
     
-    # Get pending instances assigned to user or user's groups
+    # Get pending instances from the user's inbox (user, group and role assignments)
     instances = WorkflowInstance.objects.filter(
-        is_active=True
-    ).filter(
-        Q(current_step__assigned_to_user=user) |
-        Q(current_step__assigned_to_group__in=user.groups.all())
+        id__in=get_inbox(user).values('instance_id')
     ).select_related(
         'workflow', 'submission', 'submission__form', 'submission__submitted_by', 'current_step'
     ).order_by('-started_at')
@@ -244,20 +387,23 @@ def pending_approvals(request):
     if workflow_filter:
         instances = instances.filter(workflow_id=workflow_filter)
     
-    # Search
+    # Search: form and submitter names, or every word in the answers (full-text index)
     search = request.GET.get('search', '')
     if search:
-        instances = instances.filter(
+        matches = (
             Q(submission__form__name__icontains=search) |
             Q(submission__submitted_by__first_name__icontains=search) |
             Q(submission__submitted_by__last_name__icontains=search) |
             Q(submission__submitted_by__email__icontains=search)
         )
+        answer_matches = matching_submission_ids(search)
+        if answer_matches is not None:
+            matches |= Q(submission_id__in=answer_matches)
+        instances = instances.filter(matches)
     
-    # Pagination
-    paginator = Paginator(instances, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (keyset on started_at, id)
+    paginator = KeysetPaginator(instances, 20, ordering=('-started_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Get workflows for filter dropdown
     workflows = WorkflowTemplate.objects.filter(is_active=True)
@@ -298,10 +444,9 @@ def approval_history(request):
         start_date = datetime.now() - timedelta(days=days)
         history = history.filter(timestamp__gte=start_date)
     
-    # Pagination
-    paginator = Paginator(history, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (keyset on timestamp, id)
+    paginator = KeysetPaginator(history, 25, ordering=('-timestamp', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
@@ -1,6 +1,7 @@
 # dynamic_forms_project/celery.py
 import os
 from celery import Celery
+from kombu import Exchange, Queue
 from django.conf import settings
 
 # Set the default Django settings module
@@ -15,16 +16,158 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load tasks from all registered Django apps
 app.autodiscover_tasks()
 
+# Queues: time-critical workflow and notification work never waits behind uploads,
+# reports or maintenance. Within a queue priority 0 is served first and 9 last: the
+# Redis transport pops the priority_steps lists in ascending order.
+TASK_QUEUES = ['workflow', 'notifications', 'files', 'reports', 'maintenance']
+
+app.conf.task_queues = [Queue(name, Exchange(name), routing_key=name) for name in TASK_QUEUES]
+app.conf.task_default_queue = 'workflow'
+app.conf.task_default_priority = 5
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+app.conf.task_routes = {
+    # Workflow engine
+    'apps.workflow.tasks.poll_workflow_timers': {'queue': 'workflow', 'priority': 1},
+    'apps.workflow.tasks.notification_latency_probe': {'queue': 'notifications', 'priority': 0},
+    # Notifications
+    'apps.workflow.tasks.send_workflow_notifications': {'queue': 'notifications', 'priority': 0},
+    'apps.forms_builder.tasks.send_submission_notification': {'queue': 'notifications', 'priority': 2},
+    'apps.forms_builder.tasks.fan_out_activity': {'queue': 'notifications', 'priority': 8},
+    # Long-running work
+    'apps.forms_builder.tasks.process_file_upload': {'queue': 'files'},
+    'apps.forms_builder.tasks.purge_upload_sessions': {'queue': 'files'},
+    'apps.forms_builder.tasks.collect_blob_garbage': {'queue': 'files'},
+    'apps.forms_builder.tasks.queue_pending_file_processing': {'queue': 'files'},
+    'apps.forms_builder.tasks.generate_analytics_report': {'queue': 'reports'},
+    'apps.workflow.tasks.heavy_export_probe': {'queue': 'reports'},
+    'apps.forms_builder.tasks.cleanup_old_submissions': {'queue': 'maintenance'},
+    'apps.forms_builder.tasks.purge_idempotency_keys': {'queue': 'maintenance'},
+    'apps.forms_builder.tasks.archive_submissions': {'queue': 'maintenance'},
+    'apps.forms_builder.tasks.maintain_partitions': {'queue': 'maintenance'},
+    'apps.forms_builder.tasks.backfill_field_values': {'queue': 'maintenance'},
+    'apps.workflow.tasks.run_sharded_scan': {'queue': 'maintenance'},
+    'apps.workflow.tasks.run_scan_shard': {'queue': 'maintenance'},
+    'apps.workflow.tasks.send_reminder_emails': {'queue': 'maintenance'},
+    'apps.workflow.tasks.auto_approve_workflows': {'queue': 'maintenance'},
+    # Everything else (exact names above take precedence)
+    'apps.workflow.tasks.*': {'queue': 'workflow'},
+}
+
+# Worker layouts, one worker per profile. deploy.sh builds its worker commands from
+# these (python -m dynamic_forms_project.celery workers|nodes|multi):
+#   celery -A dynamic_forms_project worker -n <name>@%h -Q <queues> -P <pool> -c <concurrency> \
+#       --prefetch-multiplier <prefetch_multiplier>
+# Short tasks prefetch a few messages per process; long tasks prefetch one so a busy
+# process never sits on queued work, and acknowledge late (see acks_late on the tasks)
+# so a crashed worker's task is redelivered.
+WORKER_PROFILES = {
+    'workflow': {
+        'queues': ['workflow'],
+        'pool': 'prefork',
+        'concurrency': 8,
+        'prefetch_multiplier': 4,
+    },
+    'notifications': {
+        'queues': ['notifications'],
+        'pool': 'threads',  # I/O bound (SMTP)
+        'concurrency': 16,
+        'prefetch_multiplier': 4,
+    },
+    'files': {
+        'queues': ['files'],
+        'pool': 'threads',  # Tasks fan CPU work out to their own process pool
+        'concurrency': 2,
+        'prefetch_multiplier': 1,
+    },
+    'reports': {
+        'queues': ['reports'],
+        'pool': 'prefork',
+        'concurrency': 2,
+        'prefetch_multiplier': 1,
+    },
+    'maintenance': {
+        'queues': ['maintenance'],
+        'pool': 'prefork',
+        'concurrency': 4,
+        'prefetch_multiplier': 1,
+    },
+}
+
+
+def worker_argv(profile):
+    """Command line arguments for a worker running one of WORKER_PROFILES"""
+    options = WORKER_PROFILES[profile]
+    return [
+        'worker',
+        '-n', f'{profile}@%h',
+        '-Q', ','.join(options['queues']),
+        '-P', options['pool'],
+        '-c', str(options['concurrency']),
+        '--prefetch-multiplier', str(options['prefetch_multiplier']),
+    ]
+
+
+def multi_argv():
+    """Node names and per-node options for `celery multi` running every profile"""
+    argv = list(WORKER_PROFILES) + ['-A', 'dynamic_forms_project']
+    for profile, options in WORKER_PROFILES.items():
+        argv += [
+            f'-Q:{profile}', ','.join(options['queues']),
+            f'-P:{profile}', options['pool'],
+            f'-c:{profile}', str(options['concurrency']),
+            f'--prefetch-multiplier:{profile}', str(options['prefetch_multiplier']),
+        ]
+    return argv
+
 # Celery Beat Schedule (for periodic tasks)
 app.conf.beat_schedule = {
     'cleanup-old-submissions': {
         'task': 'apps.forms_builder.tasks.cleanup_old_submissions',
         'schedule': 86400.0,  # Run daily
     },
-    'send-reminder-emails': {
-        'task': 'apps.workflow.tasks.send_reminder_emails',
+    'archive-submissions': {
+        'task': 'apps.forms_builder.tasks.archive_submissions',
+        'schedule': 3600.0,  # Run hourly, ARCHIVE_MAX_BATCHES per run from the watermark
+    },
+    'maintain-partitions': {
+        'task': 'apps.forms_builder.tasks.maintain_partitions',
+        'schedule': 86400.0,  # Run daily; months ahead are added well before they are needed
+    },
+    'purge-idempotency-keys': {
+        'task': 'apps.forms_builder.tasks.purge_idempotency_keys',
+        'schedule': 86400.0,  # Run daily
+    },
+    'purge-upload-sessions': {
+        'task': 'apps.forms_builder.tasks.purge_upload_sessions',
         'schedule': 3600.0,  # Run hourly
     },
+    'queue-pending-file-processing': {
+        'task': 'apps.forms_builder.tasks.queue_pending_file_processing',
+        'schedule': 3600.0,  # Run hourly, catches lost processing tasks
+    },
+    'collect-blob-garbage': {
+        'task': 'apps.forms_builder.tasks.collect_blob_garbage',
+        'schedule': 86400.0,  # Run daily
+    },
+    'send-reminder-emails': {
+        'task': 'apps.workflow.tasks.run_sharded_scan',
+        'schedule': 3600.0,  # Run hourly, catches lost timers
+        'args': ('reminders',),
+    },
+    'auto-approve-workflows': {
+        'task': 'apps.workflow.tasks.run_sharded_scan',
+        'schedule': 900.0,  # Run every 15 minutes, catches lost timers
+        'args': ('auto_approve',),
+    },
+    'poll-workflow-timers': {
+        'task': 'apps.workflow.tasks.poll_workflow_timers',
+        'schedule': 10.0,  # Run every 10 seconds
+    },
     'generate-analytics-report': {
         'task': 'apps.forms_builder.tasks.generate_analytics_report',
         'schedule': 604800.0,  # Run weekly
@@ -33,4 +176,20 @@ app.conf.beat_schedule = {
 
 @app.task(bind=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
+
+
+if __name__ == '__main__':
+    import shlex
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'workers'
+    if command == 'workers':
+        for profile in WORKER_PROFILES:
+            print(shlex.join(worker_argv(profile)))
+    elif command == 'nodes':
+        print(' '.join(WORKER_PROFILES))
+    elif command == 'multi':
+        print(shlex.join(multi_argv()))
+    else:
+        sys.exit(f'Unknown command {command}: expected workers, nodes or multi')
\ No newline at end of file
@@ -1,5 +1,6 @@
 # dynamic_forms_project/context_processors.py
 from apps.forms_builder.models import FormTemplate
+from apps.workflow.utils import get_inbox
 
 def global_settings(request):
     """Add global settings to all templates"""
@@ -11,7 +12,7 @@ def global_settings(request):
     if request.user.is_authenticated:
         context.update({
             'user_forms_count': FormTemplate.objects.filter(created_by=request.user).count(),
-            'pending_approvals': request.user.assigned_submissions.filter(status='pending').count(),
+            'pending_approvals': get_inbox(request.user).values('instance_id').distinct().count(),
         })
     
     return context
\ No newline at end of file
@@ -104,8 +104,10 @@ if command -v redis-cli &> /dev/null; then
         pkill -f "celery worker" || true
         pkill -f "celery beat" || true
         
-        # Start Celery worker in background
-        nohup celery -A dynamic_forms_project worker --loglevel=info &
+        # Start one Celery worker per queue profile in background (see WORKER_PROFILES in celery.py)
+        python -m dynamic_forms_project.celery workers | while read -r worker_args; do
+            nohup celery -A dynamic_forms_project $worker_args --loglevel=info &
+        done
         
         # Start Celery beat scheduler in background
         nohup celery -A dynamic_forms_project beat --loglevel=info &
@@ -165,7 +167,9 @@ SocketUser=www-data
 WantedBy=sockets.target
 EOF
 
-    # Celery worker service
+    # Celery worker service: one node per queue profile (see WORKER_PROFILES in celery.py)
+    CELERY_NODES=$(python -m dynamic_forms_project.celery nodes)
+    CELERY_MULTI_ARGS=$(python -m dynamic_forms_project.celery multi)
     cat > /etc/systemd/system/dynamic-forms-celery.service << EOF
 [Unit]
 Description=Dynamic Forms Celery Worker
@@ -177,9 +181,9 @@ User=$USER
 Group=$USER
 EnvironmentFile=$PROJECT_DIR/.env
 WorkingDirectory=$PROJECT_DIR
-ExecStart=$PROJECT_DIR/venv/bin/celery multi start worker1 -A dynamic_forms_project --pidfile=/var/run/celery/%n.pid --logfile=/var/log/celery/%n%I.log --loglevel=INFO
-ExecStop=$PROJECT_DIR/venv/bin/celery multi stopwait worker1 --pidfile=/var/run/celery/%n.pid
-ExecReload=$PROJECT_DIR/venv/bin/celery multi restart worker1 -A dynamic_forms_project --pidfile=/var/run/celery/%n.pid --logfile=/var/log/celery/%n%I.log --loglevel=INFO
+ExecStart=$PROJECT_DIR/venv/bin/celery multi start $CELERY_MULTI_ARGS --pidfile=/var/run/celery/%n.pid --logfile=/var/log/celery/%n%I.log --loglevel=INFO
+ExecStop=$PROJECT_DIR/venv/bin/celery multi stopwait $CELERY_NODES --pidfile=/var/run/celery/%n.pid
+ExecReload=$PROJECT_DIR/venv/bin/celery multi restart $CELERY_MULTI_ARGS --pidfile=/var/run/celery/%n.pid --logfile=/var/log/celery/%n%I.log --loglevel=INFO
 Restart=always
 
 [Install]
@@ -246,12 +250,36 @@ server {
         add_header Cache-Control "public, immutable";
     }
     
-    location /media/ {
+    # Only avatars are public; form files go through the permission-checked download view
+    location /media/avatars/ {
         root $PROJECT_DIR;
         expires 30d;
         add_header Cache-Control "public";
     }
     
+    location /media/ {
+        return 404;
+    }
+    
+    # Target of X-Accel-Redirect from the download view (FILE_SERVE_INTERNAL_PREFIX)
+    location /protected-media/ {
+        internal;
+        alias $PROJECT_DIR/media/;
+    }
+    
+    # Chunked uploads stream straight through to the app instead of being spooled by nginx
+    location /forms/api/uploads/ {
+        client_max_body_size 16M;
+        proxy_request_buffering off;
+        proxy_read_timeout 300s;
+        include proxy_params;
+        proxy_pass http://unix:/run/gunicorn/dynamic-forms.sock;
+        proxy_set_header Host \$http_host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+    }
+    
     location / {
         include proxy_params;
         proxy_pass http://unix:/run/gunicorn/dynamic-forms.sock;
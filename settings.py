@@ -104,6 +104,53 @@ MEDIA_ROOT = BASE_DIR / 'media'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Chunked uploads (larger files go through /forms/api/uploads/ instead of multipart)
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'tmp' / 'chunked_uploads'
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB, advertised to clients
+CHUNKED_UPLOAD_MAX_SIZE = 5 * 1024 * 1024 * 1024  # 5GB
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24  # Unfinished sessions are purged after this long idle
+CHUNKED_UPLOAD_LOCK_SECONDS = 600  # One chunk write at a time per session
+FILE_BLOB_GC_GRACE_HOURS = 24  # Unreferenced blobs are kept this long before removal
+
+# cleanup_old_submissions: drafts are deleted in short transactions, pausing between batches
+DRAFT_RETENTION_DAYS = 30
+SUBMISSION_CLEANUP_BATCH_SIZE = 200
+SUBMISSION_CLEANUP_PAUSE_SECONDS = 0.5
+
+# archive_submissions: finished submissions move to ArchivedSubmission (zlib-compressed JSON)
+ARCHIVE_STATUSES = ['approved', 'rejected', 'completed']
+ARCHIVE_AFTER_DAYS = 365  # Since the workflow completed, or since submission without one
+ARCHIVE_BATCH_SIZE = 100  # Submissions moved per transaction
+ARCHIVE_MAX_BATCHES = 50  # Per run; the next run resumes at the watermark
+ARCHIVE_COMPRESSION_LEVEL = 6
+
+# Monthly range partitions (manage_partitions): FormSubmission.submitted_at, WorkflowHistory.timestamp
+PARTITION_MONTHS_AHEAD = 3  # Future months kept ready so rows never land in the MAXVALUE partition
+PARTITION_RETENTION_MONTHS = 36  # Older partitions are dropped once empty (archive_submissions empties them)
+
+# Image derivatives rendered by process_file_upload (EXIF is not copied)
+FILE_DERIVATIVES = {
+    'thumbnail': {'max_size': (320, 320), 'quality': 80},
+    'web': {'max_size': (1600, 1600), 'quality': 82},
+}
+FILE_PROCESSING_WORKERS = 4  # Processes per "files" worker; 0 renders inline
+FILE_PROCESSING_BATCH_SIZE = 20  # Files per task when sweeping unprocessed files
+
+# Form files are served by a permission-checked view. 'nginx' (X-Accel-Redirect) or
+# 'apache' (X-Sendfile) hand the transfer to the front-end server; 'django' streams it.
+FILE_SERVE_BACKEND = 'django' if DEBUG else 'nginx'
+FILE_SERVE_INTERNAL_PREFIX = '/protected-media/'  # nginx internal location aliasing MEDIA_ROOT
+
+# data: URLs at least this long in submission data are stored as files and replaced by references
+SUBMISSION_INLINE_PAYLOAD_MIN_LENGTH = 1024
+
+# Full-text search over text, textarea and richtext answers (forms_builder/search.py)
+SEARCH_MAX_TERMS = 8  # Further query words are ignored
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_MAX_RESULTS = 100
+SEARCH_SNIPPET_LENGTH = 160  # Characters of context per highlighted answer
+SEARCH_STATS_TIMEOUT = 600  # Seconds document counts used for ranking are cached
+
 # Security Settings (for production)
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
@@ -122,6 +169,35 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
+# Workflow timers (auto-approval, reminders, escalations)
+WORKFLOW_TIMER_BACKEND = os.getenv('WORKFLOW_TIMER_BACKEND', 'redis')  # 'redis' or 'memory'
+WORKFLOW_TIMER_KEY = 'workflow:timers'
+WORKFLOW_REMINDER_HOURS = int(os.getenv('WORKFLOW_REMINDER_HOURS', '24'))
+WORKFLOW_HISTORY_SNAPSHOT_INTERVAL = 20  # History entries between full data snapshots
+
+# Periodic workflow scans run as id-range shards under leases
+WORKFLOW_LEASE_BACKEND = os.getenv('WORKFLOW_LEASE_BACKEND', WORKFLOW_TIMER_BACKEND)  # 'redis' or 'memory'
+WORKFLOW_SCAN_SHARDS = int(os.getenv('WORKFLOW_SCAN_SHARDS', '8'))
+WORKFLOW_SCAN_SHARD_LEASE_SECONDS = 600  # Extended after every batch while a shard runs
+WORKFLOW_SCAN_COORDINATOR_LEASE_SECONDS = 60  # Drops duplicate beat triggers
+
+# Idempotent form submission (Idempotency-Key header)
+IDEMPOTENCY_CACHE_SECONDS = 86400  # Replay responses from Redis for a day
+IDEMPOTENCY_KEY_RETENTION_DAYS = 7  # Then from the database until purged
+IDEMPOTENCY_LOCK_SECONDS = 30
+IDEMPOTENCY_WAIT_SECONDS = 5  # How long a concurrent duplicate waits for the first response
+
+# Activity feeds
+ACTIVITY_FEED_MAX_ENTRIES = 200  # Entries kept per feed
+ACTIVITY_FEED_FANOUT_LIMIT = 500  # Larger groups and roles are pulled on read instead of fanned out
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
@@ -143,7 +219,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.forms_builder.pagination.KeysetPagination',
     'PAGE_SIZE': 20
 }
 
@@ -3,6 +3,10 @@
 // PURPOSE: Enhanced dynamic forms handling with advanced features
 //
 
+// Files above this size are sent as resumable chunked uploads rather than inline
+const CHUNKED_UPLOAD_THRESHOLD = 5 * 1024 * 1024;
+const CHUNKED_UPLOAD_RETRIES = 5;
+
 class DynamicFormsManager {
     constructor() {
         this.formData = {};
@@ -517,7 +521,7 @@ class DynamicFormsManager {
         document.querySelectorAll('.file-upload-field').forEach(field => {
             const dropZone = field.closest('.file-drop-zone');
             const preview = document.getElementById(`preview_${field.name}`);
-            const maxSize = parseInt(field.dataset.maxSize) || 10485760; // 10MB default
+            const maxSize = parseInt(field.dataset.maxSize) || 5368709120; // 5GB default (CHUNKED_UPLOAD_MAX_SIZE)
             const acceptedTypes = field.dataset.accept?.split(',') || [];
 
             if (!dropZone) return;
@@ -990,6 +994,17 @@ class DynamicFormsManager {
             // Prepare form data
             const formData = new FormData(form);
             
+            // Send large files ahead in resumable chunks; the submission carries their upload ids
+            if (form.dataset.uploadUrl) {
+                for (const field of form.querySelectorAll('.file-upload-field')) {
+                    const file = field.files && field.files[0];
+                    if (file && file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                        const uploadId = await this.uploadInChunks(form, field, file);
+                        formData.set(field.name, uploadId);
+                    }
+                }
+            }
+            
             // Add lookup field selected IDs
             document.querySelectorAll('.lookup-field[data-selected-id]').forEach(field => {
                 formData.append(`${field.name}_id`, field.dataset.selectedId);
@@ -1078,6 +1093,67 @@ class DynamicFormsManager {
         }
     }
 
+    async uploadInChunks(form, field, file) {
+        const headers = { 'X-CSRFToken': this.getCsrfToken() };
+        
+        let response = await fetch(form.dataset.uploadUrl, {
+            method: 'POST',
+            headers: { ...headers, 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                form: form.dataset.formId,
+                field_name: field.name,
+                filename: file.name,
+                size: file.size,
+                content_type: file.type
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`Could not start upload of ${file.name}`);
+        }
+        const upload = await response.json();
+        
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            try {
+                response = await fetch(upload.url, {
+                    method: 'PUT',
+                    headers: { ...headers, 'Upload-Offset': String(offset) },
+                    body: chunk
+                });
+            } catch (error) {
+                response = null;
+            }
+            
+            if (response && (response.ok || response.status === 409)) {
+                const serverOffset = response.headers.get('Upload-Offset');
+                if (serverOffset !== null) {
+                    offset = parseInt(serverOffset);
+                    failures = 0;
+                    this.showNotification(`Uploading ${file.name}: ${Math.floor(offset * 100 / file.size)}%`, 'info');
+                    continue;
+                }
+            }
+            
+            // Dropped connection: ask the server how far it got and resume from there
+            if (++failures > CHUNKED_UPLOAD_RETRIES) {
+                throw new Error(`Upload of ${file.name} failed`);
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const status = await fetch(upload.url, { method: 'HEAD', headers }).catch(() => null);
+            if (status && status.ok) {
+                offset = parseInt(status.headers.get('Upload-Offset'));
+            }
+        }
+        
+        response = await fetch(`${upload.url}finalize/`, { method: 'POST', headers });
+        if (!response.ok) {
+            throw new Error(`Could not finalize upload of ${file.name}`);
+        }
+        return upload.id;
+    }
+
     getCsrfToken() {
         return document.querySelector('[name=csrfmiddlewaretoken]')?.value || '';
     }